@@ -11,6 +11,130 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 if not OPENAI_API_KEY and ENVIRONMENT == "production":
     print("⚠️  WARNING: OPENAI_API_KEY not set")
 
+# Point the OpenAI client at another OpenAI-compatible server (e.g. loadtest/openai_stub.py)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# Models that accept response_format={"type": "json_object"}
+OPENAI_JSON_MODE_MODELS = [
+    model.strip() for model in
+    os.getenv("OPENAI_JSON_MODE_MODELS", "gpt-4-turbo,gpt-4o,gpt-4o-mini,gpt-3.5-turbo").split(",")
+    if model.strip()
+]
+
+# Model routing: per-operation model tiers by input size, with a latency
+# target (ms) and a faster fallback model used while the target is exceeded.
+# Override with MODEL_ROUTES_JSON using the same shape.
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "gpt-4o")
+MODEL_ROUTES = {
+    "analyze_tone": {"tiers": [{"model": "gpt-4o-mini"}], "latency_target_ms": 1500, "fallback_model": "gpt-3.5-turbo"},
+    "analyze_tone_batch": {"tiers": [{"model": "gpt-4o-mini"}], "latency_target_ms": 2500, "fallback_model": "gpt-3.5-turbo"},
+    "extract_action_items": {"tiers": [{"model": "gpt-4o-mini"}], "latency_target_ms": 1500, "fallback_model": "gpt-3.5-turbo"},
+    "extract_action_items_batch": {"tiers": [{"model": "gpt-4o-mini"}], "latency_target_ms": 2500, "fallback_model": "gpt-3.5-turbo"},
+    "summarize_email": {
+        "tiers": [{"max_input_tokens": 2000, "model": "gpt-4o-mini"}, {"model": "gpt-4o"}],
+        "latency_target_ms": 4000, "fallback_model": "gpt-4o-mini"
+    },
+    "stream_summarize_email": {
+        "tiers": [{"max_input_tokens": 2000, "model": "gpt-4o-mini"}, {"model": "gpt-4o"}],
+        "latency_target_ms": 4000, "fallback_model": "gpt-4o-mini"
+    },
+    "summarize_thread_chunk": {"tiers": [{"model": "gpt-4o-mini"}], "latency_target_ms": 4000, "fallback_model": "gpt-3.5-turbo"},
+    "summarize_email_thread": {
+        "tiers": [{"max_input_tokens": 1500, "model": "gpt-4o-mini"}, {"model": "gpt-4o"}],
+        "latency_target_ms": 8000, "fallback_model": "gpt-4o-mini"
+    },
+    "merge_thread_summary": {"tiers": [{"model": "gpt-4o"}], "latency_target_ms": 6000, "fallback_model": "gpt-4o-mini"},
+    "reduce_thread_summaries": {"tiers": [{"model": "gpt-4o"}], "latency_target_ms": 6000, "fallback_model": "gpt-4o-mini"},
+    "generate_reply": {"tiers": [{"model": "gpt-4o"}], "latency_target_ms": 6000, "fallback_model": "gpt-4o-mini"},
+    "refine_reply": {"tiers": [{"model": "gpt-4o"}], "latency_target_ms": 5000, "fallback_model": "gpt-4o-mini"},
+    "categorize_emails_batch": {"tiers": [{"model": "gpt-4o-mini"}], "latency_target_ms": 4000, "fallback_model": "gpt-3.5-turbo"},
+}
+if os.getenv("MODEL_ROUTES_JSON"):
+    import json
+    MODEL_ROUTES.update(json.loads(os.getenv("MODEL_ROUTES_JSON")))
+
+# Prompt token budgeting
+GPT_MAX_INPUT_TOKENS = int(os.getenv("GPT_MAX_INPUT_TOKENS", "6000"))
+GPT_TRUNCATION_STRATEGY = os.getenv("GPT_TRUNCATION_STRATEGY", "head_tail")
+
+# Micro-batching of small GPT tasks (analyze_tone, extract_action_items)
+MICRO_BATCH_ENABLED = os.getenv("MICRO_BATCH_ENABLED", "true").lower() == "true"
+MICRO_BATCH_WINDOW_MS = int(os.getenv("MICRO_BATCH_WINDOW_MS", "25"))
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", "8"))
+MICRO_BATCH_MAX_CHARS = int(os.getenv("MICRO_BATCH_MAX_CHARS", "600"))
+
+# Local tone analysis; results below this confidence are escalated to the LLM
+TONE_LOCAL_CONFIDENCE_THRESHOLD = float(os.getenv("TONE_LOCAL_CONFIDENCE_THRESHOLD", "0.7"))
+
+# Near-duplicate summary reuse (templated mail)
+DEDUP_INDEX_MAX_ENTRIES = int(os.getenv("DEDUP_INDEX_MAX_ENTRIES", "500"))
+
+# Thread summarization (map-reduce for long threads)
+THREAD_MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("THREAD_MAP_REDUCE_THRESHOLD_TOKENS", "6000"))
+THREAD_CHUNK_TOKEN_BUDGET = int(os.getenv("THREAD_CHUNK_TOKEN_BUDGET", "3000"))
+THREAD_MAP_CONCURRENCY = int(os.getenv("THREAD_MAP_CONCURRENCY", "4"))
+
+# Persisted thread summaries (incremental updates)
+SUMMARY_STORE_PATH = os.getenv("SUMMARY_STORE_PATH", "thread_summaries.db")
+THREAD_SUMMARY_MAX_MERGES = int(os.getenv("THREAD_SUMMARY_MAX_MERGES", "10"))
+
+# Background jobs (bulk and long-thread summarization)
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_ITEM_CONCURRENCY = int(os.getenv("JOB_ITEM_CONCURRENCY", "4"))
+JOB_ITEM_MAX_ATTEMPTS = int(os.getenv("JOB_ITEM_MAX_ATTEMPTS", "3"))
+JOB_ITEM_TIMEOUT_SECONDS = float(os.getenv("JOB_ITEM_TIMEOUT_SECONDS", "120"))
+JOB_RETRY_DELAY_SECONDS = float(os.getenv("JOB_RETRY_DELAY_SECONDS", "5"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# A running job belongs to the worker holding its lease; renewed every third of this
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# Inbox categorization: one batched LLM call per page, results cached per message id
+CATEGORIZE_MAX_BATCH = int(os.getenv("CATEGORIZE_MAX_BATCH", "50"))
+CATEGORY_CACHE_MAX_ENTRIES = int(os.getenv("CATEGORY_CACHE_MAX_ENTRIES", "5000"))
+
+# Speculative summaries of unread inbox mail (opt-in per inbox request)
+PRECOMPUTE_STORE_PATH = os.getenv("PRECOMPUTE_STORE_PATH", "email_summaries.db")
+PRECOMPUTE_MAX_MESSAGES = int(os.getenv("PRECOMPUTE_MAX_MESSAGES", "10"))
+PRECOMPUTE_USER_CONCURRENCY = int(os.getenv("PRECOMPUTE_USER_CONCURRENCY", "2"))
+PRECOMPUTE_GLOBAL_CONCURRENCY = int(os.getenv("PRECOMPUTE_GLOBAL_CONCURRENCY", "4"))
+PRECOMPUTE_TOKEN_BUDGET = int(os.getenv("PRECOMPUTE_TOKEN_BUDGET", "20000"))
+PRECOMPUTE_BUDGET_WINDOW_SECONDS = float(os.getenv("PRECOMPUTE_BUDGET_WINDOW_SECONDS", "3600"))
+PRECOMPUTE_ITEM_TIMEOUT_SECONDS = float(os.getenv("PRECOMPUTE_ITEM_TIMEOUT_SECONDS", "60"))
+PRECOMPUTE_SUMMARY_LENGTH = int(os.getenv("PRECOMPUTE_SUMMARY_LENGTH", "150"))
+
+# Upstream resilience (OpenAI and Gmail)
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.25"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "4"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+HEDGE_MIN_DELAY_MS = int(os.getenv("HEDGE_MIN_DELAY_MS", "300"))
+HEDGE_OPERATIONS = [
+    operation.strip() for operation in
+    os.getenv("HEDGE_OPERATIONS", "analyze_tone,extract_action_items").split(",")
+    if operation.strip()
+]
+
+# Upstream connection pools shared by every request on a worker. The lifespan hook
+# opens UPSTREAM_WARM_CONNECTIONS keep-alive connections to each upstream before
+# /ready reports ready, and on shutdown waits up to UPSTREAM_DRAIN_SECONDS for
+# in-flight calls before closing them.
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+GMAIL_MAX_IDLE_CONNECTIONS = int(os.getenv("GMAIL_MAX_IDLE_CONNECTIONS", "16"))
+UPSTREAM_WARM_CONNECTIONS = int(os.getenv("UPSTREAM_WARM_CONNECTIONS", "4"))
+UPSTREAM_DRAIN_SECONDS = float(os.getenv("UPSTREAM_DRAIN_SECONDS", "10"))
+
+# Responses of at least this many bytes are sent brotli- or gzip-compressed when the client accepts it
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+
+# Per-request deadlines; clients may ask for less with an X-Request-Timeout header (seconds)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+REQUEST_DEADLINE_MAX_SECONDS = float(os.getenv("REQUEST_DEADLINE_MAX_SECONDS", "120"))
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.25"))
+
 # Google OAuth2 Configuration
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET", "")
@@ -20,9 +144,46 @@ GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI", "https://intellimail-90io
 FRONTEND_URL = os.getenv("FRONTEND_URL", "https://intelli-mail-lyart.vercel.app" if ENVIRONMENT == "production" else "http://localhost:3000")
 
 # JWT Configuration
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-here")
-if JWT_SECRET_KEY == "your-secret-key-here" and ENVIRONMENT == "production":
-    print("⚠️  WARNING: JWT_SECRET_KEY using default value")
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "")
+# Session tokens are neither issued nor accepted unless the secret looks randomly generated:
+# long enough, and not a short alphabet repeated (placeholders such as "your-secret-key-here" fail)
+JWT_SECRET_MIN_LENGTH = 32
+JWT_SECRET_MIN_DISTINCT_CHARACTERS = 10
+
+def jwt_secret_is_strong(secret: str) -> bool:
+    return len(secret) >= JWT_SECRET_MIN_LENGTH and len(set(secret)) >= JWT_SECRET_MIN_DISTINCT_CHARACTERS
+
+SESSION_TOKENS_ENABLED = jwt_secret_is_strong(JWT_SECRET_KEY)
+if not SESSION_TOKENS_ENABLED and ENVIRONMENT == "production":
+    raise RuntimeError(f"JWT_SECRET_KEY must be a random secret of at least {JWT_SECRET_MIN_LENGTH} characters in production")
+JWT_ALGORITHM = "HS256"
+
+# Sessions (and the session tokens issued at login) expire this long after login or the last refresh
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "300"))
+
+# Session store shared by worker processes: "sqlite" (WAL, one file per node) or "memory" (single process)
+SESSION_STORE = os.getenv("SESSION_STORE", "sqlite")
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "sessions.db")
+
+# Per-process read-through cache in front of the shared store
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "5"))
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))
+
+# Google access tokens are refreshed in the background this long before they expire
+TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+# Clients may still hold the token a refresh replaced; it keeps identifying the session this long
+SUPERSEDED_TOKEN_GRACE_SECONDS = float(os.getenv("SUPERSEDED_TOKEN_GRACE_SECONDS", str(TOKEN_REFRESH_MARGIN_SECONDS)))
+TOKEN_REFRESH_CHECK_SECONDS = float(os.getenv("TOKEN_REFRESH_CHECK_SECONDS", "60"))
+TOKEN_REFRESH_RETRY_SECONDS = float(os.getenv("TOKEN_REFRESH_RETRY_SECONDS", "120"))
+TOKEN_REFRESH_CONCURRENCY = int(os.getenv("TOKEN_REFRESH_CONCURRENCY", "4"))
+# A worker claims a user's refresh in the session store for this long; the others wait for its token
+TOKEN_REFRESH_LEASE_SECONDS = float(os.getenv("TOKEN_REFRESH_LEASE_SECONDS", "15"))
+
+# Slow imports (OpenAI SDK, Google clients, NumPy) are deferred out of startup and
+# loaded in the background this long after the server starts accepting requests
+STARTUP_WARMUP_ENABLED = os.getenv("STARTUP_WARMUP_ENABLED", "true").lower() == "true"
+STARTUP_WARMUP_DELAY_SECONDS = float(os.getenv("STARTUP_WARMUP_DELAY_SECONDS", "1"))
 
 # Gmail API Configuration
 GMAIL_SCOPES = [
@@ -31,6 +192,9 @@ GMAIL_SCOPES = [
     'https://www.googleapis.com/auth/gmail.modify'
 ]
 
+# Point the Gmail client at another endpoint (e.g. loadtest/gmail_stub.py)
+GMAIL_API_ENDPOINT = os.getenv("GMAIL_API_ENDPOINT") or None
+
 # CORS Configuration
 CORS_ORIGINS = [
     "http://localhost:3000",
@@ -0,0 +1 @@
+# Load testing tools: local OpenAI/Gmail stand-ins and the harness
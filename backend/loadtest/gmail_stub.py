@@ -0,0 +1,217 @@
+"""
+Gmail REST API stand-in serving a synthetic mailbox for load testing.
+
+Implements the subset of users.messages / users.threads / users.history /
+users.getProfile that GmailService uses, at the paths googleapiclient builds when
+GMAIL_API_ENDPOINT points here.
+
+    python -m loadtest.gmail_stub --port 9002 --messages 500 --latency-ms 40
+"""
+import argparse
+import asyncio
+import base64
+import random
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException, Request
+import uvicorn
+
+app = FastAPI(title="Gmail stand-in")
+
+settings = {"latency_ms": 40.0, "jitter_ms": 10.0, "error_rate": 0.0}
+
+SENDERS = [
+    ("Alice Chen", "alice@example.com"), ("Bob Martin", "bob@example.com"), ("Carol Diaz", "carol@example.org"),
+    ("Dev Patel", "dev@example.net"), ("Acme Reports", "noreply@acme.example"), ("Team Updates", "updates@example.com"),
+]
+TOPICS = ["Q3 planning", "Contract renewal", "Launch checklist", "Budget review", "Hiring update", "Weekly report"]
+SENTENCES = [
+    "I wanted to follow up on our conversation from last week.",
+    "Please review the attached plan and let me know your thoughts.",
+    "Can you confirm whether the timeline still works for your team?",
+    "We need the final numbers by Friday to close the quarter.",
+    "The design team has finished the first round of mockups.",
+    "There are a few open questions about scope that we should discuss.",
+    "I have added notes to the shared document for reference.",
+    "Let me know if a call on Thursday afternoon works for you.",
+    "The vendor has agreed to the revised pricing.",
+    "Thanks again for your help getting this over the line.",
+]
+
+mailbox: Dict[str, Dict] = {}
+threads: Dict[str, List[str]] = {}
+order: List[str] = []
+history = {"id": 100000}
+# (history id, ids of the messages it changed), oldest first
+history_log: List[Tuple[int, List[str]]] = []
+
+def _encode(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+def build_mailbox(message_count: int, seed: int = 7) -> None:
+    """
+    Generate message_count messages grouped into threads of 1-8 messages.
+    Replies quote the previous message so quoted-text stripping is exercised.
+    """
+    rng = random.Random(seed)
+    mailbox.clear()
+    threads.clear()
+    order.clear()
+    now = datetime.now(timezone.utc)
+
+    index = 0
+    thread_number = 0
+    while index < message_count:
+        thread_id = f"t{thread_number:06d}"
+        thread_number += 1
+        topic = rng.choice(TOPICS)
+        previous_body: Optional[str] = None
+        threads[thread_id] = []
+
+        for position in range(min(rng.randint(1, 8), message_count - index)):
+            message_id = f"m{index:07d}"
+            name, address = rng.choice(SENDERS)
+            sent = now - timedelta(minutes=(message_count - index) * 7)
+            body = " ".join(rng.sample(SENTENCES, rng.randint(3, 7))) + f"\n\nBest regards,\n{name}"
+            if previous_body:
+                quoted = "\n".join(f"> {line}" for line in previous_body.split("\n"))
+                body += f"\n\nOn {format_datetime(sent - timedelta(hours=1))}, someone wrote:\n{quoted}"
+            previous_body = body
+
+            headers = [
+                {"name": "From", "value": f"{name} <{address}>"},
+                {"name": "To", "value": "Load Test <loadtest@example.com>"},
+                {"name": "Subject", "value": ("Re: " if position else "") + topic},
+                {"name": "Date", "value": format_datetime(sent)},
+                {"name": "Message-ID", "value": f"<{message_id}@example.com>"},
+            ]
+            if address.startswith(("noreply", "updates")):
+                headers.append({"name": "List-Unsubscribe", "value": f"<mailto:unsubscribe@{address.split('@')[1]}>"})
+
+            mailbox[message_id] = {
+                "id": message_id,
+                "threadId": thread_id,
+                "labelIds": ["INBOX"] + (["UNREAD"] if rng.random() < 0.4 else []),
+                "snippet": body[:120],
+                "historyId": str(history["id"] + index),
+                "internalDate": str(int(sent.timestamp() * 1000)),
+                "sizeEstimate": len(body),
+                "payload": {"mimeType": "text/plain", "headers": headers, "body": {"size": len(body), "data": _encode(body)}}
+            }
+            threads[thread_id].append(message_id)
+            order.append(message_id)
+            index += 1
+
+    order.reverse()
+    history_log.clear()
+    history_log.extend((int(mailbox[message_id]["historyId"]), [message_id]) for message_id in reversed(order))
+    history["id"] += message_count
+
+async def _simulate_upstream():
+    await asyncio.sleep(max(0.0, random.gauss(settings["latency_ms"], settings["jitter_ms"])) / 1000)
+    if random.random() < settings["error_rate"]:
+        raise HTTPException(status_code=503, detail="Injected backend error")
+
+def _render(message: Dict, format: str, metadata_headers: Optional[List[str]] = None) -> Dict:
+    if format == "minimal":
+        return {key: message[key] for key in ("id", "threadId", "labelIds", "snippet", "historyId", "internalDate", "sizeEstimate")}
+    if format == "metadata":
+        wanted = {name.lower() for name in metadata_headers or []}
+        headers = [h for h in message["payload"]["headers"] if not wanted or h["name"].lower() in wanted]
+        rendered = _render(message, "minimal")
+        rendered["payload"] = {"mimeType": message["payload"]["mimeType"], "headers": headers}
+        return rendered
+    return message
+
+@app.get("/gmail/v1/users/{user_id}/profile")
+async def get_profile(user_id: str):
+    await _simulate_upstream()
+    return {"emailAddress": "loadtest@example.com", "messagesTotal": len(mailbox),
+            "threadsTotal": len(threads), "historyId": str(history["id"])}
+
+@app.get("/gmail/v1/users/{user_id}/history")
+async def list_history(user_id: str, startHistoryId: int, maxResults: int = 100):
+    await _simulate_upstream()
+    records = [record for record in history_log if record[0] > startHistoryId]
+    response = {"historyId": str(history["id"])}
+    if records:
+        response["history"] = [
+            {"id": str(history_id), "messages": [{"id": message_id, "threadId": mailbox[message_id]["threadId"]}
+                                                 for message_id in message_ids if message_id in mailbox]}
+            for history_id, message_ids in records[:maxResults]
+        ]
+    if len(records) > maxResults:
+        response["nextPageToken"] = "1"
+    return response
+
+@app.get("/gmail/v1/users/{user_id}/messages")
+async def list_messages(user_id: str, maxResults: int = 100, q: Optional[str] = None, pageToken: Optional[str] = None):
+    await _simulate_upstream()
+    ids = order
+    if q and "is:unread" in q:
+        ids = [message_id for message_id in ids if "UNREAD" in mailbox[message_id]["labelIds"]]
+    start = int(pageToken or 0)
+    page = ids[start:start + maxResults]
+    response = {"messages": [{"id": message_id, "threadId": mailbox[message_id]["threadId"]} for message_id in page],
+                "resultSizeEstimate": len(ids)}
+    if start + maxResults < len(ids):
+        response["nextPageToken"] = str(start + maxResults)
+    return response
+
+@app.get("/gmail/v1/users/{user_id}/messages/{message_id}")
+async def get_message(user_id: str, message_id: str, request: Request, format: str = "full"):
+    await _simulate_upstream()
+    if message_id not in mailbox:
+        raise HTTPException(status_code=404, detail="Requested entity was not found.")
+    return _render(mailbox[message_id], format, request.query_params.getlist("metadataHeaders"))
+
+@app.get("/gmail/v1/users/{user_id}/threads/{thread_id}")
+async def get_thread(user_id: str, thread_id: str, request: Request, format: str = "full"):
+    await _simulate_upstream()
+    if thread_id not in threads:
+        raise HTTPException(status_code=404, detail="Requested entity was not found.")
+    messages = [_render(mailbox[message_id], format, request.query_params.getlist("metadataHeaders"))
+                for message_id in threads[thread_id]]
+    return {"id": thread_id, "historyId": max(message["historyId"] for message in messages), "messages": messages}
+
+@app.post("/gmail/v1/users/{user_id}/messages/{message_id}/modify")
+async def modify_message(user_id: str, message_id: str, request: Request):
+    await _simulate_upstream()
+    if message_id not in mailbox:
+        raise HTTPException(status_code=404, detail="Requested entity was not found.")
+    body = await request.json()
+    message = mailbox[message_id]
+    labels = [label for label in message["labelIds"] if label not in body.get("removeLabelIds", [])]
+    labels += [label for label in body.get("addLabelIds", []) if label not in labels]
+    history["id"] += 1
+    message.update(labelIds=labels, historyId=str(history["id"]))
+    history_log.append((history["id"], [message_id]))
+    return _render(message, "minimal")
+
+@app.post("/gmail/v1/users/{user_id}/messages/send")
+async def send_message(user_id: str, request: Request):
+    await _simulate_upstream()
+    await request.json()
+    history["id"] += 1
+    return {"id": f"sent{int(time.time() * 1000)}", "threadId": "tsent", "labelIds": ["SENT"]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Gmail REST API stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9002)
+    parser.add_argument("--messages", type=int, default=500, help="size of the synthetic mailbox")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--latency-ms", type=float, default=settings["latency_ms"])
+    parser.add_argument("--jitter-ms", type=float, default=settings["jitter_ms"])
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    settings.update(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    build_mailbox(args.messages, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Load-test harness for the IntelliMail API.
+
+Starts the OpenAI and Gmail stand-ins (unless --openai-url / --gmail-url
+point at running ones), runs the app in-process against them with a seeded
+session, and drives the inbox, summarize and reply flows concurrently.
+Reports p50/p95/p99 latency and throughput per endpoint.
+
+    python -m loadtest.harness --concurrency 20 --duration 30 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+
+LOADTEST_USER = {"email": "loadtest@example.com", "name": "Load Test", "id": "loadtest"}
+LOADTEST_TOKEN = "loadtest-access-token"
+
+# Relative weight of each flow in the mix
+DEFAULT_MIX = {"inbox": 5, "summarize": 3, "reply": 2}
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class Recorder:
+    """
+    Latency samples and error counts per endpoint
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        if ok:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+        else:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed: float) -> Dict[str, Dict]:
+        report = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            samples = self.latencies.get(endpoint, [])
+            report[endpoint] = {
+                "requests": len(samples) + self.errors.get(endpoint, 0),
+                "errors": self.errors.get(endpoint, 0),
+                "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+                **{name: round(value * 1000, 1) if value is not None else None
+                   for name, value in (("p50_ms", percentile(samples, 0.50)),
+                                       ("p95_ms", percentile(samples, 0.95)),
+                                       ("p99_ms", percentile(samples, 0.99)))}
+            }
+        return report
+
+class UvicornThread:
+    """
+    Run a uvicorn server on its own thread and event loop, so blocking calls
+    in one server (the Gmail client is synchronous) cannot stall the others
+    """
+
+    def __init__(self, app, port: int):
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        # Signal handlers can only be installed on the main thread
+        self.server.install_signal_handlers = lambda: None
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    async def start(self) -> None:
+        self.thread.start()
+        while not self.server.started:
+            await asyncio.sleep(0.05)
+
+    async def stop(self) -> None:
+        self.server.should_exit = True
+        await asyncio.to_thread(self.thread.join, 10)
+
+async def _timed(client: httpx.AsyncClient, recorder: Recorder, endpoint: str, method: str, url: str, **kwargs):
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        response, ok = None, False
+    recorder.record(endpoint, time.perf_counter() - started, ok)
+    return response
+
+async def _worker(client: httpx.AsyncClient, recorder: Recorder, deadline: float, mix: Dict[str, int],
+                  email_ids: List[str], rng: random.Random) -> None:
+    flows, weights = zip(*mix.items())
+
+    while time.monotonic() < deadline:
+        flow = rng.choices(flows, weights)[0]
+
+        if flow == "inbox":
+            response = await _timed(client, recorder, "GET /emails/", "GET", "/emails/", params={"max_results": 20})
+            if response is not None and response.status_code == 200 and not email_ids:
+                email_ids.extend(item["id"] for item in response.json())
+        elif flow == "summarize" and email_ids:
+            await _timed(client, recorder, "POST /summarize/", "POST", "/summarize/",
+                         json={"email_id": rng.choice(email_ids), "max_length": 150})
+        elif flow == "reply" and email_ids:
+            await _timed(client, recorder, "POST /reply/generate", "POST", "/reply/generate",
+                         json={"email_id": rng.choice(email_ids), "tone": "professional", "length": "short"})
+        else:
+            await _timed(client, recorder, "GET /emails/", "GET", "/emails/", params={"max_results": 20})
+
+async def run(args) -> Dict:
+    servers: List[UvicornThread] = []
+
+    openai_url = args.openai_url
+    if not openai_url:
+        from loadtest import openai_stub
+        openai_stub.settings.update(latency_ms=args.openai_latency_ms, error_rate=args.openai_error_rate)
+        port = _free_port()
+        servers.append(UvicornThread(openai_stub.app, port))
+        openai_url = f"http://127.0.0.1:{port}/v1"
+
+    gmail_url = args.gmail_url
+    if not gmail_url:
+        from loadtest import gmail_stub
+        gmail_stub.settings.update(latency_ms=args.gmail_latency_ms, error_rate=args.gmail_error_rate)
+        gmail_stub.build_mailbox(args.messages)
+        port = _free_port()
+        servers.append(UvicornThread(gmail_stub.app, port))
+        gmail_url = f"http://127.0.0.1:{port}/"
+
+    # config reads these at import time, so they must be set before the app is imported
+    os.environ["OPENAI_BASE_URL"] = openai_url
+    os.environ["GMAIL_API_ENDPOINT"] = gmail_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-loadtest-0000000000")
+
+    from main import app
+    from services.auth_service import session_store
+    # One log line per harness request drowns out the app's own logging
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    session_store.put(LOADTEST_USER["email"], access_token=LOADTEST_TOKEN, refresh_token=None,
+                      user_info=dict(LOADTEST_USER))
+
+    app_port = _free_port()
+    servers.append(UvicornThread(app, app_port))
+    for server in servers:
+        await server.start()
+
+    recorder = Recorder()
+    email_ids: List[str] = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", limits=limits, timeout=args.timeout,
+                                     headers={"Authorization": f"Bearer {LOADTEST_TOKEN}"}) as client:
+            # Warm up and collect message ids before timing starts
+            response = await client.get("/emails/", params={"max_results": 50})
+            response.raise_for_status()
+            email_ids.extend(item["id"] for item in response.json())
+
+            started = time.monotonic()
+            deadline = started + args.duration
+            await asyncio.gather(*(
+                _worker(client, recorder, deadline, args.mix, email_ids, random.Random(args.seed + i))
+                for i in range(args.concurrency)
+            ))
+            elapsed = time.monotonic() - started
+    finally:
+        for server in reversed(servers):
+            await server.stop()
+
+    return {
+        "config": {"concurrency": args.concurrency, "duration_s": args.duration, "mix": args.mix,
+                   "openai_url": openai_url, "gmail_url": gmail_url},
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": recorder.report(elapsed)
+    }
+
+def _print_report(result: Dict) -> None:
+    print(f"\n{'endpoint':<24}{'reqs':>7}{'errs':>6}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for endpoint, row in result["endpoints"].items():
+        print(f"{endpoint:<24}{row['requests']:>7}{row['errors']:>6}{row['throughput_rps']:>8}"
+              f"{row['p50_ms'] or '-':>9}{row['p95_ms'] or '-':>9}{row['p99_ms'] or '-':>9}")
+
+def _parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown flow '{name}'")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive IntelliMail flows against local stand-ins")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=20, help="seconds of measured load")
+    parser.add_argument("--mix", type=_parse_mix, default=dict(DEFAULT_MIX), help="e.g. inbox=5,summarize=3,reply=2")
+    parser.add_argument("--messages", type=int, default=500, help="size of the stub mailbox")
+    parser.add_argument("--openai-url", help="use a running OpenAI-compatible server instead of the stub")
+    parser.add_argument("--gmail-url", help="use a running Gmail stand-in instead of the stub")
+    parser.add_argument("--openai-latency-ms", type=float, default=400)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--gmail-latency-ms", type=float, default=40)
+    parser.add_argument("--gmail-error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    _print_report(result)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
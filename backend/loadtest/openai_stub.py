@@ -0,0 +1,148 @@
+"""
+OpenAI-compatible chat completions stand-in for load testing.
+
+Serves POST /v1/chat/completions (plain and streamed) with configurable
+latency, token generation rate and error injection. Responses are shaped
+after the prompts GPTService sends, so JSON operations parse normally.
+
+    python -m loadtest.openai_stub --port 9001 --latency-ms 400 --tokens-per-second 80 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from typing import Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+app = FastAPI(title="OpenAI stand-in")
+
+settings = {
+    "latency_ms": 400.0,
+    "jitter_ms": 100.0,
+    "tokens_per_second": 80.0,
+    "error_rate": 0.0,
+    "rate_limit_rate": 0.0
+}
+
+stats = {"requests": 0, "errors_injected": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+def _completion_text(messages: List[Dict]) -> str:
+    prompt = "\n".join(message.get("content", "") for message in messages)
+    numbered = re.findall(r'^\s*(?:Text|Email) (\d+):', prompt, re.MULTILINE)
+
+    if '"results"' in prompt and numbered:
+        count = max(int(n) for n in numbered)
+        if '"action_needed"' in prompt:
+            cycle = ["action_needed", "fyi", "meeting", "personal"]
+            return json.dumps({"results": [cycle[i % len(cycle)] for i in range(count)]})
+        if "tone" in prompt.lower():
+            result = {"primary_tone": "professional", "confidence": 0.8,
+                      "tone_scores": {"professional": 0.8, "friendly": 0.2}, "suggestions": []}
+            return json.dumps({"results": [result] * count})
+        return json.dumps({"results": [["Follow up on the request"]] * count})
+    if '"primary_tone"' in prompt:
+        return json.dumps({"primary_tone": "professional", "confidence": 0.82,
+                           "tone_scores": {"formal": 0.4, "friendly": 0.3, "professional": 0.82, "casual": 0.1, "urgent": 0.1},
+                           "suggestions": ["Consider a warmer closing"]})
+    if '"action_items"' in prompt:
+        return json.dumps({"action_items": ["Reply with availability", "Review the attached document"]})
+    if '"summary"' in prompt:
+        return json.dumps({
+            "summary": "The sender shares a project update, asks for a review of the attached plan and proposes a meeting later this week.",
+            "key_points": ["Project update shared", "Review of the plan requested", "Meeting proposed for later this week"]
+        })
+
+    return ("Hi,\n\nThank you for your email. I have reviewed the details and I am happy to move forward. "
+            "I will send the requested information by Friday and we can discuss any open questions on our next call.\n\n"
+            "Best regards")
+
+def _count_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def _injected_error():
+    roll = random.random()
+    if roll < settings["rate_limit_rate"]:
+        return JSONResponse(status_code=429, content={"error": {"message": "Rate limit reached", "type": "requests"}})
+    if roll < settings["rate_limit_rate"] + settings["error_rate"]:
+        return JSONResponse(status_code=500, content={"error": {"message": "Injected server error", "type": "server_error"}})
+    return None
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+
+    error = _injected_error()
+    if error is not None:
+        stats["errors_injected"] += 1
+        await asyncio.sleep(settings["latency_ms"] / 1000)
+        return error
+
+    messages = body.get("messages", [])
+    model = body.get("model", "gpt-4o")
+    text = _completion_text(messages)
+    prompt_tokens = sum(_count_tokens(message.get("content", "")) for message in messages)
+    completion_tokens = min(_count_tokens(text), body.get("max_tokens") or 10 ** 6)
+    stats["prompt_tokens"] += prompt_tokens
+    stats["completion_tokens"] += completion_tokens
+
+    # Time to first token, then generation at tokens_per_second
+    first_token_delay = max(0.0, random.gauss(settings["latency_ms"], settings["jitter_ms"])) / 1000
+    generation_time = completion_tokens / settings["tokens_per_second"] if settings["tokens_per_second"] else 0
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+
+    if body.get("stream"):
+        async def event_stream():
+            await asyncio.sleep(first_token_delay)
+            pieces = re.findall(r'.{1,16}', text, re.DOTALL)
+            for piece in pieces:
+                await asyncio.sleep(generation_time / max(len(pieces), 1))
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    await asyncio.sleep(first_token_delay + generation_time)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens}
+    }
+
+@app.get("/stats")
+async def get_stats():
+    return {"settings": settings, "stats": stats}
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency-ms", type=float, default=settings["latency_ms"], help="mean time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=settings["jitter_ms"])
+    parser.add_argument("--tokens-per-second", type=float, default=settings["tokens_per_second"])
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    args = parser.parse_args()
+
+    settings.update(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, tokens_per_second=args.tokens_per_second,
+                    error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
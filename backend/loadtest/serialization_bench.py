@@ -0,0 +1,104 @@
+"""
+Serialization benchmark for inbox listing pages.
+
+Builds a page of inbox rows from the Gmail stand-in's synthetic mailbox and
+times turning it into a response body two ways:
+
+- validated: an EmailResponse model per row, then FastAPI's response_model
+  validation and jsonable_encoder pass, then JSONResponse (the old path)
+- fast: plain dict rows rendered by FastJSONResponse (the current path)
+
+    python -m loadtest.serialization_bench --rows 500 --iterations 50
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Callable, Dict, List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from loadtest import gmail_stub
+from routes.email import EmailResponse, _email_row
+from services.fast_json import FastJSONResponse, orjson
+
+def build_emails(rows: int) -> List[Dict]:
+    """
+    Rows shaped like GmailService.get_emails output
+    """
+    gmail_stub.build_mailbox(rows)
+    emails = []
+    for message_id in gmail_stub.order[:rows]:
+        message = gmail_stub.mailbox[message_id]
+        headers = {header["name"].lower(): header["value"] for header in message["payload"]["headers"]}
+        emails.append({
+            "id": message["id"],
+            "thread_id": message["threadId"],
+            "sender": headers["from"].split("<")[-1].rstrip(">"),
+            "subject": headers["subject"],
+            "date": headers["date"],
+            "snippet": message["snippet"],
+            "is_read": "UNREAD" not in message["labelIds"],
+            "recipient": headers["to"],
+            "label_ids": message["labelIds"],
+            "list_unsubscribe": "list-unsubscribe" in headers,
+        })
+    return emails
+
+async def validated_body(emails: List[Dict], field) -> bytes:
+    models = [EmailResponse(**_email_row(email, False, None)) for email in emails]
+    content = await serialize_response(field=field, response_content=models)
+    return JSONResponse(content).body
+
+async def fast_body(emails: List[Dict], field) -> bytes:
+    return FastJSONResponse([_email_row(email, False, None) for email in emails]).body
+
+async def measure(render: Callable, emails: List[Dict], field, iterations: int) -> float:
+    await render(emails, field)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await render(emails, field)
+    return (time.perf_counter() - start) / iterations
+
+async def run(args) -> Dict:
+    emails = build_emails(args.rows)
+    field = create_response_field(name="Response_get_emails", type_=List[EmailResponse], mode="serialization")
+
+    validated = await validated_body(emails, field)
+    fast = await fast_body(emails, field)
+    if json.loads(validated) != json.loads(fast):
+        raise SystemExit("fast path output differs from the validated path")
+
+    results = {"rows": len(emails), "encoder": "orjson" if orjson is not None else "json", "paths": {}}
+    for name, render in (("validated", validated_body), ("fast", fast_body)):
+        seconds = await measure(render, emails, field, args.iterations)
+        results["paths"][name] = {
+            "page_ms": round(seconds * 1000, 2),
+            "per_row_us": round(seconds / len(emails) * 1e6, 2),
+            "bytes": len(validated if name == "validated" else fast),
+        }
+    results["speedup"] = round(results["paths"]["validated"]["page_ms"] / results["paths"]["fast"]["page_ms"], 1)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Time inbox page serialization, validated vs fast path")
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"{results['rows']} rows, encoder: {results['encoder']}")
+    print(f"{'path':<12}{'page ms':>10}{'per row us':>12}{'bytes':>10}")
+    for name, path in results["paths"].items():
+        print(f"{name:<12}{path['page_ms']:>10.2f}{path['per_row_us']:>12.2f}{path['bytes']:>10}")
+    print(f"speedup: {results['speedup']}x")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    sys.exit(main())
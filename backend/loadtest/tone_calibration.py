@@ -0,0 +1,177 @@
+"""
+Calibration of the local tone classifier against a labelled sample.
+
+LABELLED_SAMPLES were used to pick the lexicon cues in
+services.tone_analyzer. HELD_OUT_SAMPLES were not; they are scored at a
+range of softmax temperatures (log loss and accuracy), then the accuracy
+and coverage of the local fast path is reported at a range of confidence
+thresholds. TEMPERATURE and TONE_LOCAL_CONFIDENCE_THRESHOLD were chosen
+from the held-out output: the temperature with the lowest log loss, and
+the lowest threshold that sends every WEAK_SIGNAL_SAMPLES text to the
+LLM and whose local answers are at least --target-precision accurate.
+
+    python -m loadtest.tone_calibration
+"""
+import argparse
+import sys
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from services import tone_analyzer as tone_module
+
+# (text, expected tone); short replies and openers of the kind /reply/analyze-tone receives
+LABELLED_SAMPLES: List[Tuple[str, str]] = [
+    ("URGENT: need this ASAP!!!", "urgent"),
+    ("This is urgent - the client needs the signed contract by 3pm today.", "urgent"),
+    ("Please review immediately, the release is blocked until this is fixed.", "urgent"),
+    ("Time-sensitive: the offer expires at noon, we need your decision right away.", "urgent"),
+    ("High priority. The server is down and customers are affected, please respond as soon as possible.", "urgent"),
+    ("I'm so sorry for the delay in getting back to you.", "apologetic"),
+    ("I apologize for the mistake in yesterday's invoice. We will make it right.", "apologetic"),
+    ("Apologies for the confusion, that was my error and I regret any inconvenience.", "apologetic"),
+    ("Sorry about missing the meeting, that was entirely my fault.", "apologetic"),
+    ("Unfortunately we made a mistake with your order and we sincerely apologize.", "apologetic"),
+    ("Thank you so much for your help, I'm truly grateful.", "grateful"),
+    ("We really appreciate everything you did for the launch, your support is valued.", "grateful"),
+    ("I'm so thankful for your patience and guidance this year.", "grateful"),
+    ("Thank you for going above and beyond, we are grateful for your hard work.", "grateful"),
+    ("Many thanks for the kind words, I'm grateful you took the time.", "grateful"),
+    ("Hey, sure thing, no problem!", "casual"),
+    ("hey! yeah that's cool, see ya tomorrow", "casual"),
+    ("Cool, works for me. Gonna grab lunch, talk later.", "casual"),
+    ("Sure, no worries. I'll ping you when it's done lol", "casual"),
+    ("yep, sounds good, thx!", "casual"),
+    ("Dear Mr. Thompson, I hereby confirm receipt of your correspondence. Respectfully, Anne Clarke", "formal"),
+    ("Dear Sir or Madam, please find enclosed the requested documentation. Yours sincerely, J. Patel", "formal"),
+    ("Pursuant to our agreement, we hereby notify you of the termination of the contract.", "formal"),
+    ("Dear Dr. Lee, I am writing to formally request an extension of the submission deadline. Kind regards.", "formal"),
+    ("We respectfully request that you furnish the aforementioned documents at your earliest opportunity.", "formal"),
+    ("Would you mind sending over the slides if possible?", "polite"),
+    ("Could you kindly take a look when convenient?", "polite"),
+    ("Would it be possible to move our call to Thursday, if that works for you?", "polite"),
+    ("Please let me know whenever you have a moment, would you mind checking the figures?", "polite"),
+    ("If it's not too much trouble, could you please forward me the agenda?", "polite"),
+    ("Hope you had a great weekend! Happy to help with the plan.", "friendly"),
+    ("So glad to hear the trip went well! Hope to catch up soon.", "friendly"),
+    ("Great to hear from you! Happy to chat whenever suits you.", "friendly"),
+    ("Hi Sam, hope all is well with you and the family! Looking forward to seeing you.", "friendly"),
+    ("Lovely to meet you last week, glad we connected!", "friendly"),
+    ("Please find the attached report. Let me know if you need anything else. Best regards", "professional"),
+    ("Following up on our discussion, attached is the updated proposal for your review.", "professional"),
+    ("I can assist with the migration next week. The plan and timeline are attached.", "professional"),
+    ("Regarding the budget, the team has reviewed the numbers and the update is attached.", "professional"),
+    ("As discussed, I will send the revised schedule by Friday. Best regards, Maria", "professional"),
+]
+
+# Written separately from the lexicon tuning; temperature and threshold are fitted on these only
+HELD_OUT_SAMPLES: List[Tuple[str, str]] = [
+    ("Need your sign-off today, the vendor deadline is tonight.", "urgent"),
+    ("CRITICAL: production database is down, all hands please join the bridge now.", "urgent"),
+    ("Can you send it over immediately? Legal is waiting on it.", "urgent"),
+    ("Reminder: payroll must be approved before 5pm or salaries will be delayed. Priority item.", "urgent"),
+    ("So sorry, I sent you the wrong file earlier.", "apologetic"),
+    ("My apologies, I completely forgot to book the room.", "apologetic"),
+    ("We regret the inconvenience caused by the outage this morning.", "apologetic"),
+    ("That was an oversight on our part and I'm sorry it caused extra work for you.", "apologetic"),
+    ("Thanks so much for covering for me on Friday, it means a lot.", "grateful"),
+    ("I'm grateful for the mentoring you've given me.", "grateful"),
+    ("We truly appreciate your generous donation, thank you.", "grateful"),
+    ("Thank you for your thoughtful feedback, it was really valuable.", "grateful"),
+    ("yeah no worries, catch you later", "casual"),
+    ("lol that's hilarious. sure, I'm in", "casual"),
+    ("hey, cool if I swing by around 4?", "casual"),
+    ("Sure thing, I'll bring snacks btw", "casual"),
+    ("Dear Ms. Alvarez, I am writing to inform you that your application has been received.", "formal"),
+    ("Yours faithfully, the Board of Directors", "formal"),
+    ("Dear Committee Members, please find enclosed the minutes of the previous meeting.", "formal"),
+    ("We hereby acknowledge the receipt of your formal complaint dated 3 March.", "formal"),
+    ("Would you mind reviewing my draft when you get a chance?", "polite"),
+    ("Could you please let me know if Tuesday suits you?", "polite"),
+    ("If possible, would you kindly share the recording?", "polite"),
+    ("Would it be possible to get a copy of the invoice?", "polite"),
+    ("Hope your week is off to a good start! Happy to grab coffee anytime.", "friendly"),
+    ("Great to see you at the conference! Hope the flight home was smooth.", "friendly"),
+    ("Lovely news about the new job, so glad for you!", "friendly"),
+    ("Hope you're well! Looking forward to working together.", "friendly"),
+    ("Attached is the Q3 summary. Let me know if you have questions.", "professional"),
+    ("Following up on my earlier note regarding the contract renewal.", "professional"),
+    ("The team will review the proposal and send an update by Wednesday.", "professional"),
+    ("As discussed in the meeting, I have updated the project timeline.", "professional"),
+]
+
+# Texts without a decisive tone cue; the threshold must send every one of them to the LLM
+WEAK_SIGNAL_SAMPLES: List[str] = [
+    "hi", "ok", "Noted.", "Will do.", "See below.", "Please see below.", "Thanks",
+    "Thank you", "Let me check and get back to you.", "Re: Monday", "Please",
+]
+
+def score(samples: List[Tuple[str, str]], temperature: float) -> Tuple[np.ndarray, List[int]]:
+    analyzer = tone_module.tone_analyzer
+    features = analyzer.featurize([text for text, _ in samples])
+    logits = (features @ analyzer.weights + analyzer.prior) / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    probabilities = np.exp(logits)
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    labels = [analyzer.tones.index(tone) for _, tone in samples]
+    return probabilities, labels
+
+def temperature_sweep(samples: List[Tuple[str, str]], temperatures: List[float]) -> List[Dict]:
+    rows = []
+    for temperature in temperatures:
+        probabilities, labels = score(samples, temperature)
+        picked = probabilities[np.arange(len(labels)), labels]
+        rows.append({
+            "temperature": temperature,
+            "log_loss": round(float(-np.log(np.maximum(picked, 1e-12)).mean()), 3),
+            "accuracy": round(float((probabilities.argmax(axis=1) == labels).mean()), 3),
+        })
+    return rows
+
+def threshold_sweep(samples: List[Tuple[str, str]], temperature: float, thresholds: List[float]) -> List[Dict]:
+    probabilities, labels = score(samples, temperature)
+    correct = probabilities.argmax(axis=1) == labels
+    confidence = probabilities.max(axis=1)
+    rows = []
+    for threshold in thresholds:
+        local = confidence >= threshold
+        rows.append({
+            "threshold": threshold,
+            "coverage": round(float(local.mean()), 3),
+            "local_accuracy": round(float(correct[local].mean()), 3) if local.any() else None,
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the local tone classifier")
+    parser.add_argument("--target-precision", type=float, default=0.95)
+    args = parser.parse_args()
+
+    temperatures = [round(t, 2) for t in np.arange(0.1, 2.01, 0.1)]
+    for name, samples in (("labelled", LABELLED_SAMPLES), ("held out", HELD_OUT_SAMPLES)):
+        probabilities, labels = score(samples, tone_module.TEMPERATURE)
+        print(f"{name}: accuracy {float((probabilities.argmax(axis=1) == labels).mean()):.3f} on {len(samples)} samples")
+
+    sweep = temperature_sweep(HELD_OUT_SAMPLES, temperatures)
+    print(f"\ntemperature sweep on the held-out samples")
+    print(f"{'temperature':>12}{'log loss':>10}{'accuracy':>10}")
+    for row in sweep:
+        print(f"{row['temperature']:>12}{row['log_loss']:>10}{row['accuracy']:>10}")
+    best = min(sweep, key=lambda row: row["log_loss"])["temperature"]
+
+    weak, _ = score([(text, "professional") for text in WEAK_SIGNAL_SAMPLES], tone_module.TEMPERATURE)
+    weak_max = float(weak.max(axis=1).max())
+
+    print(f"\nthresholds at temperature {tone_module.TEMPERATURE} (lowest log loss at {best}); "
+          f"weak-signal texts reach {weak_max:.2f}")
+    print(f"{'threshold':>10}{'coverage':>10}{'accuracy':>10}")
+    chosen = None
+    for row in threshold_sweep(HELD_OUT_SAMPLES, tone_module.TEMPERATURE, [round(t, 2) for t in np.arange(0.2, 0.91, 0.05)]):
+        print(f"{row['threshold']:>10}{row['coverage']:>10}{str(row['local_accuracy']):>10}")
+        if (chosen is None and row["threshold"] > weak_max
+                and row["local_accuracy"] is not None and row["local_accuracy"] >= args.target_precision):
+            chosen = row["threshold"]
+    print(f"\nlowest threshold above the weak-signal texts with local accuracy >= {args.target_precision}: {chosen}")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,82 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import uvicorn
+import asyncio
 import os
 import logging
+from contextlib import asynccontextmanager
 
-from routes import email, summarize, reply, auth
-from config import APP_NAME, APP_VERSION
+# Imported first so the startup profile's clock covers everything below
+from services.startup import startup_profile
+
+with startup_profile.measure("fastapi"):
+    from fastapi import FastAPI, HTTPException
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse, Response
+
+# Heavy third-party clients (OpenAI, Google, NumPy) are imported on first use
+# or by the warm-up below, so these only load the app's own modules
+with startup_profile.measure("routes.auth"):
+    from routes import auth
+with startup_profile.measure("routes.email"):
+    from routes import email
+with startup_profile.measure("routes.summarize"):
+    from routes import summarize
+with startup_profile.measure("routes.reply"):
+    from routes import reply
+with startup_profile.measure("routes.jobs"):
+    from routes import jobs
+
+from config import APP_NAME, APP_VERSION, STARTUP_WARMUP_ENABLED
+from services.request_context import RequestDeadlineMiddleware, get_request_stats
+from services.job_queue import job_queue
+from services.auth_service import token_refresher
+from services.upstream_clients import upstream_clients
+from services.compression import CompressionMiddleware
+from services.metrics import MetricsMiddleware, render_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def warm_up():
+    """Deferred imports first, then the upstream clients and their connections"""
+    await startup_profile.warm_up()
+    await upstream_clients.warm_up()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start background workers and, once serving, warm up in the background
+    (/ready turns 200 when done). On shutdown stop the workers, then drain
+    and close the upstream connection pools.
+    """
+    startup_profile.mark_ready()
+    # Resume jobs interrupted by a restart, and refresh Google tokens before they expire
+    await job_queue.start()
+    token_refresher.start()
+    
+    warmup_task = None
+    if STARTUP_WARMUP_ENABLED:
+        warmup_task = asyncio.create_task(warm_up())
+    else:
+        # Nothing to wait for; clients and connections are created on first use
+        upstream_clients.ready = True
+    
+    yield
+    
+    if warmup_task is not None:
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+    await token_refresher.stop()
+    await job_queue.stop()
+    await upstream_clients.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title=APP_NAME,
     description="AI-Powered Email Assistant with Gmail Integration",
     version=APP_VERSION,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Environment detection
@@ -52,6 +110,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request deadline and cancellation scope, seen by Gmail and OpenAI calls
+app.add_middleware(RequestDeadlineMiddleware)
+
+# brotli/gzip for complete bodies of at least COMPRESSION_MIN_BYTES; streams pass through
+app.add_middleware(CompressionMiddleware)
+
+# Outermost, so latency and status cover every other layer
+app.add_middleware(MetricsMiddleware)
+
 # Include routers with error handling
 try:
     app.include_router(auth.router, prefix="/auth", tags=["Authentication"])
@@ -77,6 +144,12 @@ try:
 except Exception as e:
     logger.error(f"❌ Failed to load reply routes: {e}")
 
+try:
+    app.include_router(jobs.router, prefix="/jobs", tags=["Background Jobs"])
+    logger.info("✅ Job routes loaded")
+except Exception as e:
+    logger.error(f"❌ Failed to load job routes: {e}")
+
 @app.get("/")
 async def root():
     """Simple root endpoint"""
@@ -92,6 +165,7 @@ async def health_check():
     """Detailed health check"""
     try:
         from config import OPENAI_API_KEY
+        from services.resilience import get_upstream_states
         return {
             "status": "healthy",
             "service": APP_NAME,
@@ -100,6 +174,9 @@ async def health_check():
             "cors_origins": allowed_origins,
             "openai_configured": bool(OPENAI_API_KEY),
             "openai_key_length": len(OPENAI_API_KEY) if OPENAI_API_KEY else 0,
+            "upstreams": get_upstream_states(),
+            "requests": get_request_stats(),
+            "token_refresh": token_refresher.stats(),
             "timestamp": "2025-08-07"
         }
     except Exception as e:
@@ -109,6 +186,12 @@ async def health_check():
             "error": str(e)
         }
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until upstream connections are warm, and again while draining"""
+    state = upstream_clients.stats()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
 @app.get("/debug/openai")
 async def debug_openai():
     """Debug OpenAI configuration"""
@@ -120,8 +203,6 @@ async def debug_openai():
         
         return {
             "openai_key_present": bool(OPENAI_API_KEY),
-            "openai_key_length": len(OPENAI_API_KEY) if OPENAI_API_KEY else 0,
-            "openai_key_prefix": OPENAI_API_KEY[:10] + "..." if OPENAI_API_KEY and len(OPENAI_API_KEY) > 10 else "None",
             "client_initialized": gpt_service.client is not None,
             "environment": ENVIRONMENT
         }
@@ -132,6 +213,28 @@ async def debug_openai():
             "openai_configured": False
         }
 
+@app.get("/debug/startup")
+async def debug_startup():
+    """Time to ready and per-module import times for this worker"""
+    return startup_profile.report()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics for this worker"""
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/debug/models")
+async def debug_models():
+    """Per-route model usage, latency and spend"""
+    from services.model_router import model_router
+    from services.prompt_templates import get_template_info
+    
+    return {
+        "routes": model_router.get_stats(),
+        "prompt_templates": get_template_info(),
+        "environment": ENVIRONMENT
+    }
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
@@ -145,6 +248,8 @@ async def global_exception_handler(request, exc):
     )
 
 if __name__ == "__main__":
+    import uvicorn
+    
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(
         "main:app",
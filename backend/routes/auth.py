@@ -1,20 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import HTMLResponse
 from pydantic import BaseModel
-import json
-import os
-import datetime
-from jose import jwt
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+from typing import Optional
 
-from config import GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_REDIRECT_URI, GMAIL_SCOPES, JWT_SECRET_KEY, FRONTEND_URL
+from config import GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET, GOOGLE_REDIRECT_URI, GMAIL_SCOPES, FRONTEND_URL
+from services.auth_service import get_current_user, session_store, token_refresher, create_session_token
+from services.token_refresher import credentials_expiry
 
 router = APIRouter()
-security = HTTPBearer()
 
 class LoginRequest(BaseModel):
     auth_code: str
@@ -23,9 +16,16 @@ class TokenResponse(BaseModel):
     access_token: str
     refresh_token: str
     user_info: dict
+    session_token: Optional[str] = None
 
-# Store for demo purposes - in production, use a proper database
-user_tokens = {}
+def _store_session(user_info: dict, credentials) -> dict:
+    return session_store.put(
+        user_info['email'],
+        access_token=credentials.token,
+        refresh_token=credentials.refresh_token,
+        user_info=user_info,
+        access_token_expires_at=credentials_expiry(credentials)
+    )
 
 @router.get("/google/url")
 async def get_google_auth_url():
@@ -33,6 +33,9 @@ async def get_google_auth_url():
     Get Google OAuth2 authorization URL
     """
     try:
+        # Deferred so the OAuth libraries stay out of the cold start
+        from google_auth_oauthlib.flow import Flow
+        
         # Create the OAuth2 flow
         flow = Flow.from_client_config(
             {
@@ -68,6 +71,10 @@ async def google_auth_callback(login_request: LoginRequest):
     Handle Google OAuth2 callback and exchange code for tokens
     """
     try:
+        # Deferred so the OAuth and API client libraries stay out of the cold start
+        from google_auth_oauthlib.flow import Flow
+        from googleapiclient.discovery import build
+        
         # Create the OAuth2 flow
         flow = Flow.from_client_config(
             {
@@ -110,18 +117,13 @@ async def google_auth_callback(login_request: LoginRequest):
             "id": profile.get('historyId', email)
         }
         
-        # Store tokens (in production, use a proper database)
-        user_tokens[email] = {
-            "access_token": credentials.token,
-            "refresh_token": credentials.refresh_token,
-            "user_info": user_info,
-            "credentials": credentials
-        }
+        session = _store_session(user_info, credentials)
         
         return TokenResponse(
             access_token=credentials.token,
             refresh_token=credentials.refresh_token,
-            user_info=user_info
+            user_info=user_info,
+            session_token=create_session_token(session)
         )
     
     except Exception as e:
@@ -133,6 +135,10 @@ async def google_auth_callback_get(code: str, state: str = None):
     Handle Google OAuth2 callback (GET request from Google)
     """
     try:
+        # Deferred so the OAuth and API client libraries stay out of the cold start
+        from google_auth_oauthlib.flow import Flow
+        from googleapiclient.discovery import build
+        
         # Create the OAuth2 flow
         flow = Flow.from_client_config(
             {
@@ -180,24 +186,15 @@ async def google_auth_callback_get(code: str, state: str = None):
             "id": profile.get('historyId', email)
         }
         
-        # Store tokens (in production, use a proper database)
-        user_tokens[email] = {
-            "access_token": credentials.token,
-            "refresh_token": credentials.refresh_token,
-            "user_info": user_info,
-            "credentials": credentials
-        }
+        session = _store_session(user_info, credentials)
         
-        # Create JWT token for the frontend
-        jwt_payload = {
-            "email": email,
-            "name": name,
-            "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=24)
-        }
-        jwt_token = jwt.encode(jwt_payload, JWT_SECRET_KEY, algorithm="HS256")
+        # Signed session token for the frontend; without a JWT secret only the Google token is handed over
+        jwt_token = create_session_token(session)
         
         # Redirect to frontend with tokens
-        frontend_url = f"{FRONTEND_URL}/auth/callback?token={jwt_token}&access_token={credentials.token}"
+        frontend_url = f"{FRONTEND_URL}/auth/callback?access_token={credentials.token}"
+        if jwt_token:
+            frontend_url += f"&token={jwt_token}"
         
         # Return HTML that redirects to frontend
         html_content = f"""
@@ -242,24 +239,16 @@ async def refresh_token(refresh_token: str):
     Refresh an expired access token
     """
     try:
-        # Find user by refresh token
-        user_data = None
-        for email, data in user_tokens.items():
-            if data.get('refresh_token') == refresh_token:
-                user_data = data
-                break
+        user_data = session_store.find_by_refresh_token(refresh_token)
         
         if not user_data:
             raise HTTPException(status_code=401, detail="Invalid refresh token")
         
-        credentials = user_data['credentials']
-        credentials.refresh(Request())
-        
-        # Update stored token
-        user_data['access_token'] = credentials.token
+        # Shares the per-user refresh lock with the background refresher
+        session = await token_refresher.refresh(user_data['email'], force=True)
         
         return {
-            "access_token": credentials.token,
+            "access_token": session['access_token'],
             "token_type": "bearer"
         }
     
@@ -267,14 +256,14 @@ async def refresh_token(refresh_token: str):
         raise HTTPException(status_code=400, detail=f"Token refresh failed: {str(e)}")
 
 @router.post("/logout")
-async def logout(current_user: dict = Depends(lambda: get_current_user)):
+async def logout(current_user: dict = Depends(get_current_user)):
     """
     Logout user and invalidate tokens
     """
     try:
         email = current_user.get('email')
-        if email and email in user_tokens:
-            del user_tokens[email]
+        if email:
+            session_store.remove(email)
         
         return {"message": "Logged out successfully"}
     
@@ -282,36 +271,11 @@ async def logout(current_user: dict = Depends(lambda: get_current_user)):
         raise HTTPException(status_code=500, detail=f"Logout failed: {str(e)}")
 
 @router.get("/me")
-async def get_current_user_info(current_user: dict = Depends(lambda: get_current_user)):
+async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     """
     Get current user information
     """
     return {
-        "user": current_user,
+        "user": {key: value for key, value in current_user.items() if key != 'access_token'},
         "authenticated": True
     }
-
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """
-    Dependency to get current authenticated user
-    """
-    try:
-        token = credentials.credentials
-        
-        # Find user by access token
-        for email, data in user_tokens.items():
-            if data.get('access_token') == token:
-                return data['user_info']
-        
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
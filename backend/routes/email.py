@@ -1,10 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 from typing import Optional, List
+import asyncio
 import json
+import logging
 
 from services.gmail_client import GmailService
 from services.auth_service import get_current_user
+from services.action_items import extract_action_items
+from services.request_context import run_cancellable
+from services.precompute import summary_precomputer
+from services.email_categorizer import email_categorizer
+from services.http_cache import make_etag, make_history_etag, etag_matches, requested_history_id, set_etag, not_modified
+from services.fast_json import FastJSONResponse
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -16,6 +26,8 @@ class EmailResponse(BaseModel):
     snippet: str
     thread_id: str
     is_read: bool
+    action_items: Optional[List[str]] = None
+    category: Optional[str] = None
 
 class EmailDetail(BaseModel):
     id: str
@@ -27,58 +39,158 @@ class EmailDetail(BaseModel):
     thread_id: str
     is_read: bool
 
+# Rows are built as plain dicts in EmailResponse / EmailDetail field order and
+# sent with FastJSONResponse: the Gmail client already guarantees the types,
+# so validating each row and then the whole page again would be wasted work
+
+def _email_row(email: dict, include_action_items: bool, category: Optional[str]) -> dict:
+    snippet = email.get('snippet', '')
+    return {
+        "id": email['id'],
+        "subject": email.get('subject', 'No Subject'),
+        "sender": email.get('sender', 'Unknown'),
+        "date": email.get('date', ''),
+        "snippet": snippet,
+        "thread_id": email.get('thread_id', ''),
+        "is_read": email.get('is_read', False),
+        "action_items": [
+            item['task'] for item in extract_action_items(snippet, already_reduced=True)['action_items']
+        ] if include_action_items else None,
+        "category": category
+    }
+
+def _email_detail_row(email: dict) -> dict:
+    return {
+        "id": email['id'],
+        "subject": email.get('subject', 'No Subject'),
+        "sender": email.get('sender', 'Unknown'),
+        "recipient": email.get('recipient', 'Unknown'),
+        "date": email.get('date', ''),
+        "body": email.get('body', ''),
+        "thread_id": email.get('thread_id', ''),
+        "is_read": email.get('is_read', False)
+    }
+
+def _messages_etag(user_email: str, messages: List[dict]) -> str:
+    # Messages change only through their labels, which bump their history id
+    return make_etag(user_email, *(f"{message['id']}:{message['history_id']}:{','.join(message['label_ids'])}"
+                                   for message in messages))
+
+def _changes_since(gmail_service: GmailService, since: str) -> Optional[dict]:
+    # Without the history the conditional request is answered in full, never with an error
+    try:
+        return gmail_service.get_changes_since(since)
+    except Exception as e:
+        logger.warning(f"⚠️ History since {since} unavailable, serving the full listing: {e}")
+        return None
+
+def _inbox_etag(user_email: str, query: str, listed: List[dict], versions: dict, since: int) -> str:
+    # since is the oldest of the listed history ids; every later one shows up in users.history
+    return make_history_etag(since, user_email, query, *(f"{message['id']}:{versions[message['id']]}"
+                                                         for message in listed))
+
 @router.get("/", response_model=List[EmailResponse])
 async def get_emails(
+    http_request: Request,
     max_results: int = 10,
     query: Optional[str] = None,
+    include_action_items: bool = False,
+    include_categories: bool = False,
+    precompute_summaries: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Fetch emails from user's Gmail inbox
+    Fetch emails from user's Gmail inbox. With include_action_items, each
+    row carries action items found locally in its snippet. With
+    include_categories, each row carries a triage category; uncached rows
+    that need the model share one batched call per page. With
+    precompute_summaries, the unread emails most likely to be opened are
+    summarized in the background and later served by POST /summarize/.
+    
+    The ETag covers the listed message ids and their history ids. A
+    conditional request rebuilds those from the mailbox history since the
+    oldest of them and gets a 304 before any message is fetched.
     """
+    return await run_cancellable(http_request, _get_emails(http_request, max_results, query, include_action_items,
+                                                           include_categories, precompute_summaries, current_user))
+
+async def _get_emails(http_request: Request, max_results: int, query: Optional[str], include_action_items: bool,
+                      include_categories: bool, precompute_summaries: bool, current_user: dict):
     try:
         gmail_service = GmailService(current_user['access_token'])
-        emails = gmail_service.get_emails(max_results=max_results, query=query)
-        
-        email_responses = []
-        for email in emails:
-            email_responses.append(EmailResponse(
-                id=email['id'],
-                subject=email.get('subject', 'No Subject'),
-                sender=email.get('sender', 'Unknown'),
-                date=email.get('date', ''),
-                snippet=email.get('snippet', ''),
-                thread_id=email.get('thread_id', ''),
-                is_read=email.get('is_read', False)
-            ))
-        
-        return email_responses
+        user_email = current_user.get('email', '')
+        since = requested_history_id(http_request)
+        
+        # Off the event loop; the per-message fetches stop at the request deadline
+        if since:
+            listed, changes = await asyncio.gather(
+                asyncio.to_thread(gmail_service.list_messages, max_results, query),
+                asyncio.to_thread(_changes_since, gmail_service, since)
+            )
+            # A listed message missing from the history is unchanged since the ETag's oldest history id, so it is that id
+            if changes is not None:
+                versions = {message['id']: changes.get(message['id'], int(since)) for message in listed}
+                etag = _inbox_etag(user_email, http_request.url.query, listed, versions, int(since))
+                if etag_matches(http_request, etag):
+                    return not_modified(http_request, etag)
+        else:
+            listed = await asyncio.to_thread(gmail_service.list_messages, max_results, query)
+        
+        emails = await asyncio.to_thread(gmail_service.get_emails, messages=listed)
+        categories = await email_categorizer.categorize(user_email, emails) if include_categories else {}
+        
+        rows = [_email_row(email, include_action_items, categories.get(email['id'])) for email in emails]
+        response = FastJSONResponse(rows)
+        
+        if precompute_summaries:
+            await summary_precomputer.schedule(current_user, emails)
+        
+        # Rows that failed to load or to be categorized may succeed on the next load, so such a page is not
+        # cacheable; nor is an empty one, which has no history id to check against
+        complete = len(emails) == len(listed) and not (
+            include_categories and any(row['category'] is None for row in rows))
+        if complete and emails:
+            versions = {email['id']: int(email['history_id']) for email in emails}
+            set_etag(response, _inbox_etag(user_email, http_request.url.query, listed, versions, min(versions.values())))
+        
+        return response
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch emails: {str(e)}")
 
+@router.get("/categories/stats")
+async def get_category_stats(current_user: dict = Depends(get_current_user)):
+    """
+    Categorization cache and model call counters for this worker
+    """
+    return email_categorizer.stats()
+
 @router.get("/{email_id}", response_model=EmailDetail)
 async def get_email_detail(
     email_id: str,
+    http_request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Get detailed view of a specific email
+    Get detailed view of a specific email. Conditional requests are checked
+    against the message's history id and labels before its body is fetched.
     """
     try:
         gmail_service = GmailService(current_user['access_token'])
-        email_detail = gmail_service.get_email_detail(email_id)
-        
-        return EmailDetail(
-            id=email_detail['id'],
-            subject=email_detail.get('subject', 'No Subject'),
-            sender=email_detail.get('sender', 'Unknown'),
-            recipient=email_detail.get('recipient', 'Unknown'),
-            date=email_detail.get('date', ''),
-            body=email_detail.get('body', ''),
-            thread_id=email_detail.get('thread_id', ''),
-            is_read=email_detail.get('is_read', False)
-        )
+        user_email = current_user.get('email', '')
+        
+        if http_request.headers.get('if-none-match'):
+            version = await asyncio.to_thread(gmail_service.get_message_version, email_id)
+            etag = _messages_etag(user_email, [version])
+            if etag_matches(http_request, etag):
+                return not_modified(http_request, etag)
+        
+        email_detail = await asyncio.to_thread(gmail_service.get_email_detail, email_id)
+        summary_precomputer.note_sender(user_email, email_detail.get('sender', ''))
+        
+        response = FastJSONResponse(_email_detail_row(email_detail))
+        set_etag(response, _messages_etag(user_email, [email_detail]))
+        return response
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch email detail: {str(e)}")
@@ -86,20 +198,32 @@ async def get_email_detail(
 @router.get("/thread/{thread_id}")
 async def get_email_thread(
     thread_id: str,
+    http_request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Get all emails in a thread
+    Get all emails in a thread. Conditional requests are checked against
+    the messages' history ids and labels before any body is fetched.
     """
     try:
         gmail_service = GmailService(current_user['access_token'])
-        thread_emails = gmail_service.get_thread_emails(thread_id)
+        user_email = current_user.get('email', '')
         
-        return {
+        if http_request.headers.get('if-none-match'):
+            versions = await asyncio.to_thread(gmail_service.get_thread_versions, thread_id)
+            etag = _messages_etag(user_email, versions)
+            if etag_matches(http_request, etag):
+                return not_modified(http_request, etag)
+        
+        thread_emails = await asyncio.to_thread(gmail_service.get_thread_emails, thread_id)
+        
+        response = FastJSONResponse({
             "thread_id": thread_id,
             "emails": thread_emails,
             "message_count": len(thread_emails)
-        }
+        })
+        set_etag(response, _messages_etag(user_email, thread_emails))
+        return response
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch email thread: {str(e)}")
@@ -0,0 +1,152 @@
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
+import json
+
+from services.auth_service import get_current_user
+from services.job_queue import job_queue, TERMINAL_STATES
+
+router = APIRouter()
+
+# How often the progress stream checks the job store
+EVENT_POLL_SECONDS = 0.5
+
+class BulkSummarizeJobRequest(BaseModel):
+    email_ids: List[str]
+    max_length: Optional[int] = 100
+
+class JobSubmitted(BaseModel):
+    job_id: str
+    status: str
+    total_items: int
+    status_url: str
+    events_url: str
+
+def _submitted(job: dict) -> JobSubmitted:
+    return JobSubmitted(
+        job_id=job['job_id'],
+        status=job['status'],
+        total_items=job['progress']['total'],
+        status_url=f"/jobs/{job['job_id']}",
+        events_url=f"/jobs/{job['job_id']}/events"
+    )
+
+@router.post("/summarize/bulk", response_model=JobSubmitted, status_code=202)
+async def submit_bulk_summarize(
+    request: BulkSummarizeJobRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Queue summarization of many emails; each email is one job item
+    """
+    if not request.email_ids:
+        raise HTTPException(status_code=400, detail="No email ids given")
+    
+    # Store calls run off the event loop; SQLite may wait on a locked database
+    job = await asyncio.to_thread(
+        job_queue.submit,
+        user_email=current_user.get('email', ''),
+        kind="bulk_summarize",
+        params={"max_length": request.max_length},
+        items=list(dict.fromkeys(request.email_ids))
+    )
+    return _submitted(job)
+
+@router.post("/summarize/thread/{thread_id}", response_model=JobSubmitted, status_code=202)
+async def submit_thread_summary(
+    thread_id: str,
+    max_length: Optional[int] = 200,
+    force_refresh: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Queue a (long) thread summary; the result matches POST /summarize/thread/{thread_id}
+    """
+    job = await asyncio.to_thread(
+        job_queue.submit,
+        user_email=current_user.get('email', ''),
+        kind="thread_summary",
+        params={"max_length": max_length, "force_refresh": force_refresh},
+        items=[thread_id]
+    )
+    return _submitted(job)
+
+@router.get("/")
+async def list_jobs(limit: int = 20, current_user: dict = Depends(get_current_user)):
+    """
+    The current user's most recent jobs
+    """
+    return {"jobs": await asyncio.to_thread(job_queue.list_jobs, current_user.get('email', ''), limit=min(limit, 100))}
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Job status and progress, with the results of items finished so far
+    """
+    job = await asyncio.to_thread(job_queue.get, job_id, user_email=current_user.get('email', ''))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Server-sent events for a job: "item" as each item finishes, "progress"
+    when the counters change and a final "done" with the job status
+    """
+    user_email = current_user.get('email', '')
+    if await asyncio.to_thread(job_queue.get, job_id, user_email=user_email, include_items=False) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream():
+        reported = set()
+        last_progress = None
+        
+        while True:
+            job = await asyncio.to_thread(job_queue.get, job_id, user_email=user_email, include_items=False)
+            if job is None:
+                return
+            
+            # Item results are only read when the counters say some finished
+            progress = (job['status'], job['progress'])
+            items = []
+            if progress != last_progress:
+                items = (await asyncio.to_thread(job_queue.get, job_id, user_email=user_email) or {}).get('items', [])
+            
+            for item in items:
+                key = (item['position'], item['status'], item['attempts'])
+                if item['status'] != 'pending' and key not in reported:
+                    reported.add(key)
+                    yield f"event: item\ndata: {json.dumps(item)}\n\n"
+            
+            if progress != last_progress:
+                last_progress = progress
+                yield f"event: progress\ndata: {json.dumps({'status': job['status'], **job['progress']})}\n\n"
+            
+            if job['status'] in TERMINAL_STATES:
+                yield f"event: done\ndata: {json.dumps({'status': job['status'], 'error': job['error']})}\n\n"
+                return
+            
+            await asyncio.sleep(EVENT_POLL_SECONDS)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@router.post("/{job_id}/retry")
+async def retry_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Re-run the failed items of a finished job
+    """
+    if not await asyncio.to_thread(job_queue.retry_failed, job_id, current_user.get('email', '')):
+        raise HTTPException(status_code=409, detail="Job not found or has no failed items to retry")
+    return await asyncio.to_thread(job_queue.get, job_id, include_items=False)
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Cancel a queued or running job; finished item results are kept
+    """
+    if not await asyncio.to_thread(job_queue.cancel, job_id, current_user.get('email', '')):
+        raise HTTPException(status_code=409, detail="Job not found or already finished")
+    return await asyncio.to_thread(job_queue.get, job_id, include_items=False)
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 from typing import Optional, List, Literal
 from enum import Enum
+import asyncio
+import logging
 
 from services.gpt_handler import GPTService
 from services.gmail_client import GmailService
 from services.tone_control import ToneController
 from services.auth_service import get_current_user
+from services.request_context import run_cancellable
+from services.precompute import summary_precomputer
+from config import TONE_LOCAL_CONFIDENCE_THRESHOLD
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -39,11 +46,15 @@ class ReplyResponse(BaseModel):
 @router.post("/generate", response_model=ReplyResponse)
 async def generate_reply(
     request: ReplyRequest,
+    http_request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Generate an AI-powered email reply
     """
+    return await run_cancellable(http_request, _generate_reply(request, current_user))
+
+async def _generate_reply(request: ReplyRequest, current_user: dict) -> ReplyResponse:
     try:
         content_to_reply = ""
         original_subject = ""
@@ -52,10 +63,11 @@ async def generate_reply(
         # Get email content if email_id is provided
         if request.email_id:
             gmail_service = GmailService(current_user['access_token'])
-            email_detail = gmail_service.get_email_detail(request.email_id)
+            email_detail = await asyncio.to_thread(gmail_service.get_email_detail, request.email_id)
             content_to_reply = email_detail.get('body', '')
             original_subject = email_detail.get('subject', '')
             sender_name = email_detail.get('sender', '')
+            summary_precomputer.note_sender(current_user.get('email', ''), sender_name)
         elif request.email_content:
             content_to_reply = request.email_content
         else:
@@ -71,15 +83,36 @@ async def generate_reply(
         # Get tone-specific prompt modifications
         tone_config = tone_controller.get_tone_config(request.tone.value)
         
-        reply_result = await gpt_service.generate_reply(
-            original_email=content_to_reply,
-            tone=request.tone.value,
-            length=request.length,
-            context=request.context,
-            custom_instructions=request.custom_instructions,
-            tone_config=tone_config
+        # Alternatives in other tones run alongside the main reply and are
+        # dropped if they fail; all of them are cancelled with the request
+        alternative_tones = [tone for tone in (ToneType.FORMAL, ToneType.FRIENDLY) if request.tone != tone]
+        results = await asyncio.gather(
+            gpt_service.generate_reply(
+                original_email=content_to_reply,
+                tone=request.tone.value,
+                length=request.length,
+                context=request.context,
+                custom_instructions=request.custom_instructions,
+                tone_config=tone_config
+            ),
+            *(
+                gpt_service.generate_reply(
+                    original_email=content_to_reply,
+                    tone=tone.value,
+                    length=request.length,
+                    context=request.context,
+                    tone_config=tone_controller.get_tone_config(tone.value)
+                )
+                for tone in alternative_tones
+            ),
+            return_exceptions=True
         )
         
+        reply_result = results[0]
+        if isinstance(reply_result, Exception):
+            raise reply_result
+        alternative_replies = [result['reply'] for result in results[1:] if not isinstance(result, Exception)]
+        
         # Generate suggested subject line
         suggested_subject = None
         if original_subject:
@@ -88,34 +121,6 @@ async def generate_reply(
             else:
                 suggested_subject = original_subject
         
-        # Generate alternative replies with different tones
-        alternative_replies = []
-        if request.tone != ToneType.FORMAL:
-            try:
-                formal_reply = await gpt_service.generate_reply(
-                    original_email=content_to_reply,
-                    tone="formal",
-                    length=request.length,
-                    context=request.context,
-                    tone_config=tone_controller.get_tone_config("formal")
-                )
-                alternative_replies.append(formal_reply['reply'])
-            except:
-                pass
-        
-        if request.tone != ToneType.FRIENDLY:
-            try:
-                friendly_reply = await gpt_service.generate_reply(
-                    original_email=content_to_reply,
-                    tone="friendly",
-                    length=request.length,
-                    context=request.context,
-                    tone_config=tone_controller.get_tone_config("friendly")
-                )
-                alternative_replies.append(friendly_reply['reply'])
-            except:
-                pass
-        
         return ReplyResponse(
             generated_reply=reply_result['reply'],
             tone_used=request.tone.value,
@@ -131,12 +136,16 @@ async def generate_reply(
 async def refine_reply(
     reply_text: str,
     target_tone: ToneType,
+    http_request: Request,
     refinement_instructions: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Refine an existing reply with different tone or instructions
     """
+    return await run_cancellable(http_request, _refine_reply(reply_text, target_tone, refinement_instructions))
+
+async def _refine_reply(reply_text: str, target_tone: ToneType, refinement_instructions: Optional[str]) -> dict:
     try:
         gpt_service = GPTService()
         tone_controller = ToneController()
@@ -163,21 +172,39 @@ async def refine_reply(
 @router.post("/analyze-tone")
 async def analyze_tone(
     text: str,
+    http_request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Analyze the tone of a given text
     """
+    return await run_cancellable(http_request, _analyze_tone(text))
+
+async def _analyze_tone(text: str) -> dict:
     try:
-        gpt_service = GPTService()
-        
-        tone_analysis = await gpt_service.analyze_tone(text)
+        # Loaded on first use (or by the warm-up): building it pulls in NumPy
+        from services.tone_analyzer import tone_analyzer
+        
+        # Score locally first; only low-confidence texts go to the model
+        tone_analysis = tone_analyzer.analyze(text)
+        analysis_source = "local"
+        
+        if tone_analysis['confidence'] < TONE_LOCAL_CONFIDENCE_THRESHOLD:
+            gpt_service = GPTService()
+            if gpt_service.client:
+                try:
+                    tone_analysis = await gpt_service.analyze_tone(text)
+                    analysis_source = "llm"
+                except Exception as e:
+                    # Breaker open, timeout or rate limit: the local score still answers
+                    logger.warning(f"⚠️ Tone escalation failed, using the local result: {e}")
         
         return {
             "detected_tone": tone_analysis.get('primary_tone', 'neutral'),
             "confidence": tone_analysis.get('confidence', 0.0),
             "tone_breakdown": tone_analysis.get('tone_scores', {}),
-            "suggestions": tone_analysis.get('suggestions', [])
+            "suggestions": tone_analysis.get('suggestions', []),
+            "analysis_source": analysis_source
         }
     
     except Exception as e:
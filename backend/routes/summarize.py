@@ -1,10 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import asyncio
+import json
+import logging
 
 from services.gpt_handler import GPTService
+from services.token_budget import count_tokens
 from services.gmail_client import GmailService
 from services.auth_service import get_current_user
+from services.summary_store import thread_summary_store
+from services.text_reducer import reduce_email_text, reduce_thread_bodies
+from services.dedup_index import near_duplicate_index
+from services.request_context import run_cancellable, check_deadline
+from services.job_queue import job_queue
+from services.precompute import summary_precomputer
+from services.metrics import CACHE_LOOKUPS
+from config import THREAD_MAP_REDUCE_THRESHOLD_TOKENS, THREAD_SUMMARY_MAX_MERGES
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -21,94 +36,220 @@ class SummarizeResponse(BaseModel):
     summary_length: int
     compression_ratio: float
 
+def _get_content_to_summarize(request: SummarizeRequest, current_user: dict) -> str:
+    """
+    Resolve the text to summarize from a SummarizeRequest
+    """
+    content_to_summarize = ""
+    
+    # Get content based on the request type
+    if request.email_content:
+        content_to_summarize = request.email_content
+    elif request.email_id:
+        gmail_service = GmailService(current_user['access_token'])
+        email_detail = gmail_service.get_email_detail(request.email_id)
+        summary_precomputer.note_sender(current_user.get('email', ''), email_detail.get('sender', ''))
+        body, _ = reduce_email_text(email_detail.get('body', ''))
+        content_to_summarize = f"Subject: {email_detail.get('subject', '')}\n\nFrom: {email_detail.get('sender', '')}\n\n{body}"
+    elif request.thread_id:
+        gmail_service = GmailService(current_user['access_token'])
+        thread_emails = gmail_service.get_thread_emails(request.thread_id)
+        
+        # Combine all emails in the thread, without each message's quoted history
+        bodies, _ = reduce_thread_bodies(thread_emails)
+        thread_content = []
+        for email, body in zip(thread_emails, bodies):
+            email_text = f"From: {email.get('sender', '')}\nDate: {email.get('date', '')}\nSubject: {email.get('subject', '')}\n\n{body}\n\n---\n\n"
+            thread_content.append(email_text)
+        
+        content_to_summarize = "".join(thread_content)
+    else:
+        raise HTTPException(status_code=400, detail="Must provide either email_content, email_id, or thread_id")
+    
+    if not content_to_summarize.strip():
+        raise HTTPException(status_code=400, detail="No content to summarize")
+    
+    return content_to_summarize
+
 @router.post("/", response_model=SummarizeResponse)
 async def summarize_email(
     request: SummarizeRequest,
+    http_request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Summarize an email or email thread using AI
     """
+    return await run_cancellable(http_request, _summarize_email(request, current_user))
+
+async def _summarize_email(request: SummarizeRequest, current_user: dict) -> SummarizeResponse:
     try:
-        content_to_summarize = ""
-        
-        # Get content based on the request type
-        if request.email_content:
-            content_to_summarize = request.email_content
-        elif request.email_id:
-            gmail_service = GmailService(current_user['access_token'])
-            email_detail = gmail_service.get_email_detail(request.email_id)
-            content_to_summarize = f"Subject: {email_detail.get('subject', '')}\n\nFrom: {email_detail.get('sender', '')}\n\n{email_detail.get('body', '')}"
-        elif request.thread_id:
-            gmail_service = GmailService(current_user['access_token'])
-            thread_emails = gmail_service.get_thread_emails(request.thread_id)
-            
-            # Combine all emails in the thread
-            thread_content = []
-            for email in thread_emails:
-                email_text = f"From: {email.get('sender', '')}\nDate: {email.get('date', '')}\nSubject: {email.get('subject', '')}\n\n{email.get('body', '')}\n\n---\n\n"
-                thread_content.append(email_text)
-            
-            content_to_summarize = "".join(thread_content)
-        else:
-            raise HTTPException(status_code=400, detail="Must provide either email_content, email_id, or thread_id")
+        user_email = current_user.get('email', '')
+        by_email_id = bool(request.email_id and not request.email_content)
         
-        if not content_to_summarize.strip():
-            raise HTTPException(status_code=400, detail="No content to summarize")
+        # Summaries computed earlier (e.g. speculatively after an inbox listing) skip Gmail and the LLM
+        stored = await summary_precomputer.get(user_email, request.email_id, request.max_length) if by_email_id else None
+        if by_email_id:
+            CACHE_LOOKUPS.labels("email_summary", "hit" if stored else "miss").inc()
+        if stored:
+            return _summary_response(stored['summary'], stored['key_points'], stored['original_length'])
         
-        # Generate summary using GPT
-        gpt_service = GPTService()
-        summary_result = await gpt_service.summarize_email(
-            content=content_to_summarize,
-            max_length=request.max_length
-        )
+        content_to_summarize = await asyncio.to_thread(_get_content_to_summarize, request, current_user)
         
-        original_length = len(content_to_summarize)
-        summary_length = len(summary_result['summary'])
-        compression_ratio = round((1 - summary_length / original_length) * 100, 2) if original_length > 0 else 0
+        # Templated mail reuses (and patches) the summary of a near-duplicate
+        summary_result = near_duplicate_index.lookup(user_email, content_to_summarize, request.max_length)
         
-        return SummarizeResponse(
-            summary=summary_result['summary'],
-            key_points=summary_result['key_points'],
-            original_length=original_length,
-            summary_length=summary_length,
-            compression_ratio=compression_ratio
-        )
+        if summary_result is None:
+            # Generate summary using GPT
+            gpt_service = GPTService()
+            summary_result = await gpt_service.summarize_email(
+                content=content_to_summarize,
+                max_length=request.max_length
+            )
+            near_duplicate_index.add(user_email, content_to_summarize, request.max_length, summary_result)
+        
+        if by_email_id:
+            await asyncio.to_thread(summary_precomputer.store.save, user_email, request.email_id, request.max_length,
+                                    summary_result['summary'], summary_result['key_points'], len(content_to_summarize))
+        
+        return _summary_response(summary_result['summary'], summary_result['key_points'], len(content_to_summarize))
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to summarize email: {str(e)}")
 
+def _summary_response(summary: str, key_points: List[str], original_length: int) -> SummarizeResponse:
+    summary_length = len(summary)
+    compression_ratio = round((1 - summary_length / original_length) * 100, 2) if original_length > 0 else 0
+    
+    return SummarizeResponse(
+        summary=summary,
+        key_points=key_points,
+        original_length=original_length,
+        summary_length=summary_length,
+        compression_ratio=compression_ratio
+    )
+
+@router.post("/stream")
+async def stream_summarize_email(
+    request: SummarizeRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Summarize an email as a server-sent event stream. "partial" events carry
+    summary fields as they are generated; a final "result" event carries the
+    validated summary.
+    """
+    content_to_summarize = await asyncio.to_thread(_get_content_to_summarize, request, current_user)
+    gpt_service = GPTService()
+    
+    async def event_stream():
+        try:
+            async for update in gpt_service.stream_summarize_email(
+                content=content_to_summarize,
+                max_length=request.max_length
+            ):
+                event = "result" if "result" in update else "partial"
+                yield f"event: {event}\ndata: {json.dumps(update[event])}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': f'Failed to summarize email: {str(e)}'})}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @router.post("/thread/{thread_id}", response_model=SummarizeResponse)
 async def summarize_thread(
     thread_id: str,
+    http_request: Request,
     max_length: Optional[int] = 200,
+    force_refresh: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Summarize an entire email thread
+    Summarize an entire email thread.
+    
+    Summaries are persisted with the message ids they cover; on later requests
+    only messages that arrived since are summarized and merged in.
     """
+    return await run_cancellable(http_request, _summarize_thread(thread_id, max_length, force_refresh, current_user))
+
+async def _summarize_thread(thread_id: str, max_length: int, force_refresh: bool, current_user: dict) -> SummarizeResponse:
     try:
         gmail_service = GmailService(current_user['access_token'])
-        thread_emails = gmail_service.get_thread_emails(thread_id)
+        thread_emails = await asyncio.to_thread(gmail_service.get_thread_emails, thread_id)
         
         if not thread_emails:
             raise HTTPException(status_code=404, detail="Thread not found or empty")
         
-        # Combine all emails in the thread with proper formatting
+        # Combine all emails in the thread with proper formatting; quoted
+        # history is dropped since every earlier message is already included
+        bodies, reduction = reduce_thread_bodies(thread_emails)
+        logger.info(
+            f"✂️ Thread {thread_id}: removed {reduction['bytes_removed']} of "
+            f"{reduction['original_bytes']} bytes of quoted text and signatures"
+        )
+        
         thread_content = []
-        for i, email in enumerate(thread_emails, 1):
-            email_text = f"Email {i}:\nFrom: {email.get('sender', '')}\nDate: {email.get('date', '')}\nSubject: {email.get('subject', '')}\n\n{email.get('body', '')}\n\n{'='*50}\n\n"
+        for i, (email, body) in enumerate(zip(thread_emails, bodies), 1):
+            email_text = f"Email {i}:\nFrom: {email.get('sender', '')}\nDate: {email.get('date', '')}\nSubject: {email.get('subject', '')}\n\n{body}\n\n{'='*50}\n\n"
             thread_content.append(email_text)
         
         full_thread = "".join(thread_content)
+        message_ids = [email['id'] for email in thread_emails]
+        
+        user_email = current_user.get('email', '')
+        stored = None
+        if not force_refresh:
+            stored = await asyncio.to_thread(thread_summary_store.get, user_email, thread_id)
         
-        # Generate summary using GPT
         gpt_service = GPTService()
-        summary_result = await gpt_service.summarize_email_thread(
-            thread_content=full_thread,
-            email_count=len(thread_emails),
-            max_length=max_length
-        )
+        summary_result = None
+        merge_count = 0
+        
+        # Reuse or incrementally update the stored summary when it still applies
+        if stored and stored['max_length'] == max_length and set(stored['message_ids']) <= set(message_ids):
+            covered = set(stored['message_ids'])
+            new_messages = [text for message_id, text in zip(message_ids, thread_content) if message_id not in covered]
+            
+            if not new_messages:
+                summary_result = stored
+                merge_count = stored['merge_count']
+                CACHE_LOOKUPS.labels("thread_summary", "hit").inc()
+            elif (stored['merge_count'] < THREAD_SUMMARY_MAX_MERGES
+                  and count_tokens("".join(new_messages)) <= THREAD_MAP_REDUCE_THRESHOLD_TOKENS):
+                summary_result = await gpt_service.merge_thread_summary(
+                    previous_summary=stored,
+                    new_messages=new_messages,
+                    email_count=len(thread_emails),
+                    max_length=max_length
+                )
+                merge_count = stored['merge_count'] + 1
+                CACHE_LOOKUPS.labels("thread_summary", "incremental").inc()
+        
+        # Full rebuild; long threads go through map-reduce
+        if summary_result is None:
+            CACHE_LOOKUPS.labels("thread_summary", "miss").inc()
+            if count_tokens(full_thread) > THREAD_MAP_REDUCE_THRESHOLD_TOKENS:
+                summary_result = await gpt_service.summarize_long_thread(
+                    messages=thread_content,
+                    max_length=max_length
+                )
+            else:
+                summary_result = await gpt_service.summarize_email_thread(
+                    thread_content=full_thread,
+                    email_count=len(thread_emails),
+                    max_length=max_length
+                )
+        
+        if summary_result is not stored:
+            await asyncio.to_thread(
+                thread_summary_store.save,
+                user_email=user_email,
+                thread_id=thread_id,
+                message_ids=message_ids,
+                summary=summary_result['summary'],
+                key_points=summary_result['key_points'],
+                max_length=max_length,
+                merge_count=merge_count
+            )
         
         original_length = len(full_thread)
         summary_length = len(summary_result['summary'])
@@ -128,31 +269,28 @@ async def summarize_thread(
 @router.post("/bulk")
 async def summarize_multiple_emails(
     email_ids: List[str],
+    http_request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Summarize multiple emails at once
+    Summarize multiple emails at once. Large batches should go through
+    POST /jobs/summarize/bulk instead, which runs outside the request.
     """
+    return await run_cancellable(http_request, _summarize_multiple_emails(email_ids, current_user))
+
+async def _summarize_multiple_emails(email_ids: List[str], current_user: dict) -> dict:
     try:
         gmail_service = GmailService(current_user['access_token'])
         gpt_service = GPTService()
+        user_email = current_user.get('email', '')
         
         summaries = []
         
         for email_id in email_ids:
+            # Stop starting new emails once the request is out of time
+            check_deadline()
             try:
-                email_detail = gmail_service.get_email_detail(email_id)
-                content = f"Subject: {email_detail.get('subject', '')}\n\nFrom: {email_detail.get('sender', '')}\n\n{email_detail.get('body', '')}"
-                
-                summary_result = await gpt_service.summarize_email(content=content, max_length=100)
-                
-                summaries.append({
-                    "email_id": email_id,
-                    "subject": email_detail.get('subject', ''),
-                    "sender": email_detail.get('sender', ''),
-                    "summary": summary_result['summary'],
-                    "key_points": summary_result['key_points']
-                })
+                summaries.append(await _summarize_one_email(gmail_service, gpt_service, user_email, email_id))
             except Exception as e:
                 summaries.append({
                     "email_id": email_id,
@@ -168,3 +306,69 @@ async def summarize_multiple_emails(
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process bulk summarization: {str(e)}")
+
+async def _summarize_one_email(gmail_service: GmailService, gpt_service: GPTService, user_email: str,
+                               email_id: str, max_length: int = 100) -> dict:
+    """
+    Fetch and summarize one email for bulk summarization
+    """
+    email_detail = await asyncio.to_thread(gmail_service.get_email_detail, email_id)
+    body, _ = reduce_email_text(email_detail.get('body', ''))
+    content = f"Subject: {email_detail.get('subject', '')}\n\nFrom: {email_detail.get('sender', '')}\n\n{body}"
+    
+    summary_result = near_duplicate_index.lookup(user_email, content, max_length)
+    if summary_result is None:
+        summary_result = await gpt_service.summarize_email(content=content, max_length=max_length)
+        near_duplicate_index.add(user_email, content, max_length, summary_result)
+    
+    return {
+        "email_id": email_id,
+        "subject": email_detail.get('subject', ''),
+        "sender": email_detail.get('sender', ''),
+        "summary": summary_result['summary'],
+        "key_points": summary_result['key_points'],
+        "original_length": len(content)
+    }
+
+# Background job handlers; each call processes one item of a job (see routes/jobs.py)
+async def _bulk_summarize_job_item(user: dict, params: dict, email_id: str) -> dict:
+    gmail_service = GmailService(user['access_token'])
+    return await _summarize_one_email(gmail_service, GPTService(), user.get('email', ''), email_id,
+                                      params.get('max_length', 100))
+
+async def _thread_summary_job_item(user: dict, params: dict, thread_id: str) -> dict:
+    response = await _summarize_thread(thread_id, params.get('max_length', 200), params.get('force_refresh', False), user)
+    return response.model_dump()
+
+job_queue.register("bulk_summarize", _bulk_summarize_job_item)
+job_queue.register("thread_summary", _thread_summary_job_item)
+
+async def _precompute_email_summary(user: dict, email_id: str, max_length: int) -> dict:
+    """
+    Speculative summary of one unread email, with the tokens it used
+    """
+    gpt_service = GPTService()
+    result = await _summarize_one_email(GmailService(user['access_token']), gpt_service, user.get('email', ''),
+                                        email_id, max_length)
+    
+    # No estimate means a near-duplicate was reused without an LLM call
+    estimate = gpt_service.last_call_estimate or {}
+    result["tokens_used"] = (estimate.get("prompt_tokens_actual", estimate.get("prompt_tokens", 0))
+                             + estimate.get("completion_tokens", estimate.get("max_completion_tokens", 0)))
+    return result
+
+summary_precomputer.set_summarizer(_precompute_email_summary)
+
+@router.get("/precompute/stats")
+async def get_precompute_stats(current_user: dict = Depends(get_current_user)):
+    """
+    Speculative summarization counters for this worker
+    """
+    return summary_precomputer.stats()
+
+@router.get("/dedup/stats")
+async def get_dedup_stats(current_user: dict = Depends(get_current_user)):
+    """
+    Near-duplicate summary reuse counters for this worker
+    """
+    return near_duplicate_index.stats()
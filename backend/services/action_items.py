@@ -0,0 +1,130 @@
+import re
+from typing import Dict, List, Optional
+
+from services.text_reducer import reduce_email_text
+
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+
+IMPERATIVE_VERBS = (
+    "send|review|confirm|schedule|update|share|call|submit|complete|prepare|sign|approve|book|fill out|fill in|"
+    "check|follow up|reply|respond|provide|forward|attach|upload|finalize|set up|arrange|let me know|let us know|"
+    "get back to|reach out|join|register|pay|renew|read|rsvp"
+)
+
+# "Please send ...", "Send me ...", "Kindly review ..."
+IMPERATIVE = re.compile(r'^(?:please\s+|kindly\s+|pls\s+)?(?:' + IMPERATIVE_VERBS + r')\b', re.IGNORECASE)
+PLEASE_REQUEST = re.compile(r'\b(?:please|kindly)\s+(?:' + IMPERATIVE_VERBS + r')\b', re.IGNORECASE)
+
+# "Can you ...", "You need to ...", "Make sure ..."
+MODAL_REQUEST = re.compile(
+    r'\b(?:can|could|would|will)\s+you\b|\byou\s+(?:need|have|must|should)\s+to\b|\byou\s+(?:must|should)\b|'
+    r'\b(?:make sure|don\'t forget|do not forget|remember to|i need you to|we need you to|action required|'
+    r'it would be great if you|i\'d appreciate it if you)\b',
+    re.IGNORECASE
+)
+
+WEEKDAY = r'(?:mon|tues|wednes|thurs|fri|satur|sun)day'
+MONTH = r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?'
+DEADLINE = re.compile(
+    r'\b(?:(?:by|before|until|no later than|due(?: on| by)?)\s+(?:(?:this|next|end of)\s+)?'
+    r'(?:' + WEEKDAY + r'|tomorrow|tonight|today|noon|eod|eow|cob|end of (?:the )?(?:day|week|month)|'
+    + MONTH + r'\s+\d{1,2}(?:st|nd|rd|th)?|\d{1,2}(?:st|nd|rd|th)?(?:\s+of)?\s+' + MONTH + r'|'
+    r'\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?|\d{1,2}(?::\d{2})?\s*(?:am|pm)|the \d{1,2}(?:st|nd|rd|th))'
+    r'|asap|as soon as possible|end of day|deadline\b[^.?!]{0,40})',
+    re.IGNORECASE
+)
+
+# Questions to the recipient rather than rhetorical or quoted ones
+DIRECT_QUESTION = re.compile(r'\b(?:you|your)\b[^?]*\?|^(?:do|does|did|are|is|have|has|when|what|where|which|who|how)\b[^?]*\?$', re.IGNORECASE)
+
+# Hedged language that makes a sentence ambiguous for the rules
+SOFT_SIGNAL = re.compile(r'\b(?:maybe|perhaps|might|if possible|at some point|thoughts\?|wondering|not sure|should we|shall we)\b', re.IGNORECASE)
+
+# Automated mail rarely contains real requests
+NO_ACTION_HINT = re.compile(r'\b(?:unsubscribe|no action (?:is )?required|do not reply|this is an automated)\b', re.IGNORECASE)
+
+BASE_CONFIDENCE = {
+    "imperative": 0.8,
+    "request": 0.75,
+    "question": 0.7,
+    "deadline": 0.65
+}
+
+# Candidates between these bounds are handed to the model
+AMBIGUOUS_LOW = 0.45
+AMBIGUOUS_HIGH = 0.7
+
+MAX_SENTENCE_LENGTH = 300
+
+def extract_action_items(text: str, already_reduced: bool = False) -> Dict:
+    """
+    Find candidate action items in an email body in a single pass over its
+    sentences. Returns the items, an overall confidence and whether the
+    email is ambiguous enough to be worth sending to the model.
+    """
+    if not already_reduced:
+        text, _ = reduce_email_text(text)
+
+    items: List[Dict] = []
+    soft_signals = 0
+    automated = bool(NO_ACTION_HINT.search(text))
+
+    for sentence in SENTENCE_SPLIT.split(text):
+        sentence = sentence.strip(" \t-*•")
+        if len(sentence) < 4 or len(sentence) > MAX_SENTENCE_LENGTH:
+            continue
+
+        deadline_match = DEADLINE.search(sentence)
+        item_type: Optional[str] = None
+
+        if IMPERATIVE.search(sentence) or PLEASE_REQUEST.search(sentence):
+            item_type = "imperative"
+        elif MODAL_REQUEST.search(sentence):
+            item_type = "request"
+        elif sentence.endswith("?") and DIRECT_QUESTION.search(sentence):
+            item_type = "question"
+        elif deadline_match:
+            item_type = "deadline"
+
+        if SOFT_SIGNAL.search(sentence):
+            soft_signals += 1
+
+        if not item_type:
+            continue
+
+        confidence = BASE_CONFIDENCE[item_type]
+        if deadline_match and item_type != "deadline":
+            confidence += 0.15
+        if SOFT_SIGNAL.search(sentence):
+            confidence -= 0.2
+        if automated:
+            confidence -= 0.3
+
+        items.append({
+            "task": sentence,
+            "type": item_type,
+            "deadline": deadline_match.group(0) if deadline_match else None,
+            "confidence": round(max(0.0, min(confidence, 0.95)), 2)
+        })
+
+    if items:
+        overall = max(item["confidence"] for item in items)
+    else:
+        overall = 0.5 if soft_signals else 0.85
+
+    ambiguous = (
+        any(AMBIGUOUS_LOW <= item["confidence"] < AMBIGUOUS_HIGH for item in items)
+        or (not items and soft_signals > 0)
+    )
+
+    return {
+        "action_items": items,
+        "confidence": round(overall, 2),
+        "ambiguous": ambiguous
+    }
+
+def extract_action_items_batch(texts: List[str]) -> List[Dict]:
+    """
+    Run the rule-based extractor over many emails, e.g. an inbox page
+    """
+    return [extract_action_items(text) for text in texts]
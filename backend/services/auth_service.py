@@ -1,31 +1,78 @@
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import Optional, Dict
+import asyncio
+import hmac
+import time
+
+from config import JWT_SECRET_KEY, JWT_ALGORITHM, SESSION_TTL_SECONDS, SESSION_TOKENS_ENABLED
+from services.session_store import create_session_store
+from services.token_refresher import TokenRefresher
 
 security = HTTPBearer()
 
-# In-memory storage for demo purposes
-# In production, use a proper database and JWT tokens
-user_sessions = {}
+# Shared by every request on this worker; backed by a store all workers see
+session_store = create_session_store()
+token_refresher = TokenRefresher(session_store)
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
+def create_session_token(session: Dict) -> Optional[str]:
     """
-    Dependency to get current authenticated user from token
+    Signed session token for a session just stored at login, accepted as a
+    bearer token in place of the Google access token until the user logs
+    out or in again. None when no JWT_SECRET_KEY is configured.
     """
-    try:
-        token = credentials.credentials
+    if not SESSION_TOKENS_ENABLED:
+        return None
+    
+    from jose import jwt
+    
+    payload = {
+        "sub": session["email"],
+        "name": session["user_info"].get("name", ""),
+        "jti": session["session_id"],
+        "exp": int(time.time() + SESSION_TTL_SECONDS)
+    }
+    return jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+def _session_for_token(token: str) -> Optional[Dict]:
+    # Session tokens are JWTs (three dot-separated parts); Google access tokens are opaque
+    if token.count(".") == 2:
+        if not SESSION_TOKENS_ENABLED:
+            return None
         
-        # In this demo, we'll import the user_tokens from auth.py
-        # In production, you'd validate JWT tokens or query a database
-        from routes.auth import user_tokens
+        from jose import jwt, JWTError
         
-        # Find user by access token
-        for email, data in user_tokens.items():
-            if data.get('access_token') == token:
-                # Add the access token to user info for services
-                user_info = data['user_info'].copy()
-                user_info['access_token'] = token
-                return user_info
+        try:
+            claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+        except JWTError:
+            return None
+        
+        # Only the login that issued the token; a later login or a logout ends it
+        session = session_store.get(claims.get("sub", ""))
+        if session and session.get("session_id") and hmac.compare_digest(session["session_id"], str(claims.get("jti", ""))):
+            return session
+        return None
+    
+    return session_store.find_by_access_token(token)
+
+def session_user(session: Dict) -> Dict:
+    """
+    User info plus the current Google access token, as handed to routes
+    """
+    user_info = session['user_info'].copy()
+    user_info['access_token'] = session['access_token']
+    return user_info
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict:
+    """
+    Dependency to get current authenticated user from a session token or
+    Google access token. The Google token handed on is refreshed first if
+    the background refresher has not got to it.
+    """
+    try:
+        session = await asyncio.to_thread(_session_for_token, credentials.credentials)
+        if session:
+            return session_user(await token_refresher.ensure_fresh(session))
         
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -40,7 +87,7 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[Dict]:
+async def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)) -> Optional[Dict]:
     """
     Optional user dependency for endpoints that work with or without authentication
     """
@@ -48,7 +95,7 @@ def get_optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depe
         return None
     
     try:
-        return get_current_user(credentials)
+        return await get_current_user(credentials)
     except HTTPException:
         return None
 
@@ -72,48 +119,3 @@ def validate_email_access(email_id: str, current_user: Dict = Depends(get_curren
     # In a real application, you'd verify that the email belongs to the user
     # For now, we'll assume all authenticated users can access their own emails
     return True
-
-class AuthService:
-    """
-    Service class for handling authentication-related operations
-    """
-    
-    @staticmethod
-    def create_session(user_info: Dict, access_token: str) -> str:
-        """
-        Create a user session and return session ID
-        """
-        session_id = f"session_{user_info['email']}_{len(user_sessions)}"
-        user_sessions[session_id] = {
-            "user_info": user_info,
-            "access_token": access_token,
-            "created_at": "2025-01-01T00:00:00Z"  # In real app, use current timestamp
-        }
-        return session_id
-    
-    @staticmethod
-    def get_session(session_id: str) -> Optional[Dict]:
-        """
-        Get session data by session ID
-        """
-        return user_sessions.get(session_id)
-    
-    @staticmethod
-    def invalidate_session(session_id: str) -> bool:
-        """
-        Invalidate a user session
-        """
-        if session_id in user_sessions:
-            del user_sessions[session_id]
-            return True
-        return False
-    
-    @staticmethod
-    def refresh_session(session_id: str, new_access_token: str) -> bool:
-        """
-        Refresh session with new access token
-        """
-        if session_id in user_sessions:
-            user_sessions[session_id]['access_token'] = new_access_token
-            return True
-        return False
@@ -0,0 +1,143 @@
+import asyncio
+import gzip
+import logging
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from config import COMPRESSION_MIN_BYTES
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:  # brotli is optional; responses are gzipped without it
+        brotli = None
+
+# Dynamic responses: fast settings beat the last few percent of size
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 6
+
+# Bodies above this are compressed off the event loop
+OFFLOAD_BYTES = 256 * 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/plain", "text/csv", "application/javascript")
+
+# Appended to the ETag of a compressed response, so every representation keeps its own strong validator
+ENCODING_SUFFIXES = {"br": "-br", "gzip": "-gzip"}
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    The supported content coding the client weights highest in
+    Accept-Encoding (brotli on a tie), or None for identity
+    """
+    supported = ["br", "gzip"] if brotli is not None else ["gzip"]
+    weights = {}
+    wildcard = None
+
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        if coding == "*":
+            wildcard = weight
+        elif coding:
+            weights[coding] = weight
+
+    best, best_weight = None, 0.0
+    for coding in supported:
+        weight = weights.get(coding, wildcard if wildcard is not None else 0.0)
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+def strip_encoding_suffix(etag: str) -> str:
+    """
+    The identity ETag for one set by this middleware on a compressed response
+    """
+    for suffix in ENCODING_SUFFIXES.values():
+        if etag.endswith(suffix + '"'):
+            return etag[:-len(suffix) - 1] + '"'
+    return etag
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware compressing complete response bodies of at least
+    minimum_size bytes with brotli or gzip, as negotiated per request.
+    Streamed responses (server-sent events, streamed summaries) and
+    bodies that are already encoded pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "decided": False}
+
+        async def send_wrapper(message):
+            if state["decided"]:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+
+            # First body message: compress only if it is the whole body
+            state["decided"] = True
+            start = state["start"]
+            body = message.get("body", b"")
+            if message.get("more_body", False) or not self._compressible(start, body):
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) > OFFLOAD_BYTES:
+                compressed = await asyncio.to_thread(compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+
+            headers = MutableHeaders(raw=list(start["headers"]))
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and etag.endswith('"'):
+                headers["ETag"] = etag[:-1] + ENCODING_SUFFIXES[encoding] + '"'
+
+            await send(dict(start, headers=headers.raw))
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _compressible(self, start, body: bytes) -> bool:
+        if len(body) < self.minimum_size or start["status"] < 200 or start["status"] in (204, 304):
+            return False
+        headers = Headers(raw=start["headers"])
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return content_type in COMPRESSIBLE_TYPES
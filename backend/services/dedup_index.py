@@ -0,0 +1,151 @@
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from config import DEDUP_INDEX_MAX_ENTRIES
+from services.metrics import CACHE_LOOKUPS
+
+# Values that differ between otherwise identical templated emails
+VARIABLE_TOKEN = re.compile(
+    r'\b\d{1,4}[/-]\d{1,2}[/-]\d{1,4}\b|\b\d{1,2}:\d{2}(?:\s*[ap]m)?\b|[$€£]?\d[\d,]*(?:\.\d+)?%?',
+    re.IGNORECASE
+)
+
+def normalize(text: str) -> str:
+    """
+    Lowercase and mask numbers and dates so templated mail normalizes alike
+    """
+    return VARIABLE_TOKEN.sub("#", text.lower())
+
+def template_key(text: str) -> str:
+    """
+    Hash of the normalized text, shared by templated emails that differ only
+    in their numbers and dates
+    """
+    masked = " ".join(normalize(text).split())
+    return hashlib.blake2b(masked.encode("utf-8"), digest_size=16).hexdigest()
+
+def same_template(old_text: str, new_text: str) -> bool:
+    """
+    Whether two texts are identical once numbers and dates are masked, so
+    that every token that differs between them is a variable token
+    """
+    return normalize(old_text).split() == normalize(new_text).split()
+
+def patch_summary(summary: Dict, old_text: str, new_text: str) -> Optional[Dict]:
+    """
+    Carry a summary over to a near-duplicate by swapping the numbers and
+    dates that differ between the two texts. Returns None when any other
+    word differs ("approved" vs "rejected"), or when the variable values
+    cannot be aligned one-to-one.
+    """
+    if not same_template(old_text, new_text):
+        return None
+
+    old_values = VARIABLE_TOKEN.findall(old_text)
+    new_values = VARIABLE_TOKEN.findall(new_text)
+    if len(old_values) != len(new_values):
+        return None
+
+    replacements = {}
+    for old, new in zip(old_values, new_values):
+        if old == new:
+            continue
+        if replacements.get(old, new) != new:
+            return None
+        replacements[old] = new
+
+    if not replacements:
+        return dict(summary)
+
+    pattern = re.compile(r'(?<![\w.,])(?:' + "|".join(re.escape(old) for old in sorted(replacements, key=len, reverse=True)) + r')(?![\w])')
+
+    def substitute(text: str) -> str:
+        return pattern.sub(lambda match: replacements[match.group(0)], text)
+
+    return {
+        **summary,
+        "summary": substitute(summary["summary"]),
+        "key_points": [substitute(point) for point in summary.get("key_points", [])]
+    }
+
+class NearDuplicateIndex:
+    """
+    Per-user index of summarized email content, keyed on the template key
+    and summary length. Only texts that are identical once numbers and
+    dates are masked can share a summary, so an exact key match is the
+    whole candidate search.
+    """
+
+    def __init__(self, max_entries: int = DEDUP_INDEX_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[str, OrderedDict] = {}
+        self._stats = {"lookups": 0, "hits": 0, "exact_hits": 0, "patched_hits": 0, "patch_failures": 0}
+
+    def lookup(self, user: str, text: str, max_length: int) -> Optional[Dict]:
+        """
+        Return a reusable summary for text if a near-duplicate has been summarized
+        """
+        summary = self._lookup(user, text, max_length)
+        CACHE_LOOKUPS.labels("near_duplicate", "miss" if summary is None else "hit").inc()
+        return summary
+
+    def _lookup(self, user: str, text: str, max_length: int) -> Optional[Dict]:
+        key = (template_key(text), max_length)
+
+        with self._lock:
+            self._stats["lookups"] += 1
+            entries = self._entries.get(user)
+            entry = entries.get(key) if entries else None
+            if entry is None:
+                return None
+
+            entries.move_to_end(key)
+            if entry["text"] == text:
+                self._stats["hits"] += 1
+                self._stats["exact_hits"] += 1
+                return dict(entry["summary"])
+
+        patched = patch_summary(entry["summary"], entry["text"], text)
+
+        with self._lock:
+            if patched is None:
+                self._stats["patch_failures"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._stats["patched_hits"] += 1
+            return patched
+
+    def add(self, user: str, text: str, max_length: int, summary: Dict) -> None:
+        """
+        Index a freshly computed summary
+        """
+        key = (template_key(text), max_length)
+
+        with self._lock:
+            entries = self._entries.setdefault(user, OrderedDict())
+            entries[key] = {
+                "text": text,
+                "summary": {"summary": summary["summary"], "key_points": list(summary.get("key_points", []))}
+            }
+            entries.move_to_end(key)
+
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """
+        Lookup and hit counters across all users
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+            stats["users"] = len(self._entries)
+            stats["entries"] = sum(len(entries) for entries in self._entries.values())
+            return stats
+
+# Shared by every request on this worker
+near_duplicate_index = NearDuplicateIndex()
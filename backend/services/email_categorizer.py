@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from config import CATEGORIZE_MAX_BATCH, CATEGORY_CACHE_MAX_ENTRIES
+from services.gpt_handler import GPTService
+from services.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("action_needed", "meeting", "fyi", "newsletter", "personal", "promotional", "notification")
+
+# Used for model answers outside CATEGORIES
+DEFAULT_CATEGORY = "fyi"
+
+AUTOMATED_SENDER = re.compile(r"(no-?reply|do-?not-?reply|notifications?|mailer-daemon|bounce)", re.IGNORECASE)
+BULK_LABELS = ("CATEGORY_PROMOTIONS", "CATEGORY_SOCIAL", "CATEGORY_UPDATES", "CATEGORY_FORUMS")
+
+# Characters of the Gmail snippet sent to the model per email
+PREVIEW_CHARS = 300
+
+def classify_locally(email: Dict) -> Optional[str]:
+    """
+    Category for obvious cases from headers and Gmail labels alone, or None
+    when the model has to decide
+    """
+    labels = email.get('label_ids') or []
+
+    if 'CATEGORY_PROMOTIONS' in labels:
+        return "promotional"
+    if email.get('list_unsubscribe') or 'CATEGORY_FORUMS' in labels:
+        return "newsletter"
+    if AUTOMATED_SENDER.search(email.get('sender') or ''):
+        return "notification"
+    if 'CATEGORY_SOCIAL' in labels or 'CATEGORY_UPDATES' in labels:
+        return "notification"
+    return None
+
+def normalize_category(value: str) -> str:
+    category = re.sub(r"[\s-]+", "_", str(value).strip().lower())
+    return category if category in CATEGORIES else DEFAULT_CATEGORY
+
+class EmailCategorizer:
+    """
+    Labels a page of inbox rows with one of CATEGORIES. Cached and locally
+    classified rows cost nothing; the rest of the page goes to the model in
+    a single batched call. Results are cached per user and message id.
+    """
+
+    def __init__(self, max_entries: int = CATEGORY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "local": 0, "model": 0, "model_calls": 0, "model_failures": 0}
+
+    def get(self, user: str, message_id: str) -> Optional[str]:
+        with self._lock:
+            self._stats["lookups"] += 1
+            category = self._cache.get((user, message_id))
+            if category is not None:
+                self._stats["hits"] += 1
+                self._cache.move_to_end((user, message_id))
+
+        CACHE_LOOKUPS.labels("category", "miss" if category is None else "hit").inc()
+        return category
+
+    def put(self, user: str, message_id: str, category: str) -> None:
+        with self._lock:
+            self._cache[(user, message_id)] = category
+            self._cache.move_to_end((user, message_id))
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    async def categorize(self, user: str, emails: List[Dict],
+                         gpt_service: Optional[GPTService] = None) -> Dict[str, Optional[str]]:
+        """
+        Category per message id; None where the model call failed
+        """
+        categories: Dict[str, Optional[str]] = {}
+        undecided = []
+
+        for email in emails:
+            category = self.get(user, email['id'])
+            if category is None:
+                category = classify_locally(email)
+                if category is not None:
+                    self._count("local")
+                    self.put(user, email['id'], category)
+            if category is None:
+                undecided.append(email)
+            categories[email['id']] = category
+
+        if undecided:
+            gpt_service = gpt_service or GPTService()
+
+            chunks = [undecided[i:i + CATEGORIZE_MAX_BATCH] for i in range(0, len(undecided), CATEGORIZE_MAX_BATCH)]
+            results = await asyncio.gather(*(self._categorize_with_model(gpt_service, chunk) for chunk in chunks),
+                                           return_exceptions=True)
+
+            for chunk, result in zip(chunks, results):
+                if isinstance(result, Exception):
+                    self._count("model_failures")
+                    logger.warning(f"⚠️ Categorization of {len(chunk)} emails failed: {result}")
+                    continue
+                for email, category in zip(chunk, result):
+                    categories[email['id']] = category
+                    self.put(user, email['id'], category)
+
+        return categories
+
+    async def _categorize_with_model(self, gpt_service: GPTService, emails: List[Dict]) -> List[str]:
+        texts = [
+            f"From: {email.get('sender', '')}\nSubject: {email.get('subject', '')}\n"
+            f"Preview: {(email.get('snippet') or '')[:PREVIEW_CHARS]}"
+            for email in emails
+        ]
+        self._count("model_calls")
+        results = await gpt_service.categorize_emails_batch(texts)
+        self._count("model", len(emails))
+        return [normalize_category(result) for result in results]
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[counter] += amount
+
+    def stats(self) -> Dict:
+        """
+        Cache and classification counters across all users
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["hit_rate"] = round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0
+            stats["entries"] = len(self._cache)
+            return stats
+
+# Shared by every request on this worker
+email_categorizer = EmailCategorizer()
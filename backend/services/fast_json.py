@@ -0,0 +1,29 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson ships in requirements.txt; local runs without it fall back to compact stdlib json
+    orjson = None
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize plain JSON types (dicts, lists, str, int, float, bool, None)
+    to UTF-8 bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response for payloads the route has already built from trusted
+    data. Returning one skips FastAPI's response_model validation and
+    jsonable_encoder pass, so content must hold plain JSON types only and
+    match the declared response_model, which still documents the route.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,39 +1,97 @@
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import base64
 import email
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import List, Dict, Optional
-import html2text
 from datetime import datetime, timezone
 import re
 
+from services.resilience import gmail_upstream
+from services.upstream_clients import upstream_clients
+
 class GmailService:
     def __init__(self, access_token: str):
+        # The Google client libraries are slow to import; loaded on first use
+        # (or by the post-startup warm-up) to keep cold starts short
+        from google.oauth2.credentials import Credentials
+        import html2text
+        
         self.credentials = Credentials(token=access_token)
-        self.service = build('gmail', 'v1', credentials=self.credentials)
+        # Built from the shared discovery document, sending through the worker's connection pool
+        self.service = upstream_clients.gmail_service(self.credentials)
         self.html_converter = html2text.HTML2Text()
         self.html_converter.ignore_links = True
         self.html_converter.ignore_images = True
     
-    def get_emails(self, max_results: int = 10, query: Optional[str] = None) -> List[Dict]:
+    def _execute(self, request, idempotent: bool = True):
+        """
+        Execute a Gmail API request through the shared resilience layer.
+        Non-idempotent requests are not retried, and nothing is started once
+        the current request has passed its deadline or been abandoned.
+        """
+        return gmail_upstream.call_sync(request.execute, retry=idempotent)
+    
+    def list_messages(self, max_results: int = 10, query: Optional[str] = None) -> List[Dict]:
         """
-        Fetch emails from Gmail inbox
+        Ids and thread ids of the newest messages matching query, without their contents
         """
         try:
             # Build query
             search_query = query if query else 'in:inbox'
             
             # Get list of messages
-            results = self.service.users().messages().list(
+            results = self._execute(self.service.users().messages().list(
                 userId='me',
                 q=search_query,
                 maxResults=max_results
-            ).execute()
+            ))
+            
+            return results.get('messages', [])
             
-            messages = results.get('messages', [])
+        except HttpError as error:
+            raise Exception(f"Gmail API error: {error}")
+        except Exception as e:
+            raise Exception(f"Failed to list emails: {str(e)}")
+    
+    def get_changes_since(self, start_history_id: str) -> Optional[Dict[str, int]]:
+        """
+        Latest history id of every message changed after start_history_id,
+        from one page of users.history. None when Gmail no longer keeps
+        history that far back, rejects the id, or there is more than a page
+        of it.
+        """
+        try:
+            results = self._execute(self.service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                maxResults=500
+            ))
+            
+        except HttpError as error:
+            # 404: expired; 400: not a history id Gmail issued for this mailbox
+            if error.resp.status in (400, 404):
+                return None
+            raise Exception(f"Gmail API error: {error}")
+        
+        if results.get('nextPageToken'):
+            return None
+        
+        changes = {}
+        for record in results.get('history', []):
+            for message in record.get('messages', []):
+                changes[message['id']] = max(changes.get(message['id'], 0), int(record['id']))
+        return changes
+    
+    def get_emails(self, max_results: int = 10, query: Optional[str] = None,
+                   messages: Optional[List[Dict]] = None) -> List[Dict]:
+        """
+        Fetch emails from Gmail inbox. messages is a listing already fetched
+        with list_messages, to fetch the rows of instead of listing again.
+        """
+        try:
+            if messages is None:
+                messages = self.list_messages(max_results, query)
             emails = []
             
             for message in messages:
@@ -53,11 +111,11 @@ class GmailService:
         Get detailed information about a specific email
         """
         try:
-            message = self.service.users().messages().get(
+            message = self._execute(self.service.users().messages().get(
                 userId='me',
                 id=email_id,
                 format='full'
-            ).execute()
+            ))
             
             return self._parse_email_detail(message)
             
@@ -66,16 +124,49 @@ class GmailService:
         except Exception as e:
             raise Exception(f"Failed to fetch email detail: {str(e)}")
     
+    def get_message_version(self, email_id: str) -> Dict:
+        """
+        History id and labels of a message, without its contents. Messages
+        are immutable apart from their labels, so these identify its state.
+        """
+        try:
+            message = self._execute(self.service.users().messages().get(
+                userId='me',
+                id=email_id,
+                format='minimal'
+            ))
+            
+            return self._version(message)
+            
+        except HttpError as error:
+            raise Exception(f"Gmail API error: {error}")
+    
+    def get_thread_versions(self, thread_id: str) -> List[Dict]:
+        """
+        get_message_version for every message in a thread, in one call
+        """
+        try:
+            thread = self._execute(self.service.users().threads().get(
+                userId='me',
+                id=thread_id,
+                format='minimal'
+            ))
+            
+            return [self._version(message) for message in thread.get('messages', [])]
+            
+        except HttpError as error:
+            raise Exception(f"Gmail API error: {error}")
+    
     def get_thread_emails(self, thread_id: str) -> List[Dict]:
         """
         Get all emails in a thread
         """
         try:
-            thread = self.service.users().threads().get(
+            thread = self._execute(self.service.users().threads().get(
                 userId='me',
                 id=thread_id,
                 format='full'
-            ).execute()
+            ))
             
             emails = []
             for message in thread.get('messages', []):
@@ -106,11 +197,11 @@ class GmailService:
             
             # If this is a reply, add necessary headers
             if reply_to_id:
-                original_message = self.service.users().messages().get(
+                original_message = self._execute(self.service.users().messages().get(
                     userId='me',
                     id=reply_to_id,
                     format='full'
-                ).execute()
+                ))
                 
                 # Add reply headers
                 headers = original_message.get('payload', {}).get('headers', [])
@@ -125,10 +216,10 @@ class GmailService:
             raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
             
             # Send message
-            result = self.service.users().messages().send(
+            result = self._execute(self.service.users().messages().send(
                 userId='me',
                 body={'raw': raw_message}
-            ).execute()
+            ), idempotent=False)
             
             return result
             
@@ -142,11 +233,11 @@ class GmailService:
         Mark an email as read
         """
         try:
-            self.service.users().messages().modify(
+            self._execute(self.service.users().messages().modify(
                 userId='me',
                 id=email_id,
                 body={'removeLabelIds': ['UNREAD']}
-            ).execute()
+            ))
             
             return True
             
@@ -160,17 +251,19 @@ class GmailService:
         Get basic email data for list view
         """
         try:
-            message = self.service.users().messages().get(
+            message = self._execute(self.service.users().messages().get(
                 userId='me',
                 id=message_id,
                 format='metadata',
-                metadataHeaders=['From', 'Subject', 'Date']
-            ).execute()
+                metadataHeaders=['From', 'To', 'Subject', 'Date', 'List-Unsubscribe']
+            ))
             
             headers = message.get('payload', {}).get('headers', [])
             
             # Extract header information
             sender = next((h['value'] for h in headers if h['name'].lower() == 'from'), 'Unknown')
+            recipient = next((h['value'] for h in headers if h['name'].lower() == 'to'), '')
+            list_unsubscribe = any(h['name'].lower() == 'list-unsubscribe' for h in headers)
             subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'No Subject')
             date = next((h['value'] for h in headers if h['name'].lower() == 'date'), '')
             
@@ -185,13 +278,25 @@ class GmailService:
                 'subject': subject,
                 'date': self._parse_date(date),
                 'snippet': message.get('snippet', ''),
-                'is_read': is_read
+                'is_read': is_read,
+                'recipient': recipient,
+                'label_ids': label_ids,
+                'history_id': message.get('historyId', ''),
+                'list_unsubscribe': list_unsubscribe
             }
             
         except Exception as e:
             print(f"Error processing email {message_id}: {str(e)}")
             return None
     
+    @staticmethod
+    def _version(message: Dict) -> Dict:
+        return {
+            'id': message['id'],
+            'history_id': message.get('historyId', ''),
+            'label_ids': message.get('labelIds', [])
+        }
+    
     def _parse_email_detail(self, message: Dict) -> Dict:
         """
         Parse detailed email information
@@ -220,7 +325,9 @@ class GmailService:
                 'subject': subject,
                 'date': self._parse_date(date),
                 'body': body,
-                'is_read': is_read
+                'is_read': is_read,
+                'label_ids': label_ids,
+                'history_id': message.get('historyId', '')
             }
             
         except Exception as e:
@@ -1,45 +1,132 @@
-import openai
-from typing import Dict, List, Optional
-import json
+from typing import AsyncIterator, Dict, List, Optional
 import asyncio
 import logging
-import os
+import time
 
-from config import OPENAI_API_KEY
+from config import (
+    OPENAI_API_KEY,
+    MICRO_BATCH_ENABLED,
+    MICRO_BATCH_WINDOW_MS,
+    MICRO_BATCH_MAX_SIZE,
+    MICRO_BATCH_MAX_CHARS,
+    OPENAI_JSON_MODE_MODELS,
+    OPENAI_TIMEOUT_SECONDS,
+    HEDGE_OPERATIONS,
+    THREAD_CHUNK_TOKEN_BUDGET,
+    THREAD_MAP_CONCURRENCY,
+)
+
+from services.token_budget import (
+    TokenBudgeter,
+    count_tokens,
+    count_message_tokens,
+    estimate_cost,
+    truncate_words,
+    CHARS_PER_TOKEN,
+)
+from services.model_router import model_router
+from services.resilience import classify_error, openai_upstream
+from services.upstream_clients import upstream_clients
+from services.request_context import call_timeout, upstream_call_slot
+from services.action_items import extract_action_items as extract_local_action_items
+from services.micro_batcher import MicroBatcher
+from services.prompt_templates import render_prompt
+from services.metrics import LLM_REQUESTS, LLM_PROMPT_TOKENS, LLM_CACHED_PROMPT_TOKENS, LLM_COMPLETION_TOKENS, UPSTREAM_ERRORS
+from services.json_output import (
+    parse_model_json,
+    IncrementalJSONParser,
+    JSONOutputError,
+    SummaryOutput,
+    ToneOutput,
+    ToneBatchOutput,
+    ActionItemsBatchOutput,
+    CategoryBatchOutput,
+)
 
 logger = logging.getLogger(__name__)
 
+def chunk_thread_messages(messages: List[str], token_budget: int = THREAD_CHUNK_TOKEN_BUDGET) -> List[List[str]]:
+    """
+    Group thread messages into chunks that each fit within token_budget.
+    Messages are never reordered; a single message larger than the budget
+    is split on character boundaries into its own chunks.
+    """
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    current_tokens = 0
+    max_chars = token_budget * CHARS_PER_TOKEN
+    
+    for message in messages:
+        message_tokens = count_tokens(message)
+        
+        if message_tokens > token_budget:
+            if current:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            for start in range(0, len(message), max_chars):
+                chunks.append([message[start:start + max_chars]])
+            continue
+        
+        if current and current_tokens + message_tokens > token_budget:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        
+        current.append(message)
+        current_tokens += message_tokens
+    
+    if current:
+        chunks.append(current)
+    
+    return chunks
+
+# Worker-wide batchers for small requests, shared across users and requests
+_batchers: Dict[str, MicroBatcher] = {}
+
+def _get_batcher(operation: str) -> MicroBatcher:
+    if operation not in _batchers:
+        async def run_batch(items: List[tuple]) -> List:
+            service = items[0][0]
+            texts = [text for _, text in items]
+            if operation == "analyze_tone":
+                return await service._analyze_tone_batch(texts)
+            return await service._extract_action_items_batch(texts)
+        
+        _batchers[operation] = MicroBatcher(
+            name=operation,
+            batch_fn=run_batch,
+            window_ms=MICRO_BATCH_WINDOW_MS,
+            max_batch_size=MICRO_BATCH_MAX_SIZE
+        )
+    return _batchers[operation]
+
+def get_batcher_stats() -> List[Dict]:
+    """
+    Counters for every micro-batcher created on this worker
+    """
+    return [batcher.stats() for batcher in _batchers.values()]
+
+async def _resume_stream(first: List, stream) -> AsyncIterator:
+    """
+    Events of a stream whose first event was already read when opening it
+    """
+    for event in first:
+        yield event
+    async for event in stream:
+        yield event
+
 class GPTService:
     def __init__(self):
+        self.budgeter = TokenBudgeter()
+        self.last_call_estimate = None
         try:
             logger.info(f"🔑 OPENAI_API_KEY present: {bool(OPENAI_API_KEY)}")
-            logger.info(f"🔑 OPENAI_API_KEY length: {len(OPENAI_API_KEY) if OPENAI_API_KEY else 0}")
-            logger.info(f"🔑 OPENAI_API_KEY starts with: {OPENAI_API_KEY[:10] + '...' if OPENAI_API_KEY and len(OPENAI_API_KEY) > 10 else 'None'}")
             
             if not OPENAI_API_KEY:
                 logger.error("❌ OpenAI API key not provided")
                 self.client = None
             else:
-                # Clear any proxy environment variables that might interfere
-                proxy_vars = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']
-                original_proxies = {}
-                for var in proxy_vars:
-                    if var in os.environ:
-                        original_proxies[var] = os.environ[var]
-                        del os.environ[var]
-                        logger.info(f"🔧 Temporarily cleared proxy variable: {var}")
-                
-                try:
-                    # Initialize OpenAI client with minimal configuration
-                    self.client = openai.OpenAI(
-                        api_key=OPENAI_API_KEY,
-                        timeout=30.0
-                    )
-                    logger.info("✅ OpenAI client initialized successfully")
-                finally:
-                    # Restore proxy environment variables
-                    for var, value in original_proxies.items():
-                        os.environ[var] = value
+                # One client, and so one connection pool, per worker; see services/upstream_clients.py
+                self.client = upstream_clients.openai_client()
         except Exception as e:
             logger.error(f"❌ Failed to initialize OpenAI client: {e}")
             logger.error(f"❌ Error type: {type(e).__name__}")
@@ -57,92 +144,213 @@ class GPTService:
             }
             
         try:
-            prompt = f"""
-            You are an expert email assistant. Summarize the following email content in a clear, concise manner.
-            
-            Requirements:
-            - Maximum length: {max_length} words
-            - Extract 3-5 key points
-            - Maintain professional tone
-            - Focus on actionable items and important information
-            
-            Email Content:
-            {content}
-            
-            Provide the response in JSON format:
-            {{
-                "summary": "Brief summary of the email",
-                "key_points": ["point1", "point2", "point3"]
-            }}
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a helpful email summarization assistant. Always respond with valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
+            content = self.budgeter.fit(content, strategy="drop_quoted")
+            
+            response_content = await self._chat_completion(
+                operation="summarize_email",
+                json_mode=True,
+                messages=render_prompt("summarize_email", max_length=max_length, content=content),
                 max_tokens=500,
                 temperature=0.3
             )
             
-            result = json.loads(response.choices[0].message.content)
-            return result
+            try:
+                return parse_model_json(response_content, SummaryOutput)
+            except JSONOutputError:
+                # Fallback if JSON parsing fails
+                return {
+                    "summary": truncate_words(response_content, max_length),
+                    "key_points": ["Summary generation completed", "Please review the content"]
+                }
             
-        except json.JSONDecodeError:
-            # Fallback if JSON parsing fails
-            return {
-                "summary": response.choices[0].message.content[:max_length],
-                "key_points": ["Summary generation completed", "Please review the content"]
-            }
         except Exception as e:
             raise Exception(f"Failed to summarize email: {str(e)}")
     
+    async def stream_summarize_email(self, content: str, max_length: int = 150) -> AsyncIterator[Dict]:
+        """
+        Stream an email summary, yielding {"partial": {...}} as summary fields
+        fill in and a final {"result": {...}} once the output is complete
+        """
+        if not self.client:
+            raise Exception("OpenAI service not available")
+        
+        content = self.budgeter.fit(content, strategy="drop_quoted")
+        parser = IncrementalJSONParser()
+        async for chunk in self._stream_chat_completion(
+            operation="stream_summarize_email",
+            messages=render_prompt("summarize_email", max_length=max_length, content=content),
+            max_tokens=500,
+            temperature=0.3,
+            json_mode=True
+        ):
+            changed = parser.feed(chunk)
+            if changed:
+                yield {"partial": changed}
+        
+        try:
+            yield {"result": parser.result(SummaryOutput)}
+        except JSONOutputError:
+            yield {"result": {
+                "summary": truncate_words(parser.buffer, max_length),
+                "key_points": ["Summary generation completed", "Please review the content"]
+            }}
+    
     async def summarize_email_thread(self, thread_content: str, email_count: int, max_length: int = 200) -> Dict:
         """
         Summarize an entire email thread
         """
         try:
-            prompt = f"""
-            You are an expert email assistant. Summarize this email thread containing {email_count} emails.
-            
-            Requirements:
-            - Maximum length: {max_length} words
-            - Show conversation flow and key decisions
-            - Extract main topics and action items
-            - Identify key participants and their roles
-            
-            Thread Content:
-            {thread_content}
-            
-            Provide the response in JSON format:
-            {{
-                "summary": "Brief summary of the entire thread",
-                "key_points": ["point1", "point2", "point3", "point4", "point5"]
-            }}
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a helpful email thread summarization assistant. Always respond with valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
+            thread_content = self.budgeter.fit(thread_content, strategy="keep_latest_messages")
+            
+            content = await self._chat_completion(
+                operation="summarize_email_thread",
+                json_mode=True,
+                messages=render_prompt("summarize_email_thread", max_length=max_length, email_count=email_count, content=thread_content),
                 max_tokens=600,
                 temperature=0.3
             )
             
-            result = json.loads(response.choices[0].message.content)
-            return result
+            try:
+                return parse_model_json(content, SummaryOutput)
+            except JSONOutputError:
+                return {
+                    "summary": truncate_words(content, max_length),
+                    "key_points": ["Thread summary generated", "Multiple emails processed"]
+                }
             
-        except json.JSONDecodeError:
-            return {
-                "summary": response.choices[0].message.content[:max_length],
-                "key_points": ["Thread summary generated", "Multiple emails processed"]
-            }
         except Exception as e:
             raise Exception(f"Failed to summarize email thread: {str(e)}")
     
+    async def summarize_long_thread(self, messages: List[str], max_length: int = 200) -> Dict:
+        """
+        Summarize a thread that is too large for a single prompt using map-reduce:
+        chunk by message and token budget, summarize chunks concurrently, then
+        reduce the partial summaries into the final summary and key points.
+        """
+        chunks = chunk_thread_messages(messages)
+        logger.info(f"🧩 Map-reduce thread summary: {len(messages)} emails in {len(chunks)} chunks")
+        
+        semaphore = asyncio.Semaphore(THREAD_MAP_CONCURRENCY)
+        
+        async def summarize_chunk(index: int, chunk: List[str]) -> Dict:
+            async with semaphore:
+                return await self._summarize_thread_chunk(
+                    chunk_content="".join(chunk),
+                    chunk_number=index + 1,
+                    chunk_count=len(chunks)
+                )
+        
+        partials = await asyncio.gather(*(summarize_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+        
+        return await self._reduce_thread_summaries(list(partials), len(messages), max_length)
+    
+    async def merge_thread_summary(self, previous_summary: Dict, new_messages: List[str],
+                                   email_count: int, max_length: int = 200) -> Dict:
+        """
+        Fold newly arrived messages into an existing thread summary
+        """
+        try:
+            new_content = self.budgeter.fit("".join(new_messages), strategy="keep_latest_messages")
+            previous_points = "\n".join(f"- {point}" for point in previous_summary.get('key_points', []))
+            
+            content = await self._chat_completion(
+                operation="merge_thread_summary",
+                json_mode=True,
+                messages=render_prompt(
+                    "merge_thread_summary",
+                    max_length=max_length,
+                    email_count=email_count,
+                    new_count=len(new_messages),
+                    previous_summary=previous_summary.get('summary', ''),
+                    previous_points=previous_points,
+                    content=new_content
+                ),
+                max_tokens=600,
+                temperature=0.3
+            )
+            
+            try:
+                return parse_model_json(content, SummaryOutput)
+            except JSONOutputError:
+                return {
+                    "summary": truncate_words(content, max_length),
+                    "key_points": previous_summary.get('key_points', [])
+                }
+            
+        except Exception as e:
+            raise Exception(f"Failed to update thread summary: {str(e)}")
+    
+    async def _summarize_thread_chunk(self, chunk_content: str, chunk_number: int, chunk_count: int) -> Dict:
+        """
+        Map step: summarize one contiguous slice of a thread
+        """
+        try:
+            content = await self._chat_completion(
+                operation="summarize_thread_chunk",
+                json_mode=True,
+                messages=render_prompt(
+                    "summarize_thread_chunk",
+                    chunk_number=chunk_number,
+                    chunk_count=chunk_count,
+                    content=chunk_content
+                ),
+                max_tokens=400,
+                temperature=0.3
+            )
+            
+            try:
+                return parse_model_json(content, SummaryOutput)
+            except JSONOutputError:
+                return {"summary": content, "key_points": []}
+            
+        except Exception as e:
+            raise Exception(f"Failed to summarize thread part {chunk_number}: {str(e)}")
+    
+    async def _reduce_thread_summaries(self, partials: List[Dict], email_count: int, max_length: int) -> Dict:
+        """
+        Reduce step: merge partial summaries into one. If the partials are
+        themselves too large for one prompt, they are reduced hierarchically.
+        """
+        sections = []
+        for i, partial in enumerate(partials, 1):
+            points = "\n".join(f"- {point}" for point in partial.get('key_points', []))
+            sections.append(f"Part {i}:\n{partial.get('summary', '')}\n{points}\n\n")
+        
+        if len(sections) > 1 and count_tokens("".join(sections)) > THREAD_CHUNK_TOKEN_BUDGET:
+            groups = chunk_thread_messages(sections)
+            if len(groups) < len(sections):
+                partials = await asyncio.gather(*(
+                    self._summarize_thread_chunk("".join(group), i + 1, len(groups))
+                    for i, group in enumerate(groups)
+                ))
+                return await self._reduce_thread_summaries(list(partials), email_count, max_length)
+        
+        try:
+            content = await self._chat_completion(
+                operation="reduce_thread_summaries",
+                json_mode=True,
+                messages=render_prompt(
+                    "reduce_thread_summaries",
+                    max_length=max_length,
+                    email_count=email_count,
+                    content="".join(sections)
+                ),
+                max_tokens=600,
+                temperature=0.3
+            )
+            
+            try:
+                return parse_model_json(content, SummaryOutput)
+            except JSONOutputError:
+                key_points = [point for partial in partials for point in partial.get('key_points', [])]
+                return {
+                    "summary": truncate_words(content, max_length),
+                    "key_points": key_points[:5] or ["Thread summary generated", "Multiple emails processed"]
+                }
+            
+        except Exception as e:
+            raise Exception(f"Failed to combine thread summaries: {str(e)}")
+    
     async def generate_reply(self, original_email: str, tone: str, length: str, 
                            context: Optional[str] = None, custom_instructions: Optional[str] = None,
                            tone_config: Optional[Dict] = None) -> Dict:
@@ -164,38 +372,25 @@ class GPTService:
                 if 'keywords' in tone_config:
                     tone_instruction += f" Use appropriate language such as: {', '.join(tone_config['keywords'][:3])}"
             
+            original_email = self.budgeter.fit(original_email, strategy="drop_quoted")
+            
             context_text = f"\n\nAdditional Context: {context}" if context else ""
             custom_text = f"\n\nCustom Instructions: {custom_instructions}" if custom_instructions else ""
             
-            prompt = f"""
-            You are an intelligent email assistant. Generate a professional email reply to the following email.
-            
-            Instructions:
-            - {tone_instruction}
-            - {length_instructions[length]}
-            - Address the main points from the original email
-            - Be helpful and provide value
-            - Include appropriate greetings and closings
-            {context_text}
-            {custom_text}
-            
-            Original Email:
-            {original_email}
-            
-            Generate a reply that sounds natural and human-like. Do not include a subject line.
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": f"You are a helpful email writing assistant. Write professional emails in a {tone} tone."},
-                    {"role": "user", "content": prompt}
-                ],
+            response_content = await self._chat_completion(
+                operation="generate_reply",
+                messages=render_prompt(
+                    "generate_reply",
+                    tone_instruction=tone_instruction,
+                    length_instruction=length_instructions[length],
+                    extra=context_text + custom_text,
+                    content=original_email
+                ),
                 max_tokens=800,
                 temperature=0.4
             )
             
-            reply_content = response.choices[0].message.content.strip()
+            reply_content = response_content.strip()
             
             return {
                 "reply": reply_content,
@@ -216,31 +411,18 @@ class GPTService:
             if tone_config:
                 tone_instruction += f". {tone_config.get('description', '')}"
             
-            instruction_text = f"\n\nAdditional Instructions: {instructions}" if instructions else ""
-            
-            prompt = f"""
-            {tone_instruction}
-            
-            Keep the core message and main points, but adjust the language, style, and approach to match the requested tone.
-            {instruction_text}
+            original_reply = self.budgeter.fit(original_reply, strategy="head_tail")
             
-            Original Reply:
-            {original_reply}
-            
-            Provide the refined version:
-            """
+            instruction_text = f"\n\nAdditional Instructions: {instructions}" if instructions else ""
             
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": f"You are a helpful email editing assistant. Refine emails to match specific tones while maintaining the core message."},
-                    {"role": "user", "content": prompt}
-                ],
+            response_content = await self._chat_completion(
+                operation="refine_reply",
+                messages=render_prompt("refine_reply", tone_instruction=tone_instruction, extra=instruction_text, content=original_reply),
                 max_tokens=600,
                 temperature=0.3
             )
             
-            refined_content = response.choices[0].message.content.strip()
+            refined_content = response_content.strip()
             
             return {
                 "reply": refined_content,
@@ -252,81 +434,265 @@ class GPTService:
     
     async def analyze_tone(self, text: str) -> Dict:
         """
-        Analyze the tone of given text
+        Analyze the tone of given text. Short texts are micro-batched with
+        other tone checks arriving on this worker at the same time.
         """
+        if MICRO_BATCH_ENABLED and self.client and len(text) <= MICRO_BATCH_MAX_CHARS:
+            try:
+                return await _get_batcher("analyze_tone").submit((self, text))
+            except Exception:
+                pass
+        
+        return await self._analyze_tone_single(text)
+    
+    async def _analyze_tone_single(self, text: str) -> Dict:
         try:
-            prompt = f"""
-            Analyze the tone of the following text. Identify the primary tone and provide confidence scores.
-            
-            Text to analyze:
-            {text}
-            
-            Provide the response in JSON format:
-            {{
-                "primary_tone": "dominant tone (e.g., formal, friendly, urgent)",
-                "confidence": 0.85,
-                "tone_scores": {{
-                    "formal": 0.8,
-                    "friendly": 0.2,
-                    "professional": 0.9,
-                    "casual": 0.1,
-                    "urgent": 0.1
-                }},
-                "suggestions": ["suggestion1", "suggestion2"]
-            }}
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a tone analysis expert. Analyze text tone and provide detailed insights in JSON format."},
-                    {"role": "user", "content": prompt}
-                ],
+            text = self.budgeter.fit(text, strategy="head")
+            
+            response_content = await self._chat_completion(
+                operation="analyze_tone",
+                json_mode=True,
+                messages=render_prompt("analyze_tone", content=text),
                 max_tokens=300,
                 temperature=0.2
             )
             
-            result = json.loads(response.choices[0].message.content)
-            return result
+            try:
+                return parse_model_json(response_content, ToneOutput)
+            except JSONOutputError:
+                return {
+                    "primary_tone": "neutral",
+                    "confidence": 0.5,
+                    "tone_scores": {"neutral": 0.5},
+                    "suggestions": ["Unable to analyze tone accurately"]
+                }
             
-        except json.JSONDecodeError:
-            return {
-                "primary_tone": "neutral",
-                "confidence": 0.5,
-                "tone_scores": {"neutral": 0.5},
-                "suggestions": ["Unable to analyze tone accurately"]
-            }
         except Exception as e:
             raise Exception(f"Failed to analyze tone: {str(e)}")
     
     async def extract_action_items(self, email_content: str) -> List[str]:
         """
-        Extract action items from email content
+        Extract action items from email content. The rule-based extractor
+        answers unless the email is ambiguous; short emails that do need the
+        model are micro-batched like analyze_tone.
         """
+        local_result = extract_local_action_items(email_content)
+        if not local_result["ambiguous"] or not self.client:
+            return [item["task"] for item in local_result["action_items"]]
+        
+        if MICRO_BATCH_ENABLED and self.client and len(email_content) <= MICRO_BATCH_MAX_CHARS:
+            try:
+                return await _get_batcher("extract_action_items").submit((self, email_content))
+            except Exception:
+                pass
+        
+        return await self._extract_action_items_single(email_content)
+    
+    async def _extract_action_items_single(self, email_content: str) -> List[str]:
         try:
-            prompt = f"""
-            Extract action items and tasks from the following email content.
-            Focus on specific, actionable tasks that require follow-up.
-            
-            Email Content:
-            {email_content}
-            
-            List action items as a JSON array:
-            ["action1", "action2", "action3"]
-            """
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an action item extraction specialist. Extract clear, actionable tasks from email content."},
-                    {"role": "user", "content": prompt}
-                ],
+            email_content = self.budgeter.fit(email_content, strategy="drop_quoted")
+            
+            response_content = await self._chat_completion(
+                operation="extract_action_items",
+                json_mode=True,
+                messages=render_prompt("extract_action_items", content=email_content),
                 max_tokens=200,
                 temperature=0.2
             )
             
-            action_items = json.loads(response.choices[0].message.content)
-            return action_items if isinstance(action_items, list) else []
+            action_items = parse_model_json(response_content)
+            if isinstance(action_items, dict):
+                action_items = action_items.get("action_items", [])
+            return [str(item) for item in action_items] if isinstance(action_items, list) else []
             
-        except (json.JSONDecodeError, Exception):
+        except Exception:
             return ["Unable to extract action items"]
+    
+    async def _analyze_tone_batch(self, texts: List[str]) -> List[Dict]:
+        """
+        Analyze several short texts in one call, one result per text in order
+        """
+        if len(texts) == 1:
+            return [await self._analyze_tone_single(texts[0])]
+        
+        numbered = "\n\n".join(f"Text {i}:\n{text}" for i, text in enumerate(texts, 1))
+        response_content = await self._chat_completion(
+            operation="analyze_tone_batch",
+            json_mode=True,
+            messages=render_prompt("analyze_tone_batch", count=len(texts), content=numbered),
+            max_tokens=200 * len(texts),
+            temperature=0.2
+        )
+        
+        return parse_model_json(response_content, ToneBatchOutput)["results"]
+    
+    async def _extract_action_items_batch(self, texts: List[str]) -> List[List[str]]:
+        """
+        Extract action items from several short emails in one call
+        """
+        if len(texts) == 1:
+            return [await self._extract_action_items_single(texts[0])]
+        
+        numbered = "\n\n".join(f"Email {i}:\n{text}" for i, text in enumerate(texts, 1))
+        response_content = await self._chat_completion(
+            operation="extract_action_items_batch",
+            json_mode=True,
+            messages=render_prompt("extract_action_items_batch", count=len(texts), content=numbered),
+            max_tokens=120 * len(texts),
+            temperature=0.2
+        )
+        
+        return parse_model_json(response_content, ActionItemsBatchOutput)["results"]
+    
+    async def categorize_emails_batch(self, texts: List[str]) -> List[str]:
+        """
+        Categorize several emails (sender, subject and preview) in one call,
+        one category name per text in order
+        """
+        numbered = "\n\n".join(f"Email {i}:\n{text}" for i, text in enumerate(texts, 1))
+        response_content = await self._chat_completion(
+            operation="categorize_emails_batch",
+            json_mode=True,
+            messages=render_prompt("categorize_emails_batch", count=len(texts), content=numbered),
+            max_tokens=12 * len(texts) + 20,
+            temperature=0.0
+        )
+        
+        results = parse_model_json(response_content, CategoryBatchOutput)["results"]
+        if len(results) != len(texts):
+            raise JSONOutputError(f"Categorization returned {len(results)} results for {len(texts)} emails")
+        return results
+    
+    async def _chat_completion(self, operation: str, messages: List[Dict], max_tokens: int, temperature: float,
+                               model: Optional[str] = None, json_mode: bool = False) -> str:
+        """
+        Run a chat completion on the async client, bounded by the request
+        deadline and cancelled with the request. The model is picked by the model router unless given. The prompt is
+        measured before sending and the estimate is logged and kept on
+        last_call_estimate. With json_mode the model is constrained to emit a
+        JSON object when it supports it.
+        """
+        if not self.client:
+            raise Exception("OpenAI service not available")
+        
+        prompt_tokens = count_message_tokens(messages)
+        route_key = operation
+        if model is None:
+            model, route_key = model_router.select(operation, prompt_tokens)
+        
+        estimate = self.budgeter.estimate_call(messages, max_tokens, model)
+        estimate["operation"] = operation
+        if estimate["prompt_tokens"] > self.budgeter.max_input_tokens + 1000:
+            logger.warning(f"⚠️ {operation}: prompt of {estimate['prompt_tokens']} tokens exceeds the input budget")
+        
+        request_options = {}
+        if json_mode and model in OPENAI_JSON_MODE_MODELS:
+            request_options["response_format"] = {"type": "json_object"}
+        
+        started = time.monotonic()
+        response = await openai_upstream.call(
+            lambda: self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=call_timeout(OPENAI_TIMEOUT_SECONDS),
+                **request_options
+            ),
+            hedge=operation in HEDGE_OPERATIONS
+        )
+        latency = time.monotonic() - started
+        
+        cost = estimate["estimated_cost_usd"]
+        usage = getattr(response, "usage", None)
+        LLM_REQUESTS.labels(operation, model).inc()
+        if usage is not None:
+            estimate["prompt_tokens_actual"] = usage.prompt_tokens
+            estimate["completion_tokens"] = usage.completion_tokens
+            # Prompt prefix served from the provider's cache, when reported
+            details = getattr(usage, "prompt_tokens_details", None)
+            estimate["cached_prompt_tokens"] = getattr(details, "cached_tokens", None) or 0
+            cost = estimate_cost(model, usage.prompt_tokens, usage.completion_tokens)
+            self._count_tokens(operation, model, usage.prompt_tokens, usage.completion_tokens,
+                               estimate["cached_prompt_tokens"])
+        
+        estimate["latency_ms"] = round(latency * 1000, 1)
+        model_router.record(route_key, model, latency, cost)
+        
+        self.last_call_estimate = estimate
+        logger.info(
+            f"🧮 {operation}: model={model} prompt_tokens≈{estimate['prompt_tokens']} "
+            f"max_completion={max_tokens} est_cost≤${estimate['estimated_cost_usd']}"
+        )
+        
+        return response.choices[0].message.content
+    
+    async def _stream_chat_completion(self, operation: str, messages: List[Dict], max_tokens: int, temperature: float,
+                                      model: Optional[str] = None, json_mode: bool = False) -> AsyncIterator[str]:
+        """
+        Stream completion text deltas. Opening the stream goes through the
+        breaker and retry policy until the first chunk arrives; after that a
+        failure ends the stream, since the text sent so far cannot be taken
+        back. Closing the generator (e.g. when the client disconnects) closes
+        the upstream stream.
+        """
+        route_key = operation
+        if model is None:
+            model, route_key = model_router.select(operation, count_message_tokens(messages))
+        
+        request_options = {}
+        if json_mode and model in OPENAI_JSON_MODE_MODELS:
+            request_options["response_format"] = {"type": "json_object"}
+        
+        self.last_call_estimate = dict(self.budgeter.estimate_call(messages, max_tokens, model), operation=operation)
+        
+        async def open_stream():
+            stream = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                timeout=call_timeout(OPENAI_TIMEOUT_SECONDS),
+                **request_options
+            )
+            try:
+                return stream, [await stream.__anext__()]
+            except StopAsyncIteration:
+                return stream, []
+            except BaseException:
+                await stream.close()
+                raise
+        
+        started = time.monotonic()
+        with upstream_call_slot():
+            stream, first = await openai_upstream.call(open_stream)
+            
+            pieces = []
+            events = _resume_stream(first, stream)
+            try:
+                async for event in events:
+                    if event.choices and event.choices[0].delta.content:
+                        pieces.append(event.choices[0].delta.content)
+                        yield event.choices[0].delta.content
+            except Exception as e:
+                # Too late to retry, but still an upstream error
+                UPSTREAM_ERRORS.labels(openai_upstream.name, classify_error(e)).inc()
+                raise
+            finally:
+                # Closes the HTTP response if the consumer stops early
+                await events.aclose()
+                await stream.close()
+        
+        model_router.record(route_key, model, time.monotonic() - started, self.last_call_estimate["estimated_cost_usd"])
+        # Streams carry no usage block; count what was sent and received locally
+        LLM_REQUESTS.labels(operation, model).inc()
+        self._count_tokens(operation, model, self.last_call_estimate["prompt_tokens"], count_tokens("".join(pieces)))
+    
+    @staticmethod
+    def _count_tokens(operation: str, model: str, prompt_tokens: int, completion_tokens: int,
+                      cached_prompt_tokens: int = 0) -> None:
+        LLM_PROMPT_TOKENS.labels(operation, model).inc(prompt_tokens)
+        LLM_COMPLETION_TOKENS.labels(operation, model).inc(completion_tokens)
+        if cached_prompt_tokens:
+            LLM_CACHED_PROMPT_TOKENS.labels(operation, model).inc(cached_prompt_tokens)
@@ -0,0 +1,75 @@
+import hashlib
+from typing import Any, List
+
+from fastapi import Request, Response
+
+from services.compression import strip_encoding_suffix
+
+# Per-user data: browsers may keep it but must revalidate before every use
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*parts: Any) -> str:
+    """
+    Strong ETag over the values a response is derived from (message ids,
+    history ids, labels, query string)
+    """
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+def make_history_etag(history_id: Any, *parts: Any) -> str:
+    """
+    make_etag, carrying the Gmail history id the response was checked
+    against so a conditional request can ask Gmail what changed since
+    """
+    return f'"{make_etag(history_id, *parts)[1:-1]}.{history_id}"'
+
+def _sent_etags(request: Request) -> List[str]:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return []
+
+    etags = []
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        etags.append(candidate)
+    return etags
+
+def _requested_etags(request: Request) -> List[str]:
+    return [strip_encoding_suffix(candidate) for candidate in _sent_etags(request)]
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Whether the request's If-None-Match names etag. Comparison is weak, as
+    RFC 9110 specifies for If-None-Match, and ignores the content-coding
+    suffix CompressionMiddleware adds.
+    """
+    return any(candidate in ("*", etag) for candidate in _requested_etags(request))
+
+def requested_history_id(request: Request) -> str:
+    """
+    History id carried by the first make_history_etag ETag in the request's
+    If-None-Match, or "" when there is none
+    """
+    for candidate in _requested_etags(request):
+        history_id = candidate.strip('"').rpartition(".")[2]
+        if "." in candidate and history_id.isdigit():
+            return history_id
+    return ""
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+def not_modified(request: Request, etag: str) -> Response:
+    """
+    304 for a request whose If-None-Match matched etag. It repeats the
+    validator the client sent, so a 304 for a compressed representation
+    keeps the content-coding suffix its 200 was sent with.
+    """
+    for candidate in _sent_etags(request):
+        if strip_encoding_suffix(candidate) == etag:
+            etag = candidate
+            break
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
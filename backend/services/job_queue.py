@@ -0,0 +1,471 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import closing, contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from config import (
+    JOB_STORE_PATH,
+    JOB_WORKERS,
+    JOB_ITEM_CONCURRENCY,
+    JOB_ITEM_MAX_ATTEMPTS,
+    JOB_ITEM_TIMEOUT_SECONDS,
+    JOB_RETRY_DELAY_SECONDS,
+    JOB_POLL_SECONDS,
+    JOB_LEASE_SECONDS,
+)
+from services.request_context import start_scope
+from services.auth_service import session_store, session_user, token_refresher
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+PARTIAL = "partial"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATES = (COMPLETED, PARTIAL, FAILED, CANCELLED)
+
+# Item states
+PENDING = "pending"
+DONE = "done"
+
+# handler(user, params, item) -> JSON-serializable result for that item
+JobHandler = Callable[[Dict, Dict, str], Awaitable[Any]]
+
+class JobQueue:
+    """
+    SQLite-backed queue of long-running jobs made of independent items (an
+    email to summarize, a thread). Worker tasks claim queued jobs, run their
+    pending items and store each item's result as it finishes, so progress
+    survives a restart: interrupted jobs are re-queued and only their
+    unfinished items run again.
+
+    A claimed job carries the claiming worker's id and a lease that the
+    worker renews while it runs the job. Several processes can share the
+    store: a job is only taken from another worker once its lease has
+    expired, i.e. that worker has stopped or crashed.
+    """
+
+    def __init__(self, db_path: str = JOB_STORE_PATH, lease_seconds: float = JOB_LEASE_SECONDS):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers: Dict[str, JobHandler] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._workers: List[asyncio.Task] = []
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    user_email TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    total_items INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    available_at REAL NOT NULL,
+                    finished_at REAL,
+                    error TEXT,
+                    worker_id TEXT,
+                    lease_expires_at REAL
+                )
+                """
+            )
+            # Stores created before leases existed
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("worker_id", "TEXT"), ("lease_expires_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job_items (
+                    job_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    item TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    finished_at REAL,
+                    PRIMARY KEY (job_id, position)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, available_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_by_user ON jobs (user_email, created_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # sqlite3's own context manager only commits; closing() releases the handle
+        with closing(sqlite3.connect(self.db_path, timeout=10)) as conn:
+            with conn:
+                yield conn
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """
+        Register the coroutine that processes one item of a job kind
+        """
+        self.handlers[kind] = handler
+
+    def submit(self, user_email: str, kind: str, params: Dict, items: List[str]) -> Dict:
+        """
+        Persist a new job and wake a worker
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, user_email, kind, params, status, total_items, created_at, updated_at, available_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_email, kind, json.dumps(params), QUEUED, len(items), now, now, now)
+            )
+            conn.executemany(
+                "INSERT INTO job_items (job_id, position, item, status) VALUES (?, ?, ?, ?)",
+                [(job_id, position, item, PENDING) for position, item in enumerate(items)]
+            )
+
+        self._notify()
+        return self.get(job_id)
+
+    def get(self, job_id: str, user_email: Optional[str] = None, include_items: bool = True) -> Optional[Dict]:
+        """
+        Job status, progress counters and the results of finished items
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, user_email, kind, params, status, total_items, created_at, updated_at, finished_at, error "
+                "FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+            if not row or (user_email is not None and row[1] != user_email):
+                return None
+
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+            items = conn.execute(
+                "SELECT position, item, status, attempts, result, error, finished_at FROM job_items "
+                "WHERE job_id = ? ORDER BY position",
+                (job_id,)
+            ).fetchall() if include_items else []
+
+        job = {
+            "job_id": row[0],
+            "kind": row[2],
+            "params": json.loads(row[3]),
+            "status": row[4],
+            "progress": {
+                "total": row[5],
+                "done": counts.get(DONE, 0),
+                "failed": counts.get(FAILED, 0),
+                "pending": counts.get(PENDING, 0)
+            },
+            "created_at": row[6],
+            "updated_at": row[7],
+            "finished_at": row[8],
+            "error": row[9]
+        }
+        if include_items:
+            job["items"] = [
+                {
+                    "position": position,
+                    "item": item,
+                    "status": status,
+                    "attempts": attempts,
+                    "result": json.loads(result) if result else None,
+                    "error": error,
+                    "finished_at": finished_at
+                }
+                for position, item, status, attempts, result, error, finished_at in items
+            ]
+        return job
+
+    def list_jobs(self, user_email: str, limit: int = 20) -> List[Dict]:
+        """
+        A user's most recent jobs, without item results
+        """
+        with self._connect() as conn:
+            job_ids = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE user_email = ? ORDER BY created_at DESC LIMIT ?",
+                (user_email, limit)
+            ).fetchall()]
+        return [self.get(job_id, include_items=False) for job_id in job_ids]
+
+    def retry_failed(self, job_id: str, user_email: str) -> bool:
+        """
+        Re-queue a finished job's failed items with a fresh attempt budget
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT user_email, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if not row or row[0] != user_email or row[1] not in (PARTIAL, FAILED):
+                return False
+            conn.execute(
+                "UPDATE job_items SET status = ?, attempts = 0, error = NULL WHERE job_id = ? AND status = ?",
+                (PENDING, job_id, FAILED)
+            )
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, available_at = ?, finished_at = NULL, error = NULL WHERE id = ?",
+                (QUEUED, now, now, job_id)
+            )
+
+        self._notify()
+        return True
+
+    def cancel(self, job_id: str, user_email: str) -> bool:
+        """
+        Cancel a job; a running job stops before its next item
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, finished_at = ? "
+                "WHERE id = ? AND user_email = ? AND status IN (?, ?)",
+                (CANCELLED, time.time(), time.time(), job_id, user_email, QUEUED, RUNNING)
+            )
+            return cursor.rowcount > 0
+
+    async def start(self, workers: int = JOB_WORKERS) -> None:
+        """
+        Re-queue jobs whose worker stopped without releasing them and start
+        the worker tasks. Jobs leased by a live worker are left alone.
+        """
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        resumed = await asyncio.to_thread(self._resume_interrupted)
+        if resumed:
+            logger.info(f"♻️ Resuming {resumed} interrupted job(s)")
+
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(workers)]
+        logger.info(f"✅ Job queue started with {workers} worker(s) as {self.worker_id}")
+
+    async def stop(self) -> None:
+        """
+        Stop the workers and release their jobs, which resume on the next
+        start or on another worker
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await asyncio.to_thread(self._release_own)
+
+    def _resume_interrupted(self) -> int:
+        now = time.time()
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, worker_id = NULL, lease_expires_at = NULL "
+                "WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+                (QUEUED, now, RUNNING, now)
+            ).rowcount
+
+    def _release_own(self) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, worker_id = NULL, lease_expires_at = NULL "
+                "WHERE status = ? AND worker_id = ?",
+                (QUEUED, time.time(), RUNNING, self.worker_id)
+            )
+
+    def _notify(self) -> None:
+        # Called from the threads the store calls run in
+        if self._wakeup is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            try:
+                # Store calls run off the event loop; SQLite may wait up to 10 s on a locked database
+                job = await asyncio.to_thread(self._claim_next)
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=JOB_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Job worker {number} error: {e}")
+                await asyncio.sleep(JOB_POLL_SECONDS)
+
+    def _claim_next(self) -> Optional[Dict]:
+        """
+        Atomically lease the oldest available job: a queued one, or a
+        running one whose worker let its lease expire
+        """
+        now = time.time()
+        with self._connect() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT id, user_email, kind, params, status, worker_id FROM jobs "
+                    "WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (QUEUED, now, RUNNING, now)
+                ).fetchone()
+                if not row:
+                    return None
+                claimed = conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ?, worker_id = ?, lease_expires_at = ? "
+                    "WHERE id = ? AND status = ? AND worker_id IS ?",
+                    (RUNNING, now, self.worker_id, now + self.lease_seconds, row[0], row[4], row[5])
+                ).rowcount
+                if claimed:
+                    if row[4] == RUNNING:
+                        logger.info(f"♻️ Taking over job {row[0]} from {row[5]}; its lease expired")
+                    return {"id": row[0], "user_email": row[1], "kind": row[2], "params": json.loads(row[3])}
+
+    def _renew_lease(self, job_id: str) -> bool:
+        """
+        Extend this worker's lease on a running job; False once it is lost
+        (cancelled, finished or taken over)
+        """
+        now = time.time()
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ? AND worker_id = ?",
+                (now + self.lease_seconds, job_id, RUNNING, self.worker_id)
+            ).rowcount > 0
+
+    async def _keep_leased(self, job_id: str, lost: asyncio.Event) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await asyncio.to_thread(self._renew_lease, job_id):
+                lost.set()
+                return
+
+    async def _run_job(self, job: Dict) -> None:
+        user = await _session_for(job["user_email"])
+        if user is None:
+            # No live session to act for; try again later
+            await asyncio.to_thread(self._requeue, job["id"], JOB_RETRY_DELAY_SECONDS * 4, "Waiting for the user to sign in")
+            return
+
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            await asyncio.to_thread(self._finish, job["id"], FAILED, f"Unknown job kind: {job['kind']}")
+            return
+
+        items = await asyncio.to_thread(self._pending_items, job["id"])
+
+        semaphore = asyncio.Semaphore(JOB_ITEM_CONCURRENCY)
+        lease_lost = asyncio.Event()
+
+        async def run_item(position: int, item: str, attempts: int) -> None:
+            async with semaphore:
+                # Cancelled, or another worker has the job now
+                if lease_lost.is_set() or await asyncio.to_thread(self._status, job["id"]) == CANCELLED:
+                    return
+                # Long jobs outlive an access token; pick up the current one for each item
+                item_user = await _session_for(job["user_email"]) or user
+                try:
+                    result = await asyncio.create_task(_run_in_scope(handler, item_user, job["params"], item))
+                except Exception as e:
+                    await asyncio.to_thread(self._record_failure, job["id"], position, attempts + 1, str(e))
+                else:
+                    await asyncio.to_thread(self._record_result, job["id"], position, attempts + 1, result)
+
+        keeper = asyncio.create_task(self._keep_leased(job["id"], lease_lost))
+        try:
+            await asyncio.gather(*(run_item(*row) for row in items))
+        finally:
+            keeper.cancel()
+
+        if lease_lost.is_set() or await asyncio.to_thread(self._status, job["id"]) == CANCELLED:
+            return
+
+        progress = (await asyncio.to_thread(self.get, job["id"], include_items=False))["progress"]
+        if progress["pending"]:
+            await asyncio.to_thread(self._requeue, job["id"], JOB_RETRY_DELAY_SECONDS)
+        elif progress["failed"] == 0:
+            await asyncio.to_thread(self._finish, job["id"], COMPLETED)
+        elif progress["done"] == 0:
+            await asyncio.to_thread(self._finish, job["id"], FAILED, "All items failed")
+        else:
+            await asyncio.to_thread(self._finish, job["id"], PARTIAL)
+
+    def _pending_items(self, job_id: str) -> List[tuple]:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT position, item, attempts FROM job_items WHERE job_id = ? AND status = ? ORDER BY position",
+                (job_id, PENDING)
+            ).fetchall()
+
+    def _status(self, job_id: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def _record_result(self, job_id: str, position: int, attempts: int, result: Any) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE job_items SET status = ?, attempts = ?, result = ?, error = NULL, finished_at = ? "
+                "WHERE job_id = ? AND position = ?",
+                (DONE, attempts, json.dumps(result), now, job_id, position)
+            )
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+
+    def _record_failure(self, job_id: str, position: int, attempts: int, error: str) -> None:
+        # The item stays pending for another pass until its attempts run out
+        status = FAILED if attempts >= JOB_ITEM_MAX_ATTEMPTS else PENDING
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE job_items SET status = ?, attempts = ?, error = ?, finished_at = ? WHERE job_id = ? AND position = ?",
+                (status, attempts, error, now if status == FAILED else None, job_id, position)
+            )
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+
+    def _requeue(self, job_id: str, delay: float, error: Optional[str] = None) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, available_at = ?, error = ?, worker_id = NULL, "
+                "lease_expires_at = NULL WHERE id = ? AND status = ? AND worker_id = ?",
+                (QUEUED, now, now + delay, error, job_id, RUNNING, self.worker_id)
+            )
+
+    def _finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, finished_at = ?, error = ?, worker_id = NULL, "
+                "lease_expires_at = NULL WHERE id = ? AND status = ? AND worker_id = ?",
+                (status, now, now, error, job_id, RUNNING, self.worker_id)
+            )
+        logger.info(f"🏁 Job {job_id} {status}")
+
+async def _run_in_scope(handler: JobHandler, user: Dict, params: Dict, item: str) -> Any:
+    # Runs in its own task, so the item deadline does not leak into the worker
+    start_scope(JOB_ITEM_TIMEOUT_SECONDS)
+    return await handler(user, params, item)
+
+async def _session_for(user_email: str) -> Optional[Dict]:
+    """
+    Current user info and a fresh access token for a job's owner, if signed in
+    """
+    session = await asyncio.to_thread(session_store.get, user_email)
+    if not session or not session.get('access_token'):
+        return None
+    return session_user(await token_refresher.ensure_fresh(session))
+
+# Shared by the job routes and the worker tasks on this process
+job_queue = JobQueue()
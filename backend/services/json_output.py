@@ -0,0 +1,168 @@
+import json
+import re
+from typing import Any, Dict, List, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+class SummaryOutput(BaseModel):
+    summary: str
+    key_points: List[str] = []
+
+class ToneOutput(BaseModel):
+    primary_tone: str = "neutral"
+    confidence: float = 0.5
+    tone_scores: Dict[str, float] = {}
+    suggestions: List[str] = []
+
+class ActionItemsOutput(BaseModel):
+    action_items: List[str] = []
+
+class ToneBatchOutput(BaseModel):
+    results: List[ToneOutput]
+
+class ActionItemsBatchOutput(BaseModel):
+    results: List[List[str]]
+
+class CategoryBatchOutput(BaseModel):
+    results: List[str]
+
+class JSONOutputError(ValueError):
+    """
+    Raised when model output cannot be parsed or validated as JSON
+    """
+    pass
+
+CODE_FENCE = re.compile(r'```(?:json|JSON)?\s*\n?(.*?)(?:\n?```|$)', re.DOTALL)
+TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+def _extract_json_text(text: str) -> str:
+    """
+    Strip code fences and surrounding prose, returning text from the first { or [
+    """
+    fenced = CODE_FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+
+    starts = [index for index in (text.find('{'), text.find('[')) if index != -1]
+    if not starts:
+        return text.strip()
+
+    return text[min(starts):].strip()
+
+def _scan(text: str):
+    """
+    Walk JSON text and return (open bracket stack, inside string, end index of
+    the first complete top-level value or -1)
+    """
+    stack: List[str] = []
+    in_string = False
+    escaped = False
+
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            if stack:
+                stack.pop()
+            if not stack:
+                return stack, False, index + 1
+
+    return stack, in_string, -1
+
+def repair_json(text: str) -> str:
+    """
+    Best-effort repair of truncated or slightly malformed JSON: drops
+    trailing prose, closes an open string, removes a dangling key or comma
+    and closes any open objects and arrays.
+    """
+    text = _extract_json_text(text)
+    stack, in_string, end = _scan(text)
+
+    if end != -1:
+        return TRAILING_COMMA.sub(r'\1', text[:end])
+
+    if in_string:
+        if text.endswith('\\'):
+            text = text[:-1]
+        text += '"'
+
+    text = text.rstrip()
+    # A key without a value ("key": or "key") cannot be completed; drop it
+    text = re.sub(r',?\s*"[^"]*"\s*:\s*$', '', text)
+    text = re.sub(r'(?<=[{,])\s*"[^"]*"$', '', text) if stack and stack[-1] == '}' else text
+    text = text.rstrip().rstrip(',').rstrip(':')
+
+    text = TRAILING_COMMA.sub(r'\1', text + ''.join(reversed(stack)))
+    return text
+
+def parse_model_json(text: str, schema: Optional[Type[BaseModel]] = None) -> Any:
+    """
+    Parse JSON from raw model output, tolerating code fences, surrounding
+    prose and truncation, and validate it against schema when given
+    """
+    if text is None:
+        raise JSONOutputError("Empty model output")
+
+    candidate = _extract_json_text(text)
+    try:
+        data = json.loads(candidate)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(repair_json(candidate))
+        except json.JSONDecodeError as e:
+            raise JSONOutputError(f"Could not parse model output as JSON: {e}")
+
+    if schema is None:
+        return data
+
+    try:
+        return schema.model_validate(data).model_dump()
+    except ValidationError as e:
+        raise JSONOutputError(f"Model output does not match {schema.__name__}: {e}")
+
+class IncrementalJSONParser:
+    """
+    Accumulates streamed JSON text and reports top-level fields as they
+    become available or change
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """
+        Add a chunk of streamed text and return fields that changed
+        """
+        self.buffer += chunk
+        if '{' not in self.buffer:
+            return {}
+
+        try:
+            data = json.loads(repair_json(self.buffer))
+        except json.JSONDecodeError:
+            return {}
+
+        if not isinstance(data, dict):
+            return {}
+
+        changed = {key: value for key, value in data.items() if self.fields.get(key) != value}
+        self.fields.update(changed)
+        return changed
+
+    def result(self, schema: Optional[Type[BaseModel]] = None) -> Any:
+        """
+        Parse the complete buffer once streaming has finished
+        """
+        return parse_model_json(self.buffer, schema)
@@ -0,0 +1,278 @@
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Seconds; spans a cached lookup up to a long LLM call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self.value = value
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+class Metric:
+    """
+    A named metric family with fixed label names. labels(*values) returns
+    the child holding the samples for one label combination, created on
+    first use; the API mirrors prometheus_client.
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def children(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self.children():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+# collector() -> [(name, kind, documentation, [(labels dict, value)])], called on each scrape
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+class MetricsRegistry:
+    """
+    Metrics rendered in the Prometheus text format. Hot paths update
+    instrumented metrics directly; collectors read existing counters (breaker
+    states, cache stats) only when /metrics is scraped.
+    """
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Collector] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Collector) -> None:
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        for collector in self.collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+# Shared by every request on this worker
+registry = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    "intellimail_http_request_duration_seconds", "HTTP request latency by route template", ("route", "method")))
+HTTP_REQUESTS = registry.register(Counter(
+    "intellimail_http_requests_total", "HTTP requests by route template and status code", ("route", "method", "status")))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "intellimail_http_requests_in_flight", "HTTP requests being handled"))
+
+UPSTREAM_DURATION = registry.register(Histogram(
+    "intellimail_upstream_request_duration_seconds", "Latency of each upstream attempt", ("upstream", "outcome")))
+UPSTREAM_ERRORS = registry.register(Counter(
+    "intellimail_upstream_errors_total", "Upstream errors by class", ("upstream", "error_class")))
+UPSTREAM_IN_FLIGHT = registry.register(Gauge(
+    "intellimail_upstream_requests_in_flight", "Upstream calls being made", ("upstream",)))
+
+LLM_REQUESTS = registry.register(Counter(
+    "intellimail_llm_requests_total", "Chat completions by operation and model", ("operation", "model")))
+LLM_PROMPT_TOKENS = registry.register(Counter(
+    "intellimail_llm_prompt_tokens_total", "Prompt tokens by operation and model", ("operation", "model")))
+LLM_CACHED_PROMPT_TOKENS = registry.register(Counter(
+    "intellimail_llm_cached_prompt_tokens_total", "Prompt tokens served from the provider prompt cache",
+    ("operation", "model")))
+LLM_COMPLETION_TOKENS = registry.register(Counter(
+    "intellimail_llm_completion_tokens_total", "Completion tokens by operation and model", ("operation", "model")))
+
+CACHE_LOOKUPS = registry.register(Counter(
+    "intellimail_cache_lookups_total", "Lookups in the application's result caches", ("cache", "result")))
+
+def _total(metric: Metric, **match: str) -> float:
+    indexes = [(metric.labelnames.index(name), value) for name, value in match.items()]
+    return sum(child.value for values, child in metric.children()
+               if all(values[index] == value for index, value in indexes))
+
+def _cache_hit_ratios():
+    caches = sorted({values[0] for values, _ in CACHE_LOOKUPS.children()})
+    samples = []
+    for cache in caches:
+        lookups = _total(CACHE_LOOKUPS, cache=cache)
+        hits = _total(CACHE_LOOKUPS, cache=cache, result="hit")
+        samples.append(({"cache": cache}, hits / lookups if lookups else 0.0))
+
+    prompt_tokens = _total(LLM_PROMPT_TOKENS)
+    if prompt_tokens:
+        samples.append(({"cache": "prompt_prefix"}, _total(LLM_CACHED_PROMPT_TOKENS) / prompt_tokens))
+
+    yield ("intellimail_cache_hit_ratio", "gauge", "Hits per lookup since start (prompt_prefix: cached prompt tokens)",
+           samples)
+
+registry.add_collector(_cache_hit_ratios)
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording latency, status and in-flight count of
+    HTTP requests, labelled with the matched route template so label
+    cardinality stays bounded
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Dict[object, str] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels()
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            # The router records the matched endpoint in the (shared) scope
+            route = self._route_path(scope)
+            HTTP_REQUEST_DURATION.labels(route, scope["method"]).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(route, scope["method"], status["code"]).inc()
+
+    def _route_path(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            app = scope.get("app")
+            for route in getattr(app, "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            path = self._route_paths.setdefault(endpoint, path or "unmatched")
+        return path
+
+def render_metrics() -> str:
+    return registry.render()
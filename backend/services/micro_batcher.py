@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from config import REQUEST_DEADLINE_SECONDS
+from services.request_context import current_scope, start_scope
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """
+    Gathers same-type requests that arrive within a short window and runs
+    them as one batch. Each caller awaits only its own result.
+    
+    batch_fn receives the list of submitted items and must return one
+    result per item, in the same order. It runs in its own request scope,
+    with the latest deadline of the callers in the batch, so one caller
+    disconnecting or timing out does not cancel the batch for the others.
+    A request arriving while nothing else is pending or running is sent
+    at once instead of waiting out the window.
+    """
+    
+    def __init__(self, name: str, batch_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+                 window_ms: int = 25, max_batch_size: int = 8):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending: List[Tuple[Any, asyncio.Future, Optional[float], bool]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running = 0
+        self.batches_run = 0
+        self.items_batched = 0
+    
+    async def submit(self, item: Any) -> Any:
+        """
+        Queue an item and wait for its result
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        scope = current_scope()
+        self._pending.append((item, future, scope.deadline if scope else None, scope is not None and scope.background))
+        
+        # Nothing to wait for when no other request could join the batch
+        if len(self._pending) >= self.max_batch_size or (len(self._pending) == 1 and self._running == 0):
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush_now)
+        
+        return await future
+    
+    def _flush_now(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush_now)
+        
+        if batch:
+            self._running += 1
+            asyncio.ensure_future(self._run_batch(batch))
+    
+    async def _run_batch(self, batch: List[Tuple[Any, asyncio.Future, Optional[float], bool]]) -> None:
+        try:
+            # Callers that gave up before the flush are left out
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                return
+            
+            # The task inherited the scope of whichever caller triggered the
+            # flush; replace it with one that outlives every caller's deadline
+            now = time.monotonic()
+            deadlines = [deadline for _, _, deadline, _ in batch]
+            timeout = max(deadline - now if deadline is not None else REQUEST_DEADLINE_SECONDS for deadline in deadlines)
+            start_scope(max(timeout, 0.001), background=all(background for _, _, _, background in batch))
+            
+            items = [item for item, _, _, _ in batch]
+            self.batches_run += 1
+            self.items_batched += len(items)
+            
+            try:
+                results = await self.batch_fn(items)
+                if len(results) != len(items):
+                    raise Exception(f"{self.name} batch returned {len(results)} results for {len(items)} items")
+            except asyncio.CancelledError:
+                for _, future, _, _ in batch:
+                    future.cancel()
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Micro-batch {self.name} of {len(items)} failed: {e}")
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            
+            for (_, future, _, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._running -= 1
+    
+    def stats(self) -> dict:
+        """
+        Batching counters for this batcher
+        """
+        return {
+            "name": self.name,
+            "batches_run": self.batches_run,
+            "items_batched": self.items_batched,
+            "average_batch_size": round(self.items_batched / self.batches_run, 2) if self.batches_run else 0.0,
+            "pending": len(self._pending),
+            "running": self._running
+        }
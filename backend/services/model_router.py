@@ -0,0 +1,142 @@
+import threading
+import logging
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from config import MODEL_ROUTES, DEFAULT_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Latency samples kept per route for the rolling p95
+LATENCY_WINDOW = 50
+
+# Minimum samples before a route may switch to its fallback
+MIN_SAMPLES = 10
+
+# While degraded, every Nth call still goes to the primary model so it can recover
+PROBE_EVERY = 10
+
+# Consecutive probes within the latency target that end a degraded spell
+RECOVERY_PROBES = 3
+
+def percentile(samples: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of a list of samples
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+class ModelRouter:
+    """
+    Picks a model per operation and input size from MODEL_ROUTES and
+    falls back to a faster model while a route misses its latency target
+    """
+    
+    def __init__(self, routes: Optional[Dict] = None, default_model: str = DEFAULT_MODEL):
+        self.routes = routes if routes is not None else MODEL_ROUTES
+        self.default_model = default_model
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, deque] = {}
+        self._stats: Dict[str, Dict] = {}
+    
+    def select(self, operation: str, input_tokens: int) -> Tuple[str, str]:
+        """
+        Return (model, route_key) for an operation and prompt size
+        """
+        route = self.routes.get(operation)
+        if not route:
+            return self.default_model, operation
+        
+        model = self.default_model
+        for tier in route.get("tiers", []):
+            limit = tier.get("max_input_tokens")
+            if limit is None or input_tokens <= limit:
+                model = tier["model"]
+                break
+        
+        route_key = f"{operation}:{model}"
+        fallback = route.get("fallback_model")
+        target_ms = route.get("latency_target_ms")
+        
+        if fallback and target_ms and fallback != model:
+            with self._lock:
+                samples = list(self._latencies.get(route_key, []))
+                stats = self._stats.setdefault(route_key, self._new_stats())
+                degraded = len(samples) >= MIN_SAMPLES and percentile(samples, 95) * 1000 > target_ms
+                if not degraded:
+                    stats["fast_probes"] = 0
+                stats["degraded"] = degraded
+                if degraded:
+                    stats["degraded_calls"] += 1
+                    if stats["degraded_calls"] % PROBE_EVERY != 0:
+                        return fallback, route_key
+        
+        return model, route_key
+    
+    def record(self, route_key: str, model: str, latency_s: float, cost_usd: float = 0.0) -> None:
+        """
+        Record the outcome of a call made for a route
+        """
+        with self._lock:
+            stats = self._stats.setdefault(route_key, self._new_stats())
+            stats["calls"] += 1
+            stats["spend_usd"] += cost_usd
+            stats["models"][model] = stats["models"].get(model, 0) + 1
+            
+            # Only the primary model's latency decides whether the route is degraded
+            if route_key.endswith(f":{model}"):
+                latencies = self._latencies.setdefault(route_key, deque(maxlen=LATENCY_WINDOW))
+                latencies.append(latency_s)
+                if stats["degraded"]:
+                    self._record_probe(route_key, stats, latencies, latency_s)
+            self._latencies.setdefault(f"{route_key}:all", deque(maxlen=LATENCY_WINDOW)).append(latency_s)
+    
+    def get_stats(self) -> Dict[str, Dict]:
+        """
+        Per-route call counts, p50/p95 latency and spend
+        """
+        with self._lock:
+            result = {}
+            for route_key, stats in self._stats.items():
+                if not stats["calls"]:
+                    continue
+                samples = list(self._latencies.get(f"{route_key}:all", []))
+                operation = route_key.split(":", 1)[0]
+                result[route_key] = {
+                    "calls": stats["calls"],
+                    "models": dict(stats["models"]),
+                    "p50_ms": round(percentile(samples, 50) * 1000, 1),
+                    "p95_ms": round(percentile(samples, 95) * 1000, 1),
+                    "latency_target_ms": self.routes.get(operation, {}).get("latency_target_ms"),
+                    "degraded": stats["degraded"],
+                    "spend_usd": round(stats["spend_usd"], 6)
+                }
+            return result
+    
+    def _record_probe(self, route_key: str, stats: Dict, latencies: deque, latency_s: float) -> None:
+        """
+        Judge recovery on probes alone: the window holds samples from before
+        the route degraded and probes refill it too slowly, so a run of fast
+        probes clears it
+        """
+        target_ms = self.routes.get(route_key.split(":", 1)[0], {}).get("latency_target_ms")
+        if not target_ms or latency_s * 1000 > target_ms:
+            stats["fast_probes"] = 0
+            return
+        
+        stats["fast_probes"] += 1
+        if stats["fast_probes"] >= RECOVERY_PROBES:
+            latencies.clear()
+            stats["degraded"] = False
+            stats["fast_probes"] = 0
+            logger.info(f"✅ {route_key} back within its latency target")
+    
+    @staticmethod
+    def _new_stats() -> Dict:
+        return {"calls": 0, "models": {}, "spend_usd": 0.0, "degraded": False, "degraded_calls": 0, "fast_probes": 0}
+
+# Shared by every GPTService instance on this worker
+model_router = ModelRouter()
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from contextlib import closing, contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+from config import (
+    PRECOMPUTE_STORE_PATH,
+    PRECOMPUTE_MAX_MESSAGES,
+    PRECOMPUTE_USER_CONCURRENCY,
+    PRECOMPUTE_GLOBAL_CONCURRENCY,
+    PRECOMPUTE_TOKEN_BUDGET,
+    PRECOMPUTE_BUDGET_WINDOW_SECONDS,
+    PRECOMPUTE_ITEM_TIMEOUT_SECONDS,
+    PRECOMPUTE_SUMMARY_LENGTH,
+)
+from services.request_context import start_scope, wait_for_interactive_idle
+from services.email_categorizer import AUTOMATED_SENDER, BULK_LABELS
+
+logger = logging.getLogger(__name__)
+
+# summarize_fn(user, email_id, max_length) -> {"summary", "key_points", "original_length", "tokens_used"}
+Summarizer = Callable[[Dict, str, int], Awaitable[Dict]]
+
+# Senders remembered per user as ones the user engages with
+KNOWN_SENDERS_PER_USER = 500
+
+class EmailSummaryStore:
+    """
+    SQLite-backed store of single-email summaries, keyed by message id and
+    summary length
+    """
+
+    def __init__(self, db_path: str = PRECOMPUTE_STORE_PATH):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS email_summaries (
+                    user_email TEXT NOT NULL,
+                    email_id TEXT NOT NULL,
+                    max_length INTEGER NOT NULL,
+                    summary TEXT NOT NULL,
+                    key_points TEXT NOT NULL,
+                    original_length INTEGER NOT NULL,
+                    precomputed INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (user_email, email_id, max_length)
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # sqlite3's own context manager only commits; closing() releases the handle
+        with closing(sqlite3.connect(self.db_path, timeout=10)) as conn:
+            with conn:
+                yield conn
+
+    def get(self, user_email: str, email_id: str, max_length: int) -> Optional[Dict]:
+        """
+        Get the stored summary for an email, if any
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT summary, key_points, original_length, precomputed, created_at FROM email_summaries "
+                "WHERE user_email = ? AND email_id = ? AND max_length = ?",
+                (user_email, email_id, max_length)
+            ).fetchone()
+
+        if not row:
+            return None
+
+        return {
+            "summary": row[0],
+            "key_points": json.loads(row[1]),
+            "original_length": row[2],
+            "precomputed": bool(row[3]),
+            "created_at": row[4]
+        }
+
+    def missing(self, user_email: str, email_ids: List[str], max_length: int) -> List[str]:
+        """
+        The given email ids that have no stored summary, in the same order
+        """
+        if not email_ids:
+            return []
+
+        placeholders = ",".join("?" * len(email_ids))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT email_id FROM email_summaries WHERE user_email = ? AND max_length = ? "
+                f"AND email_id IN ({placeholders})",
+                (user_email, max_length, *email_ids)
+            ).fetchall()
+
+        stored = {row[0] for row in rows}
+        return [email_id for email_id in email_ids if email_id not in stored]
+
+    def save(self, user_email: str, email_id: str, max_length: int, summary: str, key_points: List[str],
+             original_length: int, precomputed: bool = False) -> None:
+        """
+        Insert or replace the summary for an email
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO email_summaries "
+                "(user_email, email_id, max_length, summary, key_points, original_length, precomputed, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_email, email_id, max_length, summary, json.dumps(key_points),
+                 original_length, int(precomputed), time.time())
+            )
+
+class SummaryPrecomputer:
+    """
+    Summarizes a user's most likely-to-be-opened unread emails in the
+    background after an inbox listing, so opening one serves a stored
+    summary. Work is capped per user (message count, concurrency and a token
+    budget per window), runs in background request scopes and waits while
+    any interactive upstream call is in flight.
+    """
+
+    def __init__(self, store: Optional[EmailSummaryStore] = None):
+        self.store = store or EmailSummaryStore()
+        self.summarize_fn: Optional[Summarizer] = None
+        self._pending: Dict[str, List[str]] = {}
+        self._users: Dict[str, Dict] = {}
+        self._runs: Dict[str, asyncio.Task] = {}
+        self._spent: Dict[str, deque] = {}
+        self._known_senders: Dict[str, OrderedDict] = {}
+        self._global_slots: Optional[asyncio.Semaphore] = None
+        self.counters = {
+            "scheduled": 0, "summarized": 0, "failed": 0, "budget_exhausted": 0,
+            "tokens_used": 0, "served": 0
+        }
+
+    def set_summarizer(self, summarize_fn: Summarizer) -> None:
+        self.summarize_fn = summarize_fn
+
+    def note_sender(self, user_email: str, sender: str) -> None:
+        """
+        Remember a sender the user engaged with (opened, summarized, replied to)
+        """
+        if not user_email or not sender:
+            return
+
+        senders = self._known_senders.setdefault(user_email, OrderedDict())
+        senders[sender.lower()] = True
+        senders.move_to_end(sender.lower())
+        while len(senders) > KNOWN_SENDERS_PER_USER:
+            senders.popitem(last=False)
+
+    def rank(self, user_email: str, emails: List[Dict]) -> List[str]:
+        """
+        Unread email ids, most likely to be opened first: newest, addressed
+        to the user directly, from known senders; automated and bulk mail last
+        """
+        known = self._known_senders.get(user_email, {})
+        scored = []
+
+        for position, email in enumerate(emails):
+            if email.get('is_read', True):
+                continue
+
+            sender = (email.get('sender') or '').lower()
+            labels = email.get('label_ids') or []
+            # Listings come newest first
+            score = 1.0 - position / max(len(emails), 1)
+            if user_email and user_email.lower() in (email.get('recipient') or '').lower():
+                score += 1.0
+            if sender in known:
+                score += 1.0
+            if 'IMPORTANT' in labels:
+                score += 0.5
+            if AUTOMATED_SENDER.search(sender):
+                score -= 1.5
+            if any(label in labels for label in BULK_LABELS):
+                score -= 1.0
+            scored.append((score, -position, email['id']))
+
+        scored.sort(reverse=True)
+        return [email_id for _, _, email_id in scored]
+
+    async def schedule(self, user: Dict, emails: List[Dict]) -> int:
+        """
+        Queue background summaries for the top unread emails of a listing.
+        Returns the number of emails queued.
+        """
+        user_email = user.get('email', '')
+        if self.summarize_fn is None or not user_email:
+            return 0
+        if self.budget_remaining(user_email) <= 0:
+            self.counters["budget_exhausted"] += 1
+            return 0
+
+        ranked = self.rank(user_email, emails)[:PRECOMPUTE_MAX_MESSAGES]
+        candidates = await asyncio.to_thread(self.store.missing, user_email, ranked, PRECOMPUTE_SUMMARY_LENGTH)
+        if not candidates:
+            return 0
+
+        # The latest listing replaces whatever is still waiting from an earlier one
+        self._pending[user_email] = candidates
+        self._users[user_email] = user
+        self.counters["scheduled"] += len(candidates)
+
+        if user_email not in self._runs:
+            self._runs[user_email] = asyncio.create_task(self._run(user_email))
+        return len(candidates)
+
+    async def get(self, user_email: str, email_id: str, max_length: int) -> Optional[Dict]:
+        """
+        Stored summary for an email, counting hits on precomputed ones
+        """
+        stored = await asyncio.to_thread(self.store.get, user_email, email_id, max_length)
+        if stored and stored["precomputed"]:
+            self.counters["served"] += 1
+        return stored
+
+    def budget_remaining(self, user_email: str) -> int:
+        spent = self._spent.get(user_email)
+        if not spent:
+            return PRECOMPUTE_TOKEN_BUDGET
+
+        cutoff = time.monotonic() - PRECOMPUTE_BUDGET_WINDOW_SECONDS
+        while spent and spent[0][0] < cutoff:
+            spent.popleft()
+        return PRECOMPUTE_TOKEN_BUDGET - sum(tokens for _, tokens in spent)
+
+    async def _run(self, user_email: str) -> None:
+        if self._global_slots is None:
+            self._global_slots = asyncio.Semaphore(PRECOMPUTE_GLOBAL_CONCURRENCY)
+
+        try:
+            await asyncio.gather(*(self._drain(user_email) for _ in range(PRECOMPUTE_USER_CONCURRENCY)))
+        finally:
+            self._runs.pop(user_email, None)
+            self._pending.pop(user_email, None)
+
+    async def _drain(self, user_email: str) -> None:
+        while self._pending.get(user_email):
+            if self.budget_remaining(user_email) <= 0:
+                logger.info(f"⏸️ Precompute budget spent for {user_email}")
+                self.counters["budget_exhausted"] += 1
+                self._pending.pop(user_email, None)
+                return
+
+            async with self._global_slots:
+                await wait_for_interactive_idle()
+                pending = self._pending.get(user_email)
+                if not pending:
+                    return
+                email_id = pending.pop(0)
+
+                try:
+                    # Own task, so the background scope stays out of the caller's context
+                    result = await asyncio.create_task(self._summarize(self._users[user_email], email_id))
+                except Exception as e:
+                    self.counters["failed"] += 1
+                    logger.warning(f"⚠️ Precompute of {email_id} failed: {e}")
+                    continue
+
+            tokens = result.get("tokens_used", 0)
+            self._spent.setdefault(user_email, deque()).append((time.monotonic(), tokens))
+            self.counters["tokens_used"] += tokens
+            self.counters["summarized"] += 1
+            await asyncio.to_thread(self.store.save, user_email, email_id, PRECOMPUTE_SUMMARY_LENGTH, result["summary"],
+                                    result["key_points"], result["original_length"], precomputed=True)
+
+    async def _summarize(self, user: Dict, email_id: str) -> Dict:
+        start_scope(PRECOMPUTE_ITEM_TIMEOUT_SECONDS, background=True)
+        return await self.summarize_fn(user, email_id, PRECOMPUTE_SUMMARY_LENGTH)
+
+    def stats(self) -> Dict:
+        """
+        Counters for this worker
+        """
+        return dict(self.counters, active_users=len(self._runs),
+                    pending=sum(len(ids) for ids in self._pending.values()))
+
+# One instance per worker; the summarizer is registered by routes/summarize.py
+summary_precomputer = SummaryPrecomputer()
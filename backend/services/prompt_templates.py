@@ -0,0 +1,325 @@
+import hashlib
+from typing import Dict, List
+
+from services.token_budget import count_tokens
+
+# OpenAI only caches prompts of at least this many tokens. Every system
+# prefix here is far shorter, so the shared prefix alone never hits the
+# provider cache; only a repeated long prompt (the same content sent again)
+# can, and cached_prompt_tokens reports when it does.
+PROVIDER_CACHE_MIN_TOKENS = 1024
+
+class PromptTemplate:
+    """
+    A versioned prompt split into a static system prefix and a per-call
+    user suffix. The system message is built once at import, so every call
+    for an operation sends the same instructions under one version and
+    prefix hash; only the user message varies.
+    """
+
+    def __init__(self, name: str, version: int, system: str, user: str):
+        self.name = name
+        self.version = version
+        self.system_message = {"role": "system", "content": _dedent(system)}
+        self.user_format = _dedent(user)
+        self.system_tokens = count_tokens(self.system_message["content"])
+        self.prefix_hash = hashlib.sha1(self.system_message["content"].encode("utf-8")).hexdigest()[:12]
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def render(self, **values) -> List[Dict]:
+        """
+        Chat messages for one call; the system message object is shared
+        """
+        return [self.system_message, {"role": "user", "content": self.user_format.format_map(values)}]
+
+def _dedent(text: str) -> str:
+    return "\n".join(line.strip() for line in text.strip().split("\n"))
+
+SUMMARY_FORMAT = """
+Respond with a single JSON object in this format:
+{
+    "summary": "Brief summary",
+    "key_points": ["point1", "point2", "point3"]
+}
+"""
+
+THREAD_REQUIREMENTS = """
+- Stay within the maximum length given with the request
+- Show conversation flow and key decisions
+- Extract main topics and action items
+- Identify key participants and their roles
+"""
+
+TEMPLATES: Dict[str, PromptTemplate] = {}
+
+def register(template: PromptTemplate) -> PromptTemplate:
+    TEMPLATES[template.name] = template
+    return template
+
+register(PromptTemplate(
+    name="summarize_email",
+    version=2,
+    system="""
+        You are an expert email assistant. Summarize the email content you are given in a clear, concise manner.
+
+        Requirements:
+        - Stay within the maximum length given with the request
+        - Extract 3-5 key points
+        - Maintain professional tone
+        - Focus on actionable items and important information
+        - Identify the main purpose of the email
+    """ + SUMMARY_FORMAT,
+    user="""
+        Maximum length: {max_length} words
+
+        Email Content:
+        {content}
+    """
+))
+
+register(PromptTemplate(
+    name="summarize_email_thread",
+    version=2,
+    system="""
+        You are an expert email assistant. Summarize the email thread you are given, covering all of its emails.
+
+        Requirements:
+    """ + THREAD_REQUIREMENTS + SUMMARY_FORMAT,
+    user="""
+        Maximum length: {max_length} words
+        Emails in thread: {email_count}
+
+        Thread Content:
+        {content}
+    """
+))
+
+register(PromptTemplate(
+    name="merge_thread_summary",
+    version=2,
+    system="""
+        You are an expert email assistant. You are given the existing summary of an email thread followed by new emails that have arrived since.
+        Update the summary so it covers the whole thread.
+
+        Requirements:
+        - Keep earlier decisions unless the new emails change them
+    """ + THREAD_REQUIREMENTS + SUMMARY_FORMAT,
+    user="""
+        Maximum length: {max_length} words
+        Emails in thread: {email_count}
+        New emails: {new_count}
+
+        Existing Summary:
+        {previous_summary}
+        {previous_points}
+
+        New Emails:
+        {content}
+    """
+))
+
+register(PromptTemplate(
+    name="summarize_thread_chunk",
+    version=2,
+    system="""
+        You are an expert email assistant. You are given one part of a long email thread, in chronological order.
+
+        Requirements:
+        - Summarize only this part in at most 120 words
+        - Keep decisions, requests, deadlines and who said what
+        - Extract up to 5 key points
+    """ + SUMMARY_FORMAT,
+    user="""
+        Thread Part {chunk_number} of {chunk_count}:
+        {content}
+    """
+))
+
+register(PromptTemplate(
+    name="reduce_thread_summaries",
+    version=2,
+    system="""
+        You are an expert email assistant. You are given summaries of consecutive parts of one email thread.
+        Combine them into a single summary of the whole thread.
+
+        Requirements:
+    """ + THREAD_REQUIREMENTS + SUMMARY_FORMAT,
+    user="""
+        Maximum length: {max_length} words
+        Emails in thread: {email_count}
+
+        Part Summaries:
+        {content}
+    """
+))
+
+register(PromptTemplate(
+    name="generate_reply",
+    version=2,
+    system="""
+        You are an intelligent email assistant. Generate an email reply to the email you are given.
+
+        Instructions:
+        - Write in the tone and length given with the request
+        - Address the main points from the original email
+        - Be helpful and provide value
+        - Include appropriate greetings and closings
+        - Follow any additional context or custom instructions given with the request
+        - Sound natural and human-like
+        - Do not include a subject line
+    """,
+    user="""
+        Tone: {tone_instruction}
+        Length: {length_instruction}{extra}
+
+        Original Email:
+        {content}
+    """
+))
+
+register(PromptTemplate(
+    name="refine_reply",
+    version=2,
+    system="""
+        You are an email editing specialist. Rewrite the email reply you are given in the requested tone.
+
+        Requirements:
+        - Keep the core message and main points
+        - Adjust language, style, and approach to match the requested tone
+        - Preserve any important details or information
+        - Follow any additional instructions given with the request
+        - Respond with the refined reply only
+    """,
+    user="""
+        Target tone: {tone_instruction}{extra}
+
+        Original Reply:
+        {content}
+    """
+))
+
+TONE_FORMAT = """
+{
+    "primary_tone": "dominant tone (e.g., formal, friendly, urgent)",
+    "confidence": 0.85,
+    "tone_scores": {"formal": 0.8, "friendly": 0.2, "professional": 0.9, "casual": 0.1, "urgent": 0.1},
+    "suggestions": ["suggestion1", "suggestion2"]
+}
+"""
+
+register(PromptTemplate(
+    name="analyze_tone",
+    version=2,
+    system="""
+        You are a tone analysis expert. Analyze the tone of the text you are given. Identify the primary tone and provide confidence scores.
+
+        Respond with a single JSON object in this format:
+    """ + TONE_FORMAT,
+    user="""
+        Text to analyze:
+        {content}
+    """
+))
+
+register(PromptTemplate(
+    name="analyze_tone_batch",
+    version=2,
+    system="""
+        You are a tone analysis expert. Analyze the tone of each numbered text you are given independently. Identify the primary tone and provide confidence scores for each.
+
+        Respond with a single JSON object {"results": [...]} holding exactly one entry per text, in the same order, each in this format:
+    """ + TONE_FORMAT,
+    user="""
+        Number of items: {count}
+
+        {content}
+    """
+))
+
+register(PromptTemplate(
+    name="extract_action_items",
+    version=2,
+    system="""
+        You are an action item extraction specialist. Extract action items and tasks from the email content you are given.
+        Focus on specific, actionable tasks that require follow-up.
+
+        Respond with a single JSON object in this format:
+        {
+            "action_items": ["action1", "action2", "action3"]
+        }
+    """,
+    user="""
+        Email Content:
+        {content}
+    """
+))
+
+register(PromptTemplate(
+    name="extract_action_items_batch",
+    version=2,
+    system="""
+        You are an action item extraction specialist. Extract action items and tasks from each numbered email you are given independently.
+        Focus on specific, actionable tasks that require follow-up.
+
+        Respond with a single JSON object with exactly one list per email, in the same order:
+        {
+            "results": [["action1", "action2"], []]
+        }
+    """,
+    user="""
+        Number of items: {count}
+
+        {content}
+    """
+))
+
+register(PromptTemplate(
+    name="categorize_emails_batch",
+    version=1,
+    system="""
+        You are an email organization expert. Categorize each numbered email you are given independently, using its sender, subject and preview.
+
+        Available categories:
+        - action_needed: asks the recipient to reply, decide, approve, pay or do something
+        - meeting: meeting invitations, scheduling, calendar changes
+        - fyi: informational updates that need no action
+        - newsletter: newsletters, digests, mailing lists
+        - personal: personal communication from friends or family
+        - promotional: marketing, advertisements, sales
+        - notification: automated alerts, receipts, account and system notices
+
+        Respond with a single JSON object holding exactly one category name per email, in the same order:
+        {
+            "results": ["action_needed", "fyi"]
+        }
+    """,
+    user="""
+        Number of items: {count}
+
+        {content}
+    """
+))
+
+def get_template(name: str) -> PromptTemplate:
+    return TEMPLATES[name]
+
+def render_prompt(name: str, **values) -> List[Dict]:
+    """
+    Chat messages for the named template
+    """
+    return TEMPLATES[name].render(**values)
+
+def get_template_info() -> List[Dict]:
+    """
+    Name, version and static prefix size of every registered template, and
+    whether the prefix alone is long enough for provider prompt caching
+    """
+    return [
+        {"name": template.name, "version": template.version, "prefix_hash": template.prefix_hash,
+         "system_tokens": template.system_tokens,
+         "prefix_cacheable": template.system_tokens >= PROVIDER_CACHE_MIN_TOKENS}
+        for template in TEMPLATES.values()
+    ]
@@ -0,0 +1,214 @@
+import asyncio
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Dict, Optional, TypeVar
+
+from fastapi import HTTPException, Request
+
+from config import REQUEST_DEADLINE_SECONDS, REQUEST_DEADLINE_MAX_SECONDS, DISCONNECT_POLL_SECONDS
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Non-standard status (nginx) for work abandoned because the client went away
+CLIENT_CLOSED_REQUEST = 499
+
+class DeadlineExceeded(Exception):
+    """
+    Raised instead of starting upstream work after the request deadline
+    """
+    pass
+
+class RequestCancelled(Exception):
+    """
+    Raised in worker threads once the client that started the work has gone
+    """
+    pass
+
+class RequestScope:
+    """
+    Deadline and cancellation flag for one request. Stored in a context
+    variable, so it follows the request into tasks and asyncio.to_thread.
+    Background scopes (speculative work) give way to everything else.
+    """
+
+    def __init__(self, timeout: float, background: bool = False):
+        self.deadline = time.monotonic() + timeout
+        self.cancelled = threading.Event()
+        self.background = background
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+_current_scope: ContextVar[Optional[RequestScope]] = ContextVar("request_scope", default=None)
+
+_stats = {"requests": 0, "client_disconnects": 0, "deadlines_exceeded": 0}
+_stats_lock = threading.Lock()
+
+# Upstream calls in flight on behalf of non-background work
+_interactive_calls = 0
+
+def _count(counter: str) -> None:
+    with _stats_lock:
+        _stats[counter] += 1
+
+def get_request_stats() -> Dict:
+    with _stats_lock:
+        return dict(_stats, interactive_upstream_calls=_interactive_calls)
+
+def current_scope() -> Optional[RequestScope]:
+    return _current_scope.get()
+
+def is_background() -> bool:
+    scope = _current_scope.get()
+    return scope is not None and scope.background
+
+@contextmanager
+def upstream_call_slot():
+    """
+    Mark an upstream call in flight; background work waits while any
+    interactive call is running
+    """
+    global _interactive_calls
+    if is_background():
+        yield
+        return
+
+    with _stats_lock:
+        _interactive_calls += 1
+    try:
+        yield
+    finally:
+        with _stats_lock:
+            _interactive_calls -= 1
+
+async def wait_for_interactive_idle(poll_seconds: float = 0.1) -> None:
+    """
+    Return once no interactive upstream call is in flight
+    """
+    while _interactive_calls > 0:
+        await asyncio.sleep(poll_seconds)
+
+def remaining_time() -> Optional[float]:
+    """
+    Seconds left before the current request's deadline, or None outside a request
+    """
+    scope = _current_scope.get()
+    return scope.remaining() if scope else None
+
+def check_deadline() -> None:
+    """
+    Raise if the current request has been abandoned or is out of time
+    """
+    scope = _current_scope.get()
+    if scope is None:
+        return
+    if scope.cancelled.is_set():
+        raise RequestCancelled("Client disconnected")
+    if scope.remaining() <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+
+def deadline_exceeded() -> bool:
+    scope = _current_scope.get()
+    return scope is not None and (scope.cancelled.is_set() or scope.remaining() <= 0)
+
+def call_timeout(default: float) -> float:
+    """
+    Timeout for one upstream call: the default, capped by the time left
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return default
+    return max(0.001, min(default, remaining))
+
+def start_scope(timeout: float = REQUEST_DEADLINE_SECONDS, background: bool = False) -> RequestScope:
+    """
+    Give the current context a fresh deadline, e.g. for background work
+    """
+    scope = RequestScope(timeout, background)
+    _current_scope.set(scope)
+    return scope
+
+class RequestDeadlineMiddleware:
+    """
+    ASGI middleware that opens a RequestScope for every HTTP request
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timeout = REQUEST_DEADLINE_SECONDS
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-timeout":
+                try:
+                    timeout = min(max(float(value), 0.1), REQUEST_DEADLINE_MAX_SECONDS)
+                except ValueError:
+                    pass
+                break
+
+        _count("requests")
+        token = _current_scope.set(RequestScope(timeout))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current_scope.reset(token)
+
+async def run_cancellable(request: Request, work: Awaitable[T]) -> T:
+    """
+    Await work as a task while watching for client disconnect and the
+    request deadline. Either one cancels the task, including LLM calls in
+    flight, and raises 499 or 504 respectively.
+    """
+    scope = _current_scope.get()
+    task = asyncio.ensure_future(work)
+
+    try:
+        while True:
+            wait = DISCONNECT_POLL_SECONDS if scope is None else max(0.0, min(DISCONNECT_POLL_SECONDS, scope.remaining()))
+            done, _ = await asyncio.wait({task}, timeout=wait)
+
+            if done:
+                try:
+                    return task.result()
+                except HTTPException as e:
+                    if e.status_code >= 500 and deadline_exceeded():
+                        raise _deadline_error() from e
+                    raise
+                except (DeadlineExceeded, RequestCancelled) as e:
+                    raise _deadline_error() from e
+
+            if await request.is_disconnected():
+                _count("client_disconnects")
+                logger.info(f"🔌 Client disconnected; cancelling {request.method} {request.url.path}")
+                raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+
+            if scope is not None and scope.remaining() <= 0:
+                raise _deadline_error()
+    finally:
+        if not task.done():
+            if scope is not None:
+                scope.cancelled.set()
+            task.cancel()
+
+def _deadline_error() -> HTTPException:
+    _count("deadlines_exceeded")
+    return HTTPException(status_code=504, detail="Request deadline exceeded")
+
+def _request_metrics():
+    stats = get_request_stats()
+    yield ("intellimail_request_aborts_total", "counter", "Requests abandoned on client disconnect or deadline",
+           [({"reason": "client_disconnect"}, stats["client_disconnects"]),
+            ({"reason": "deadline_exceeded"}, stats["deadlines_exceeded"])])
+    yield ("intellimail_interactive_upstream_calls", "gauge", "Upstream calls in flight for interactive requests",
+           [({}, stats["interactive_upstream_calls"])])
+
+registry.add_collector(_request_metrics)
@@ -0,0 +1,378 @@
+import asyncio
+import random
+import socket
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from config import (
+    RETRY_MAX_ATTEMPTS,
+    RETRY_BASE_DELAY_SECONDS,
+    RETRY_MAX_DELAY_SECONDS,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_SECONDS,
+    HEDGE_MIN_DELAY_MS,
+)
+from services.request_context import (
+    DeadlineExceeded,
+    RequestCancelled,
+    check_deadline,
+    deadline_exceeded,
+    remaining_time,
+    upstream_call_slot,
+)
+from services.metrics import registry, UPSTREAM_DURATION, UPSTREAM_ERRORS, UPSTREAM_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+# Error classes
+RETRYABLE = "retryable"
+RATE_LIMITED = "rate_limited"
+TIMEOUT = "timeout"
+FATAL = "fatal"
+
+# Latency samples kept per upstream for the hedging delay
+LATENCY_WINDOW = 200
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit breaker is open
+    """
+    pass
+
+def classify_error(error: Exception) -> str:
+    """
+    Classify an OpenAI or Gmail client error as retryable, rate limited,
+    timeout or fatal
+    """
+    name = type(error).__name__
+
+    if name in ("APITimeoutError", "Timeout") or isinstance(error, (TimeoutError, socket.timeout, asyncio.TimeoutError)):
+        return TIMEOUT
+    if name == "RateLimitError":
+        return RATE_LIMITED
+    if name in ("APIConnectionError", "InternalServerError", "ServiceUnavailableError") or isinstance(error, ConnectionError):
+        return RETRYABLE
+
+    # openai.APIStatusError and googleapiclient HttpError both carry an HTTP status
+    status = getattr(error, "status_code", None)
+    if status is None and getattr(error, "resp", None) is not None:
+        status = getattr(error.resp, "status", None)
+    try:
+        status = int(status) if status is not None else None
+    except (TypeError, ValueError):
+        status = None
+
+    if status == 429:
+        return RATE_LIMITED
+    if status in (408, 500, 502, 503, 504):
+        return RETRYABLE
+
+    return FATAL
+
+class CircuitBreaker:
+    """
+    Opens after consecutive upstream failures and fails fast until
+    reset_timeout has passed, then lets a single probe call through
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """
+        Admit a call or raise CircuitOpenError. Returns True when the call
+        is the half-open probe, which must end in record_success,
+        record_failure or release_probe.
+        """
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError(f"{self.name} circuit is open; failing fast")
+                self.state = "half_open"
+                self._probe_in_flight = False
+
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    raise CircuitOpenError(f"{self.name} circuit is half-open; probe in progress")
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release_probe(self) -> None:
+        """
+        End a probe that says nothing about upstream health (cancelled, or
+        abandoned at the request deadline), so the next call probes instead
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"✅ {self.name} circuit closed")
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                    logger.warning(f"⚠️ {self.name} circuit opened after {self.consecutive_failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+class Upstream:
+    """
+    Retries, circuit breaking and optional hedging for one upstream service
+    """
+
+    def __init__(self, name: str, max_attempts: int = RETRY_MAX_ATTEMPTS,
+                 base_delay: float = RETRY_BASE_DELAY_SECONDS, max_delay: float = RETRY_MAX_DELAY_SECONDS):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(name)
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        # Attempts currently waiting on the upstream; shutdown drains these
+        self.in_flight = 0
+        self.counters = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0, "short_circuited": 0,
+            "hedges_started": 0, "hedges_won": 0, "abandoned": 0, RETRYABLE: 0, RATE_LIMITED: 0, TIMEOUT: 0, FATAL: 0
+        }
+
+    def backoff_delay(self, attempt: int, error_class: str) -> float:
+        """
+        Full-jitter exponential backoff; rate limits start from a longer base
+        """
+        base = self.base_delay * (4 if error_class == RATE_LIMITED else 1)
+        return random.uniform(0, min(self.max_delay, base * 2 ** attempt))
+
+    def hedge_delay(self) -> float:
+        """
+        Seconds to wait before hedging: the recent p95 latency
+        """
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 20:
+            return max(HEDGE_MIN_DELAY_MS / 1000, 2.0)
+        return max(HEDGE_MIN_DELAY_MS / 1000, samples[int(len(samples) * 0.95) - 1])
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], hedge: bool = False) -> Any:
+        """
+        Await fn() with retries and the circuit breaker. With hedge, a second
+        identical attempt starts if the first is slower than the recent p95.
+        No attempt or retry is started past the request deadline.
+        """
+        last_error: Optional[Exception] = None
+
+        for attempt in range(self.max_attempts):
+            check_deadline()
+            probe = self._before_attempt()
+            started = time.monotonic()
+            try:
+                with self._attempt():
+                    result = await (self._hedged(fn) if hedge else fn())
+            except (CircuitOpenError, DeadlineExceeded, RequestCancelled):
+                self._release(probe)
+                raise
+            except Exception as e:
+                self._raise_if_abandoned(e, probe)
+                error_class = self._after_failure(e, time.monotonic() - started)
+                last_error = e
+                delay = self.backoff_delay(attempt, error_class)
+                if error_class == FATAL or attempt == self.max_attempts - 1 or not self._has_time_for(delay):
+                    raise
+                self._count("retries")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled: neither success nor failure
+                self._release(probe)
+                raise
+
+            self._after_success(time.monotonic() - started)
+            return result
+
+        raise last_error
+
+    def call_sync(self, fn: Callable[[], Any], retry: bool = True) -> Any:
+        """
+        Blocking variant of call() for synchronous clients such as the Gmail API
+        """
+        last_error: Optional[Exception] = None
+        attempts = self.max_attempts if retry else 1
+
+        for attempt in range(attempts):
+            check_deadline()
+            probe = self._before_attempt()
+            started = time.monotonic()
+            try:
+                with self._attempt():
+                    result = fn()
+            except (CircuitOpenError, DeadlineExceeded, RequestCancelled):
+                self._release(probe)
+                raise
+            except Exception as e:
+                self._raise_if_abandoned(e, probe)
+                error_class = self._after_failure(e, time.monotonic() - started)
+                last_error = e
+                delay = self.backoff_delay(attempt, error_class)
+                if error_class == FATAL or attempt == attempts - 1 or not self._has_time_for(delay):
+                    raise
+                self._count("retries")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self._release(probe)
+                raise
+
+            self._after_success(time.monotonic() - started)
+            return result
+
+        raise last_error
+
+    async def _hedged(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        primary = asyncio.ensure_future(fn())
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay())
+            if done:
+                return primary.result()
+
+            self._count("hedges_started")
+            backup = asyncio.ensure_future(fn())
+            tasks.append(backup)
+            pending = {primary, backup}
+            error: Optional[Exception] = None
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._count("hedges_won")
+                        return task.result()
+                    error = task.exception()
+
+            raise error
+        finally:
+            # The loser, or both attempts when the caller is cancelled
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _raise_if_abandoned(self, error: Exception, probe: bool) -> None:
+        # A timeout cut short by our own deadline says nothing about upstream health
+        if deadline_exceeded():
+            self._count("abandoned")
+            self._release(probe)
+            raise DeadlineExceeded("Request deadline exceeded") from error
+
+    def _release(self, probe: bool) -> None:
+        if probe:
+            self.breaker.release_probe()
+
+    @staticmethod
+    def _has_time_for(delay: float) -> bool:
+        remaining = remaining_time()
+        return remaining is None or remaining > delay
+
+    def _before_attempt(self) -> bool:
+        self._count("calls")
+        try:
+            return self.breaker.before_call()
+        except CircuitOpenError:
+            self._count("short_circuited")
+            UPSTREAM_ERRORS.labels(self.name, "circuit_open").inc()
+            raise
+
+    @contextmanager
+    def _attempt(self):
+        in_flight = UPSTREAM_IN_FLIGHT.labels(self.name)
+        in_flight.inc()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            with upstream_call_slot():
+                yield
+        finally:
+            in_flight.dec()
+            with self._lock:
+                self.in_flight -= 1
+
+    def _after_success(self, latency: float) -> None:
+        self.breaker.record_success()
+        with self._lock:
+            self.counters["successes"] += 1
+            self._latencies.append(latency)
+        UPSTREAM_DURATION.labels(self.name, "success").observe(latency)
+
+    def _after_failure(self, error: Exception, latency: float) -> str:
+        error_class = classify_error(error)
+        with self._lock:
+            self.counters["failures"] += 1
+            self.counters[error_class] += 1
+        UPSTREAM_DURATION.labels(self.name, "failure").observe(latency)
+        UPSTREAM_ERRORS.labels(self.name, error_class).inc()
+        # Client errors (bad request, not found) say nothing about upstream health
+        if error_class == FATAL:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        return error_class
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    def state(self) -> Dict:
+        """
+        Breaker state and counters for this upstream
+        """
+        with self._lock:
+            counters = dict(self.counters)
+            samples = sorted(self._latencies)
+        return {
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "times_opened": self.breaker.times_opened,
+            "in_flight": self.in_flight,
+            "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 1) if len(samples) >= 20 else None,
+            "counters": counters
+        }
+
+# One instance per upstream, shared by every request on this worker
+openai_upstream = Upstream("openai")
+gmail_upstream = Upstream("gmail")
+
+def get_upstream_states() -> Dict[str, Dict]:
+    """
+    State and counters for every upstream
+    """
+    return {upstream.name: upstream.state() for upstream in (openai_upstream, gmail_upstream)}
+
+def _breaker_metrics():
+    yield ("intellimail_upstream_circuit_open", "gauge", "1 while the upstream circuit breaker is open or half-open",
+           [({"upstream": upstream.name}, 0.0 if upstream.breaker.state == "closed" else 1.0)
+            for upstream in (openai_upstream, gmail_upstream)])
+
+registry.add_collector(_breaker_metrics)
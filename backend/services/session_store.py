@@ -0,0 +1,499 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import (
+    SESSION_TTL_SECONDS,
+    SESSION_SWEEP_INTERVAL_SECONDS,
+    SESSION_STORE,
+    SESSION_STORE_PATH,
+    SESSION_CACHE_TTL_SECONDS,
+    SESSION_CACHE_MAX_ENTRIES,
+    SUPERSEDED_TOKEN_GRACE_SECONDS,
+)
+
+class SessionStore:
+    """
+    Signed-in users by email, looked up by email, access token or refresh
+    token. A session is a plain dict (session_id, access_token,
+    refresh_token, user_info, access_token_expires_at, expires_at) so any
+    backend can hold it. Each login gets a new session_id, which session
+    tokens carry so they only identify the login that issued them. Sessions expire SESSION_TTL_SECONDS after login or the last token
+    refresh.
+
+    Backends shared across processes (SQLiteSessionStore on one node, or a
+    network store such as Redis implementing these methods) let several
+    workers serve the same users.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS):
+        self.ttl = ttl
+
+    def put(self, email: str, access_token: str, refresh_token: Optional[str], user_info: Dict,
+            access_token_expires_at: Optional[float] = None) -> Dict:
+        """
+        Store (or replace) the session for a user
+        """
+        raise NotImplementedError
+
+    def get(self, email: str) -> Optional[Dict]:
+        """
+        Live session for a user, if any
+        """
+        raise NotImplementedError
+
+    def find_by_access_token(self, access_token: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def find_by_refresh_token(self, refresh_token: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def update_access_token(self, email: str, access_token: str,
+                            access_token_expires_at: Optional[float] = None) -> bool:
+        """
+        Swap in a refreshed access token and release the refresh claim.
+        The replaced token keeps identifying the session for
+        SUPERSEDED_TOKEN_GRACE_SECONDS, since clients may still hold it,
+        and is forgotten after that.
+        """
+        raise NotImplementedError
+
+    def claim_refresh(self, email: str, access_token: str, until: float) -> bool:
+        """
+        Claim the refresh of a user's access token until the given time, so
+        one worker refreshes it while the others wait for its token. Fails
+        if the session no longer holds access_token (another worker already
+        refreshed it) or another claim is still live.
+        """
+        raise NotImplementedError
+
+    def release_refresh(self, email: str, until: Optional[float] = None) -> None:
+        """
+        End a refresh claim without a new token. With until, the claim is
+        held to that time instead, so no worker retries before then.
+        """
+        raise NotImplementedError
+
+    def remove(self, email: str) -> bool:
+        raise NotImplementedError
+
+    def expiring(self, before: float) -> List[Dict]:
+        """
+        Live, unclaimed sessions with a refresh token whose access token
+        expires before the given time
+        """
+        raise NotImplementedError
+
+    def _new_session(self, email: str, access_token: str, refresh_token: Optional[str], user_info: Dict,
+                     access_token_expires_at: Optional[float]) -> Dict:
+        return {
+            "email": email,
+            "session_id": uuid.uuid4().hex,
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "user_info": user_info,
+            "access_token_expires_at": access_token_expires_at,
+            "expires_at": time.time() + self.ttl
+        }
+
+class MemorySessionStore(SessionStore):
+    """
+    Sessions in this process only, with hash indexes from access and refresh
+    tokens. Expired sessions are evicted on lookup and by a periodic sweep.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS):
+        super().__init__(ttl)
+        self._sessions: Dict[str, Dict] = {}
+        self._by_access_token: Dict[str, str] = {}
+        self._by_refresh_token: Dict[str, str] = {}
+        # Access tokens per session, with the time each superseded one stops working (None: current)
+        self._tokens: Dict[str, Dict[str, Optional[float]]] = {}
+        self._refresh_claims: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+
+    def put(self, email: str, access_token: str, refresh_token: Optional[str], user_info: Dict,
+            access_token_expires_at: Optional[float] = None) -> Dict:
+        session = self._new_session(email, access_token, refresh_token, user_info, access_token_expires_at)
+
+        with self._lock:
+            self._drop(email)
+            self._sessions[email] = session
+            self._by_access_token[access_token] = email
+            self._tokens[email] = {access_token: None}
+            if refresh_token:
+                self._by_refresh_token[refresh_token] = email
+            if time.time() - self._last_sweep >= SESSION_SWEEP_INTERVAL_SECONDS:
+                self._sweep()
+
+        return dict(session)
+
+    def get(self, email: str) -> Optional[Dict]:
+        with self._lock:
+            return self._live(email)
+
+    def find_by_access_token(self, access_token: str) -> Optional[Dict]:
+        with self._lock:
+            email = self._by_access_token.get(access_token)
+            if not email:
+                return None
+            superseded_until = self._tokens.get(email, {}).get(access_token)
+            if superseded_until is not None and superseded_until <= time.time():
+                self._forget_token(email, access_token)
+                return None
+            return self._live(email)
+
+    def find_by_refresh_token(self, refresh_token: str) -> Optional[Dict]:
+        with self._lock:
+            email = self._by_refresh_token.get(refresh_token)
+            return self._live(email) if email else None
+
+    def update_access_token(self, email: str, access_token: str,
+                            access_token_expires_at: Optional[float] = None) -> bool:
+        with self._lock:
+            session = self._sessions.get(email)
+            if not session or session["expires_at"] <= time.time():
+                return False
+            session["access_token"] = access_token
+            session["access_token_expires_at"] = access_token_expires_at
+            session["expires_at"] = time.time() + self.ttl
+            now = time.time()
+            tokens = self._tokens.setdefault(email, {})
+            for token, superseded_until in list(tokens.items()):
+                if superseded_until is None:
+                    tokens[token] = now + SUPERSEDED_TOKEN_GRACE_SECONDS
+                elif superseded_until <= now:
+                    self._forget_token(email, token)
+            tokens[access_token] = None
+            self._by_access_token[access_token] = email
+            self._refresh_claims.pop(email, None)
+            return True
+
+    def claim_refresh(self, email: str, access_token: str, until: float) -> bool:
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(email)
+            if (not session or session["expires_at"] <= now or session["access_token"] != access_token
+                    or self._refresh_claims.get(email, 0) > now):
+                return False
+            self._refresh_claims[email] = until
+            return True
+
+    def release_refresh(self, email: str, until: Optional[float] = None) -> None:
+        with self._lock:
+            if until is None:
+                self._refresh_claims.pop(email, None)
+            elif email in self._sessions:
+                self._refresh_claims[email] = until
+
+    def remove(self, email: str) -> bool:
+        with self._lock:
+            return self._drop(email)
+
+    def expiring(self, before: float) -> List[Dict]:
+        now = time.time()
+        with self._lock:
+            return [dict(session) for session in self._sessions.values()
+                    if session["expires_at"] > now and session.get("refresh_token")
+                    and session.get("access_token_expires_at") is not None
+                    and session["access_token_expires_at"] < before
+                    and self._refresh_claims.get(session["email"], 0) <= now]
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _live(self, email: str) -> Optional[Dict]:
+        session = self._sessions.get(email)
+        if session and session["expires_at"] <= time.time():
+            self._drop(email)
+            return None
+        return dict(session) if session else None
+
+    def _forget_token(self, email: str, access_token: str) -> None:
+        self._tokens.get(email, {}).pop(access_token, None)
+        if self._by_access_token.get(access_token) == email:
+            del self._by_access_token[access_token]
+
+    def _drop(self, email: str) -> bool:
+        session = self._sessions.pop(email, None)
+        self._refresh_claims.pop(email, None)
+        if not session:
+            return False
+        for token in self._tokens.pop(email, []):
+            self._by_access_token.pop(token, None)
+        if session.get("refresh_token"):
+            self._by_refresh_token.pop(session["refresh_token"], None)
+        return True
+
+    def _sweep(self) -> None:
+        now = self._last_sweep = time.time()
+        for email in [email for email, session in self._sessions.items() if session["expires_at"] <= now]:
+            self._drop(email)
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessions in a SQLite database in WAL mode, shared by every worker
+    process on the node. Token lookups go through indexes.
+    """
+
+    COLUMNS = "email, access_token, refresh_token, user_info, access_token_expires_at, expires_at, session_id"
+
+    def __init__(self, db_path: str = SESSION_STORE_PATH, ttl: float = SESSION_TTL_SECONDS):
+        super().__init__(ttl)
+        self.db_path = db_path
+        self._last_sweep = 0.0
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    email TEXT PRIMARY KEY,
+                    access_token TEXT NOT NULL,
+                    refresh_token TEXT,
+                    user_info TEXT NOT NULL,
+                    access_token_expires_at REAL,
+                    expires_at REAL NOT NULL,
+                    session_id TEXT,
+                    refresh_claimed_until REAL
+                )
+                """
+            )
+            # Columns added since the first release; older sessions have no id, so no session token matches them
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+            for column, kind in (("session_id", "TEXT"), ("refresh_claimed_until", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} {kind}")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_access_token ON sessions (access_token)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_refresh_token ON sessions (refresh_token)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_token_expiry ON sessions (access_token_expires_at)")
+            # A session's current access token (expires_at NULL) and the ones refreshes replaced
+            # recently, each with the time it stops identifying the session
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS session_tokens (
+                    access_token TEXT PRIMARY KEY,
+                    email TEXT NOT NULL,
+                    expires_at REAL
+                )
+                """
+            )
+            if "expires_at" not in {row[1] for row in conn.execute("PRAGMA table_info(session_tokens)")}:
+                conn.execute("ALTER TABLE session_tokens ADD COLUMN expires_at REAL")
+                # Tokens kept from before superseded tokens expired: all but the current one get the grace period
+                conn.execute(
+                    "UPDATE session_tokens SET expires_at = ? "
+                    "WHERE access_token NOT IN (SELECT access_token FROM sessions)",
+                    (time.time() + SUPERSEDED_TOKEN_GRACE_SECONDS,)
+                )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_session_tokens_email ON session_tokens (email)")
+            conn.execute("INSERT OR IGNORE INTO session_tokens (access_token, email) SELECT access_token, email FROM sessions")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # sqlite3's own context manager only commits; closing() releases the handle
+        with closing(sqlite3.connect(self.db_path, timeout=10)) as conn:
+            with conn:
+                yield conn
+
+    def put(self, email: str, access_token: str, refresh_token: Optional[str], user_info: Dict,
+            access_token_expires_at: Optional[float] = None) -> Dict:
+        session = self._new_session(email, access_token, refresh_token, user_info, access_token_expires_at)
+
+        with self._connect() as conn:
+            # A token reused by another account would violate the unique index
+            conn.execute("DELETE FROM sessions WHERE access_token = ? AND email != ?", (access_token, email))
+            conn.execute(
+                f"INSERT OR REPLACE INTO sessions ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (email, access_token, refresh_token, json.dumps(user_info),
+                 access_token_expires_at, session["expires_at"], session["session_id"])
+            )
+            conn.execute("DELETE FROM session_tokens WHERE email = ?", (email,))
+            conn.execute("INSERT OR REPLACE INTO session_tokens (access_token, email) VALUES (?, ?)", (access_token, email))
+            if time.time() - self._last_sweep >= SESSION_SWEEP_INTERVAL_SECONDS:
+                self._last_sweep = time.time()
+                conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (self._last_sweep,))
+                conn.execute("DELETE FROM session_tokens WHERE email NOT IN (SELECT email FROM sessions) "
+                             "OR expires_at <= ?", (self._last_sweep,))
+
+        return session
+
+    def get(self, email: str) -> Optional[Dict]:
+        return self._find("email", email)
+
+    def find_by_access_token(self, access_token: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT email FROM session_tokens WHERE access_token = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (access_token, time.time())
+            ).fetchone()
+        return self._find("email", row[0]) if row else None
+
+    def find_by_refresh_token(self, refresh_token: str) -> Optional[Dict]:
+        return self._find("refresh_token", refresh_token)
+
+    def update_access_token(self, email: str, access_token: str,
+                            access_token_expires_at: Optional[float] = None) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE sessions SET access_token = ?, access_token_expires_at = ?, expires_at = ?, "
+                "refresh_claimed_until = NULL WHERE email = ? AND expires_at > ?",
+                (access_token, access_token_expires_at, time.time() + self.ttl, email, time.time())
+            )
+            if cursor.rowcount:
+                now = time.time()
+                conn.execute("DELETE FROM session_tokens WHERE email = ? AND expires_at <= ?", (email, now))
+                conn.execute(
+                    "UPDATE session_tokens SET expires_at = ? WHERE email = ? AND expires_at IS NULL AND access_token != ?",
+                    (now + SUPERSEDED_TOKEN_GRACE_SECONDS, email, access_token)
+                )
+                conn.execute("INSERT OR REPLACE INTO session_tokens (access_token, email, expires_at) VALUES (?, ?, NULL)",
+                             (access_token, email))
+            return cursor.rowcount > 0
+
+    def claim_refresh(self, email: str, access_token: str, until: float) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE sessions SET refresh_claimed_until = ? WHERE email = ? AND access_token = ? "
+                "AND expires_at > ? AND (refresh_claimed_until IS NULL OR refresh_claimed_until <= ?)",
+                (until, email, access_token, now, now)
+            )
+            return cursor.rowcount > 0
+
+    def release_refresh(self, email: str, until: Optional[float] = None) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE sessions SET refresh_claimed_until = ? WHERE email = ?", (until, email))
+
+    def remove(self, email: str) -> bool:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM session_tokens WHERE email = ?", (email,))
+            cursor = conn.execute("DELETE FROM sessions WHERE email = ?", (email,))
+            return cursor.rowcount > 0
+
+    def expiring(self, before: float) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {self.COLUMNS} FROM sessions WHERE access_token_expires_at < ? "
+                f"AND refresh_token IS NOT NULL AND expires_at > ? "
+                f"AND (refresh_claimed_until IS NULL OR refresh_claimed_until <= ?)",
+                (before, time.time(), time.time())
+            ).fetchall()
+        return [self._row_to_session(row) for row in rows]
+
+    def _find(self, column: str, value: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {self.COLUMNS} FROM sessions WHERE {column} = ? AND expires_at > ?",
+                (value, time.time())
+            ).fetchone()
+
+        return self._row_to_session(row) if row else None
+
+    @staticmethod
+    def _row_to_session(row: tuple) -> Dict:
+        return {
+            "email": row[0],
+            "access_token": row[1],
+            "refresh_token": row[2],
+            "user_info": json.loads(row[3]),
+            "access_token_expires_at": row[4],
+            "expires_at": row[5],
+            "session_id": row[6]
+        }
+
+class CachedSessionStore(SessionStore):
+    """
+    Read-through cache in front of a shared store. Lookups by email and
+    access token are served from this process for up to ttl seconds, so
+    most authenticated requests never reach the backend; writes go straight
+    through and drop the affected entries here. Other workers may keep
+    honouring a logged-out or replaced token until their entry expires.
+    """
+
+    def __init__(self, backend: SessionStore, ttl: float = SESSION_CACHE_TTL_SECONDS,
+                 max_entries: int = SESSION_CACHE_MAX_ENTRIES):
+        super().__init__(backend.ttl)
+        self.backend = backend
+        self.cache_ttl = ttl
+        self.max_entries = max_entries
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def put(self, email: str, access_token: str, refresh_token: Optional[str], user_info: Dict,
+            access_token_expires_at: Optional[float] = None) -> Dict:
+        self._invalidate(email)
+        return self.backend.put(email, access_token, refresh_token, user_info, access_token_expires_at)
+
+    def get(self, email: str) -> Optional[Dict]:
+        return self._read(("email", email), lambda: self.backend.get(email))
+
+    def find_by_access_token(self, access_token: str) -> Optional[Dict]:
+        return self._read(("access_token", access_token), lambda: self.backend.find_by_access_token(access_token))
+
+    def find_by_refresh_token(self, refresh_token: str) -> Optional[Dict]:
+        return self.backend.find_by_refresh_token(refresh_token)
+
+    def update_access_token(self, email: str, access_token: str,
+                            access_token_expires_at: Optional[float] = None) -> bool:
+        self._invalidate(email)
+        return self.backend.update_access_token(email, access_token, access_token_expires_at)
+
+    def claim_refresh(self, email: str, access_token: str, until: float) -> bool:
+        if self.backend.claim_refresh(email, access_token, until):
+            return True
+        # Another worker has the refresh, or already swapped in a new token
+        self._invalidate(email)
+        return False
+
+    def release_refresh(self, email: str, until: Optional[float] = None) -> None:
+        self.backend.release_refresh(email, until)
+
+    def remove(self, email: str) -> bool:
+        self._invalidate(email)
+        return self.backend.remove(email)
+
+    def expiring(self, before: float) -> List[Dict]:
+        return self.backend.expiring(before)
+
+    def _read(self, key: Tuple[str, str], load) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > now and (entry[1] is None or entry[1]["expires_at"] > now):
+                self.stats["hits"] += 1
+                return dict(entry[1]) if entry[1] else None
+            self.stats["misses"] += 1
+
+        session = load()
+
+        with self._lock:
+            self._cache[key] = (now + self.cache_ttl, session)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return dict(session) if session else None
+
+    def _invalidate(self, email: str) -> None:
+        with self._lock:
+            session = self._cache.pop(("email", email), (0, None))[1]
+            if session:
+                self._cache.pop(("access_token", session["access_token"]), None)
+            for key in [key for key, (_, cached) in self._cache.items()
+                        if key[0] == "access_token" and cached and cached["email"] == email]:
+                self._cache.pop(key)
+
+def create_session_store() -> SessionStore:
+    """
+    The session store selected by SESSION_STORE ("sqlite" or "memory")
+    """
+    if SESSION_STORE == "memory":
+        return MemorySessionStore()
+    return CachedSessionStore(SQLiteSessionStore())
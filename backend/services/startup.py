@@ -0,0 +1,84 @@
+import asyncio
+import importlib
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from config import STARTUP_WARMUP_DELAY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Imports kept out of module load because they dominate cold start, most
+# expensive first; each is imported where it is used and by warm_up()
+DEFERRED_MODULES = [
+    "openai",
+    "googleapiclient.discovery",
+    "google_auth_oauthlib.flow",
+    "google.auth.transport.requests",
+    "google.oauth2.credentials",
+    "jose.jwt",
+    "html2text",
+    "services.tone_analyzer",
+]
+
+class StartupProfile:
+    """
+    Wall-clock breakdown of process startup: the imports main.py makes
+    before the app can serve, then the deferred imports loaded by the
+    background warm-up. A module shared by several routes is charged to
+    the first one that imports it.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.ready_ms: Optional[float] = None
+        self.warmup_state = "pending"
+        self._steps: List[Dict] = []
+
+    @contextmanager
+    def measure(self, name: str, phase: str = "startup"):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._steps.append({"name": name, "phase": phase,
+                                "ms": round((time.perf_counter() - start) * 1000, 1)})
+
+    def mark_ready(self) -> None:
+        self.ready_ms = round((time.perf_counter() - self.started_at) * 1000, 1)
+        slowest = sorted((step for step in self._steps if step["phase"] == "startup"),
+                         key=lambda step: step["ms"], reverse=True)[:3]
+        logger.info(f"⏱️ Ready to serve {self.ready_ms:.0f}ms after main.py started; slowest: "
+                    + ", ".join(f"{step['name']} {step['ms']:.0f}ms" for step in slowest))
+
+    def report(self) -> Dict:
+        return {
+            "ready_ms": self.ready_ms,
+            "warmup": self.warmup_state,
+            "steps": list(self._steps),
+        }
+
+    async def warm_up(self, modules: List[str] = DEFERRED_MODULES,
+                      delay: float = STARTUP_WARMUP_DELAY_SECONDS) -> None:
+        """
+        Import the deferred modules one at a time in a thread, after giving
+        the server time to start accepting connections. A request that needs
+        one first simply imports it itself.
+        """
+        await asyncio.sleep(delay)
+        self.warmup_state = "running"
+        start = time.perf_counter()
+
+        for name in modules:
+            try:
+                with self.measure(name, phase="warmup"):
+                    await asyncio.to_thread(importlib.import_module, name)
+            except Exception as e:
+                logger.warning(f"⚠️ Warm-up import of {name} failed: {e}")
+
+        self.warmup_state = "done"
+        logger.info(f"🔥 Warm-up imports finished in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+# Created when main.py starts importing, so its clock covers the whole startup
+startup_profile = StartupProfile()
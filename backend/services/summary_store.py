@@ -0,0 +1,89 @@
+import sqlite3
+import json
+import time
+from contextlib import closing, contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from config import SUMMARY_STORE_PATH
+
+class ThreadSummaryStore:
+    """
+    SQLite-backed store of thread summaries and the message ids each one covers
+    """
+    
+    def __init__(self, db_path: str = SUMMARY_STORE_PATH):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS thread_summaries (
+                    user_email TEXT NOT NULL,
+                    thread_id TEXT NOT NULL,
+                    message_ids TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    key_points TEXT NOT NULL,
+                    max_length INTEGER NOT NULL,
+                    merge_count INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (user_email, thread_id)
+                )
+                """
+            )
+    
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # sqlite3's own context manager only commits; closing() releases the handle
+        with closing(sqlite3.connect(self.db_path, timeout=10)) as conn:
+            with conn:
+                yield conn
+    
+    def get(self, user_email: str, thread_id: str) -> Optional[Dict]:
+        """
+        Get the stored summary for a thread, if any
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT message_ids, summary, key_points, max_length, merge_count, updated_at "
+                "FROM thread_summaries WHERE user_email = ? AND thread_id = ?",
+                (user_email, thread_id)
+            ).fetchone()
+        
+        if not row:
+            return None
+        
+        return {
+            "message_ids": json.loads(row[0]),
+            "summary": row[1],
+            "key_points": json.loads(row[2]),
+            "max_length": row[3],
+            "merge_count": row[4],
+            "updated_at": row[5]
+        }
+    
+    def save(self, user_email: str, thread_id: str, message_ids: List[str], summary: str,
+             key_points: List[str], max_length: int, merge_count: int = 0) -> None:
+        """
+        Insert or replace the summary for a thread
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO thread_summaries "
+                "(user_email, thread_id, message_ids, summary, key_points, max_length, merge_count, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_email, thread_id, json.dumps(message_ids), summary,
+                 json.dumps(key_points), max_length, merge_count, time.time())
+            )
+    
+    def delete(self, user_email: str, thread_id: str) -> bool:
+        """
+        Remove the stored summary for a thread
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM thread_summaries WHERE user_email = ? AND thread_id = ?",
+                (user_email, thread_id)
+            )
+            return cursor.rowcount > 0
+
+# Shared by every request on this worker; calls block, so run them off the event loop
+thread_summary_store = ThreadSummaryStore()
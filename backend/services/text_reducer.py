@@ -0,0 +1,174 @@
+import re
+from typing import Dict, List, Tuple
+
+# "On Tue, Mar 5, 2024 at 10:02 AM Jane Doe <jane@example.com> wrote:" (Gmail, Apple Mail, Thunderbird),
+# possibly wrapped over two lines, plus common localized variants
+QUOTE_HEADER = re.compile(
+    r'^[ \t]*(?:On|Le|Am|El|Il|Op)\b[^\n]{0,200}(?:\n[^\n]{0,200})?'
+    r'(?:wrote|a écrit|schrieb|escribió|ha scritto|schreef)\s*:[ \t]*$',
+    re.MULTILINE | re.IGNORECASE
+)
+
+# Outlook separators that start the quoted copy of the previous message
+OUTLOOK_ORIGINAL = re.compile(r'^[ \t]*-{2,}\s*Original Message\s*-{2,}[ \t]*$', re.MULTILINE | re.IGNORECASE)
+OUTLOOK_HEADER_BLOCK = re.compile(
+    r'^[ \t]*\**From:\**[^\n]*\n(?:[ \t]*\**(?:Sent|Date):\**[^\n]*\n)(?:[ \t]*\**(?:To|Cc|Subject):\**[^\n]*\n){1,3}',
+    re.MULTILINE | re.IGNORECASE
+)
+OUTLOOK_RULE = re.compile(r'^[ \t]*_{20,}[ \t]*$', re.MULTILINE)
+
+QUOTED_LINE = re.compile(r'^[ \t]*>[^\n]*(?:\n|$)', re.MULTILINE)
+
+# Forwarded messages keep their content; only the header block is removed
+FORWARD_MARKER = re.compile(
+    r'^[ \t]*(?:-{3,}\s*Forwarded message\s*-{3,}|Begin forwarded message:)[ \t]*\n'
+    r'(?:[ \t]*(?:From|Date|Sent|Subject|To|Cc|Reply-To):[^\n]*\n)*',
+    re.MULTILINE | re.IGNORECASE
+)
+
+SIGNATURE_DELIMITER = re.compile(r'^--[ \t]*$', re.MULTILINE)
+MOBILE_SIGNATURE = re.compile(
+    r'^[ \t]*(?:Sent from my (?:iPhone|iPad|Android|mobile device|Galaxy|BlackBerry)[^\n]*'
+    r'|Get Outlook for (?:iOS|Android)[^\n]*|Sent from (?:Mail|Outlook) for [^\n]*)[ \t]*$',
+    re.MULTILINE | re.IGNORECASE
+)
+CLOSING_LINE = re.compile(
+    r'^[ \t]*(?:best(?: regards| wishes)?|kind regards|warm regards|regards|thanks(?: again)?|thank you|'
+    r'cheers|sincerely|yours(?: truly| sincerely)?|all the best)[,!.]?[ \t]*$',
+    re.MULTILINE | re.IGNORECASE
+)
+
+# Legal boilerplate: a confidentiality claim about who the message is for, or
+# instructions for a recipient it reached by mistake. A passing mention of
+# "the intended recipient" in ordinary prose is not enough.
+LEGAL_DISCLAIMER = re.compile(
+    r'\bconfidential\b[^\n]*(?:\n[^\n]*){0,3}?\bintended (?:solely|only|exclusively) for\b'
+    r'|\bintended (?:solely|only|exclusively) for\b[^\n]*(?:\n[^\n]*){0,3}?\b(?:confidential|privileged)\b'
+    r'|\bif you are not the intended recipient\b'
+    r'|\bif you (?:have )?received this (?:e-?mail|message|communication|transmission) in error\b'
+    r'|^[ \t]*please consider the environment before printing\b',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Lines after a closing that still count as a signature block
+MAX_SIGNATURE_LINES = 6
+MAX_SIGNATURE_LINE_LENGTH = 60
+
+# Contact details: email address, URL, phone number or a labelled contact line
+CONTACT_LINE = re.compile(
+    r'[\w.+-]+@[\w-]+\.[\w.-]+|https?://|www\.|\+?\(?\d[\d\s().-]{6,}\d'
+    r'|^[ \t]*(?:tel|phone|mobile|cell|fax|m|t|e|w)[ \t]*[:.]',
+    re.IGNORECASE
+)
+# Lowercase words allowed in a name or job title ("VP of Sales", "Head of Design & Research")
+TITLE_CONNECTORS = {"of", "and", "&", "at", "for", "the", "in", "to", "de", "van", "von", "|", "-", "/"}
+# Company suffixes that end a line with a period without making it a sentence
+NAME_ABBREVIATION = re.compile(r'\b(?:Inc|Ltd|Co|Corp|LLC|LLP|GmbH|Jr|Sr|PhD|MD)\.$', re.IGNORECASE)
+
+def _cut_at_first(text: str, patterns: List[re.Pattern]) -> Tuple[str, bool]:
+    # A marker only starts quoted history when the message has content above it
+    positions = [
+        next((match.start() for match in pattern.finditer(text) if text[:match.start()].strip()), None)
+        for pattern in patterns
+    ]
+    positions = [position for position in positions if position is not None]
+    if not positions:
+        return text, False
+    return text[:min(positions)], True
+
+def _looks_like_signature_line(line: str) -> bool:
+    line = line.strip()
+    if not line:
+        return True
+    if len(line) > MAX_SIGNATURE_LINE_LENGTH:
+        return False
+    if CONTACT_LINE.search(line):
+        return True
+    # A name, job title or company: no sentence punctuation, every word capitalized
+    if re.search(r'[?!;]', line) or (line.endswith(".") and not NAME_ABBREVIATION.search(line)):
+        return False
+    words = line.replace(",", " ").split()
+    return all(word.lower() in TITLE_CONNECTORS or not word[0].isalpha() or word[0].isupper() for word in words)
+
+def _strip_closing_signature(text: str) -> Tuple[str, bool]:
+    # Only the last closing line can start a signature; anything after it
+    # that reads like message content means there is nothing to strip
+    lines = text.rstrip().split("\n")
+    window_start = max(0, len(lines) - MAX_SIGNATURE_LINES - 1)
+    for index in range(len(lines) - 1, window_start - 1, -1):
+        if CLOSING_LINE.match(lines[index]):
+            trailing = lines[index + 1:]
+            if not trailing or not all(_looks_like_signature_line(line) for line in trailing):
+                return text, False
+            return "\n".join(lines[:index + 1]), True
+    return text, False
+
+def _strip_disclaimers(text: str) -> Tuple[str, int]:
+    # Drop each paragraph from the line where its legal boilerplate starts
+    paragraphs = text.split("\n\n")
+    removed = 0
+    for i, paragraph in enumerate(paragraphs):
+        match = LEGAL_DISCLAIMER.search(paragraph)
+        if match:
+            paragraphs[i] = paragraph[:paragraph.rfind("\n", 0, match.start()) + 1].rstrip()
+            removed += 1
+    return "\n\n".join(paragraphs), removed
+
+def reduce_email_text(text: str) -> Tuple[str, Dict]:
+    """
+    Remove quoted history, forwarded headers, disclaimers and signatures
+    from an email body. Returns the reduced text and a report of what was removed.
+    """
+    report = {
+        "original_bytes": len(text.encode("utf-8")),
+        "reduced_bytes": 0,
+        "bytes_removed": 0,
+        "quoted_history": False,
+        "quoted_lines": 0,
+        "forward_headers": 0,
+        "disclaimers": 0,
+        "signature": False
+    }
+
+    reduced = text.replace("\r\n", "\n")
+
+    reduced, report["forward_headers"] = FORWARD_MARKER.subn("", reduced)
+
+    # Everything after a reply header is the previous message
+    reduced, report["quoted_history"] = _cut_at_first(
+        reduced, [QUOTE_HEADER, OUTLOOK_ORIGINAL, OUTLOOK_HEADER_BLOCK, OUTLOOK_RULE]
+    )
+
+    reduced, report["quoted_lines"] = QUOTED_LINE.subn("", reduced)
+    reduced, report["disclaimers"] = _strip_disclaimers(reduced)
+
+    reduced, signature_cut = _cut_at_first(reduced, [SIGNATURE_DELIMITER, MOBILE_SIGNATURE])
+    reduced, closing_cut = _strip_closing_signature(reduced)
+    report["signature"] = signature_cut or closing_cut
+
+    reduced = re.sub(r'\n[ \t]*\n(?:[ \t]*\n)+', '\n\n', reduced).strip()
+
+    # Never reduce a message to nothing; a body that is entirely quoted is kept as-is
+    if not reduced:
+        reduced = text.strip()
+
+    report["reduced_bytes"] = len(reduced.encode("utf-8"))
+    report["bytes_removed"] = report["original_bytes"] - report["reduced_bytes"]
+
+    return reduced, report
+
+def reduce_thread_bodies(emails: List[Dict]) -> Tuple[List[str], Dict]:
+    """
+    Reduce the body of every email in a thread, returning the reduced bodies
+    in order and an aggregate report
+    """
+    bodies = []
+    totals = {"original_bytes": 0, "reduced_bytes": 0, "bytes_removed": 0, "messages": len(emails)}
+
+    for email in emails:
+        body, report = reduce_email_text(email.get('body', ''))
+        bodies.append(body)
+        for key in ("original_bytes", "reduced_bytes", "bytes_removed"):
+            totals[key] += report[key]
+
+    return bodies, totals
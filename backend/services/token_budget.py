@@ -0,0 +1,164 @@
+import re
+import logging
+from typing import Dict, List, Optional
+
+from config import GPT_MAX_INPUT_TOKENS, GPT_TRUNCATION_STRATEGY
+from services.text_reducer import reduce_email_text
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; fall back to a character heuristic
+    tiktoken = None
+
+# Rough characters-per-token ratio for English email text
+CHARS_PER_TOKEN = 4
+
+# Fixed per-message overhead the chat format adds on top of the content
+TOKENS_PER_MESSAGE = 4
+
+# USD per 1K tokens (prompt, completion)
+MODEL_PRICING = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+TRUNCATION_STRATEGIES = ["head", "tail", "head_tail", "keep_latest_messages", "drop_quoted"]
+
+# Separators used when thread content is assembled in routes/summarize.py
+MESSAGE_SEPARATOR = re.compile(r'\n(?:={10,}|-{3,})\n')
+
+TRUNCATION_MARKER = "\n[...]\n"
+
+_encodings = {}
+
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model]
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """
+    Count tokens in text, exactly when tiktoken is installed
+    """
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def count_message_tokens(messages: List[Dict], model: str = "gpt-4") -> int:
+    """
+    Count prompt tokens for a list of chat messages
+    """
+    return sum(count_tokens(message.get("content", ""), model) + TOKENS_PER_MESSAGE for message in messages) + 2
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Estimate the USD cost of a call
+    """
+    prompt_price, completion_price = MODEL_PRICING.get(model, MODEL_PRICING["gpt-4"])
+    return round(prompt_tokens / 1000 * prompt_price + completion_tokens / 1000 * completion_price, 6)
+
+def truncate_words(text: str, max_words: int) -> str:
+    """
+    Truncate text to at most max_words words
+    """
+    words = text.split()
+    if len(words) <= max_words:
+        return text.strip()
+    return " ".join(words[:max_words]) + "..."
+
+class TokenBudgeter:
+    """
+    Fits variable prompt content into a token budget before it is sent
+    """
+    
+    def __init__(self, max_input_tokens: int = GPT_MAX_INPUT_TOKENS, default_strategy: str = GPT_TRUNCATION_STRATEGY,
+                 model: str = "gpt-4"):
+        if default_strategy not in TRUNCATION_STRATEGIES:
+            logger.warning(f"⚠️ Unknown truncation strategy '{default_strategy}', using head_tail")
+            default_strategy = "head_tail"
+        self.max_input_tokens = max_input_tokens
+        self.default_strategy = default_strategy
+        self.model = model
+    
+    def fit(self, content: str, budget: Optional[int] = None, strategy: Optional[str] = None) -> str:
+        """
+        Return content reduced to fit within budget tokens using the given strategy
+        """
+        budget = budget or self.max_input_tokens
+        strategy = strategy or self.default_strategy
+        
+        if count_tokens(content, self.model) <= budget:
+            return content
+        
+        if strategy == "drop_quoted":
+            content = self._drop_quoted(content)
+            if count_tokens(content, self.model) <= budget:
+                return content
+            strategy = "head_tail"
+        
+        if strategy == "keep_latest_messages":
+            return self._keep_latest_messages(content, budget)
+        
+        max_chars = budget * CHARS_PER_TOKEN
+        if strategy == "head":
+            reduced = content[:max_chars]
+        elif strategy == "tail":
+            reduced = content[-max_chars:]
+        else:
+            half = max_chars // 2
+            reduced = content[:half] + TRUNCATION_MARKER + content[-half:]
+        
+        # The character estimate can overshoot with an exact tokenizer; trim until it fits
+        while count_tokens(reduced, self.model) > budget and len(reduced) > CHARS_PER_TOKEN:
+            reduced = reduced[:int(len(reduced) * 0.9)] if strategy != "tail" else reduced[int(len(reduced) * 0.1):]
+        
+        return reduced
+    
+    def _drop_quoted(self, content: str) -> str:
+        # Reduce message by message so a thread is never cut at its first header
+        parts = MESSAGE_SEPARATOR.split(content)
+        return "\n---\n".join(reduce_email_text(part)[0] for part in parts if part.strip())
+    
+    def _keep_latest_messages(self, content: str, budget: int) -> str:
+        parts = [part for part in MESSAGE_SEPARATOR.split(content) if part.strip()]
+        kept: List[str] = []
+        used = 0
+        
+        for part in reversed(parts):
+            part_tokens = count_tokens(part, self.model)
+            if used + part_tokens > budget:
+                break
+            kept.insert(0, part)
+            used += part_tokens
+        
+        if not kept:
+            # Even the newest message is too large on its own
+            return self.fit(parts[-1], budget, "tail")
+        
+        dropped = len(parts) - len(kept)
+        prefix = f"[{dropped} earlier messages omitted]\n\n" if dropped else ""
+        return prefix + "\n---\n".join(kept)
+    
+    def estimate_call(self, messages: List[Dict], max_tokens: int, model: Optional[str] = None) -> Dict:
+        """
+        Pre-flight estimate of prompt size and worst-case cost for a call
+        """
+        model = model or self.model
+        prompt_tokens = count_message_tokens(messages, model)
+        return {
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "max_completion_tokens": max_tokens,
+            "estimated_cost_usd": estimate_cost(model, prompt_tokens, max_tokens)
+        }
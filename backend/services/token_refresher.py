@@ -0,0 +1,240 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+from config import (
+    GOOGLE_CLIENT_ID,
+    GOOGLE_CLIENT_SECRET,
+    GMAIL_SCOPES,
+    TOKEN_REFRESH_MARGIN_SECONDS,
+    TOKEN_REFRESH_CHECK_SECONDS,
+    TOKEN_REFRESH_RETRY_SECONDS,
+    TOKEN_REFRESH_CONCURRENCY,
+    TOKEN_REFRESH_LEASE_SECONDS,
+)
+from services.session_store import SessionStore
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+logger = logging.getLogger(__name__)
+
+# refresh_fn(session) -> (new access token, expiry as a Unix timestamp or None); blocking
+RefreshFn = Callable[[Dict], Tuple[str, Optional[float]]]
+
+# How often a worker waiting on another worker's refresh re-reads the store
+CLAIM_POLL_SECONDS = 0.2
+
+def credentials_expiry(credentials) -> Optional[float]:
+    """
+    Access token expiry as a Unix timestamp, when Google reported one
+    """
+    expiry = getattr(credentials, 'expiry', None)
+    if expiry is None:
+        return None
+    # google-auth keeps expiry as a naive UTC datetime
+    return expiry.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+def google_credentials(session: Dict) -> "Credentials":
+    """
+    Rebuild Google credentials from a stored session (sessions hold only
+    tokens, so any worker can refresh them)
+    """
+    # google-auth is imported on first use to keep it out of the cold start
+    from google.oauth2.credentials import Credentials
+
+    return Credentials(
+        token=session['access_token'],
+        refresh_token=session['refresh_token'],
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id=GOOGLE_CLIENT_ID,
+        client_secret=GOOGLE_CLIENT_SECRET,
+        scopes=GMAIL_SCOPES
+    )
+
+def refresh_google_token(session: Dict) -> Tuple[str, Optional[float]]:
+    from google.auth.transport.requests import Request
+
+    credentials = google_credentials(session)
+    credentials.refresh(Request())
+    return credentials.token, credentials_expiry(credentials)
+
+class TokenRefresher:
+    """
+    Keeps Google access tokens fresh. A background task refreshes every
+    session whose token expires within TOKEN_REFRESH_MARGIN_SECONDS, and
+    requests that still find a nearly expired token refresh it on the spot.
+    Refreshes hold a per-user lock: callers that arrive while one is running
+    wait for it and reuse its token instead of refreshing again. Across
+    workers, the refresh is first claimed in the shared session store, so
+    only one worker calls Google and the others wait for the token it swaps
+    in. A failed refresh keeps the claim for TOKEN_REFRESH_RETRY_SECONDS,
+    during which no worker retries. Store calls run in threads, since the
+    shared store may block on I/O or locks.
+    """
+
+    def __init__(self, store: SessionStore, refresh_fn: RefreshFn = refresh_google_token):
+        self.store = store
+        self.refresh_fn = refresh_fn
+        # Per-user lock and the number of callers holding or waiting on it; dropped when that reaches zero
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+        self._failed_at: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"refreshed": 0, "on_request": 0, "coalesced": 0, "claimed_elsewhere": 0,
+                         "backed_off": 0, "failed": 0}
+
+    def needs_refresh(self, session: Dict, margin: float = TOKEN_REFRESH_MARGIN_SECONDS) -> bool:
+        expires_at = session.get("access_token_expires_at")
+        return bool(session.get("refresh_token")) and expires_at is not None and expires_at - time.time() < margin
+
+    def backing_off(self, email: str) -> bool:
+        """
+        Whether this worker's last refresh for the user failed within
+        TOKEN_REFRESH_RETRY_SECONDS
+        """
+        return time.time() - self._failed_at.get(email, 0) < TOKEN_REFRESH_RETRY_SECONDS
+
+    async def ensure_fresh(self, session: Dict) -> Dict:
+        """
+        The session, with its token refreshed first if it is about to expire.
+        On a failed refresh, and until the retry delay after one has passed,
+        the current token is returned unchanged.
+        """
+        if not self.needs_refresh(session):
+            return session
+        if self.backing_off(session["email"]):
+            self.counters["backed_off"] += 1
+            return session
+
+        self.counters["on_request"] += 1
+        return await self.refresh(session["email"]) or session
+
+    async def refresh(self, email: str, force: bool = False) -> Optional[Dict]:
+        """
+        Refresh one user's access token unless a concurrent caller, here or
+        on another worker, already has. Returns the updated session, or None
+        if the token was not refreshed.
+        """
+        lock = self._locks.setdefault(email, asyncio.Lock())
+        if lock.locked():
+            self.counters["coalesced"] += 1
+        self._lock_users[email] = self._lock_users.get(email, 0) + 1
+
+        try:
+            async with lock:
+                return await self._refresh_locked(email, force)
+        finally:
+            self._lock_users[email] -= 1
+            if not self._lock_users[email]:
+                del self._lock_users[email]
+                del self._locks[email]
+
+    async def _refresh_locked(self, email: str, force: bool) -> Optional[Dict]:
+        session = await asyncio.to_thread(self.store.get, email)
+        if session is None:
+            return None
+        if not force and not self.needs_refresh(session):
+            # Refreshed while this caller waited for the lock
+            return session
+
+        claimed, session = await self._claim(session, force)
+        if not claimed:
+            return session
+
+        try:
+            access_token, expires_at = await asyncio.to_thread(self.refresh_fn, session)
+        except Exception as e:
+            self.counters["failed"] += 1
+            self._failed_at[email] = time.time()
+            # Keep the claim through the retry delay so no worker retries sooner
+            await asyncio.to_thread(self.store.release_refresh, email, time.time() + TOKEN_REFRESH_RETRY_SECONDS)
+            logger.warning(f"⚠️ Token refresh for {email} failed: {e}")
+            if force:
+                raise
+            return None
+
+        await asyncio.to_thread(self.store.update_access_token, email, access_token, expires_at)
+        self._failed_at.pop(email, None)
+        self.counters["refreshed"] += 1
+        return await asyncio.to_thread(self.store.get, email)
+
+    async def _claim(self, session: Dict, force: bool) -> Tuple[bool, Optional[Dict]]:
+        """
+        Claim the user's refresh in the shared store, waiting while another
+        worker holds it. Returns (True, session) once claimed, otherwise
+        (False, the session another worker refreshed, or None).
+        """
+        email, access_token = session["email"], session["access_token"]
+        deadline = time.time() + TOKEN_REFRESH_LEASE_SECONDS
+        waited = False
+
+        while not await asyncio.to_thread(self.store.claim_refresh, email, access_token,
+                                          time.time() + TOKEN_REFRESH_LEASE_SECONDS):
+            if not waited:
+                self.counters["claimed_elsewhere"] += 1
+                waited = True
+
+            current = await asyncio.to_thread(self.store.get, email)
+            if current is None or current["access_token"] != access_token:
+                return False, current
+
+            expires_at = current.get("access_token_expires_at")
+            if not force and expires_at is not None and expires_at > time.time():
+                # Still valid; the worker holding the claim will swap in the new token
+                return False, None
+            if time.time() >= deadline:
+                # The other worker's refresh failed or stalled; back off here as well
+                self._failed_at[email] = time.time()
+                if force:
+                    raise RuntimeError(f"Token refresh for {email} is held by another worker")
+                return False, None
+            await asyncio.sleep(CLAIM_POLL_SECONDS)
+
+        return True, current if waited else session
+
+    async def refresh_expiring(self) -> int:
+        """
+        Refresh every session whose token expires within the margin; users
+        whose last refresh failed are retried after TOKEN_REFRESH_RETRY_SECONDS
+        """
+        now = time.time()
+        # Failures older than the retry delay no longer hold anyone back
+        self._failed_at = {email: at for email, at in self._failed_at.items() if now - at < TOKEN_REFRESH_RETRY_SECONDS}
+        expiring = await asyncio.to_thread(self.store.expiring, now + TOKEN_REFRESH_MARGIN_SECONDS)
+        emails = [session["email"] for session in expiring if session["email"] not in self._failed_at]
+        if not emails:
+            return 0
+
+        slots = asyncio.Semaphore(TOKEN_REFRESH_CONCURRENCY)
+
+        async def refresh_one(email: str):
+            async with slots:
+                return await self.refresh(email)
+
+        results = await asyncio.gather(*(refresh_one(email) for email in emails))
+        return sum(1 for result in results if result is not None)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh_expiring()
+            except Exception as e:
+                logger.error(f"❌ Token refresh pass failed: {e}")
+            await asyncio.sleep(TOKEN_REFRESH_CHECK_SECONDS)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("🔄 Token refresher started")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict:
+        return dict(self.counters, users_locked=sum(1 for lock in self._locks.values() if lock.locked()))
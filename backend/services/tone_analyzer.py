@@ -0,0 +1,186 @@
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from services.tone_control import ToneController
+
+CONTRACTION = re.compile(r"\b\w+'(?:s|re|ve|ll|d|m|t)\b|\b(?:can't|won't|don't|isn't|aren't|gonna|wanna)\b", re.IGNORECASE)
+WORD = re.compile(r"[A-Za-z']+")
+CAPS_WORD = re.compile(r"\b[A-Z]{2,}\b")
+SENTENCE_END = re.compile(r"[.!?]+")
+
+# Style features computed alongside the per-tone keyword counts; each is
+# scaled into [0, 1] so repeated punctuation or shouting cannot grow it
+STYLE_FEATURES = ["contractions", "exclamations", "caps", "questions"]
+
+# Detection cues beyond ToneController's keywords, which are phrased as
+# writing advice for each tone rather than as signals for recognising it
+EXTRA_KEYWORDS = {
+    "formal": ["dear", "hereby", "pursuant", "furthermore", "aforementioned", "yours faithfully",
+               "i am writing to", "please find enclosed", "formally"],
+    "friendly": ["great to", "lovely", "looking forward", "hope you", "catch up", "hope all is well"],
+    "casual": ["yeah", "yep", "gonna", "lol", "btw", "no worries", "see ya", "thx", "ping", "works for me"],
+    "professional": ["attached", "following up", "as discussed", "regarding", "per our", "review",
+                     "update", "timeline", "schedule", "proposal"],
+    "apologetic": ["unfortunately", "inconvenience", "my fault", "my error", "oversight"],
+    "urgent": ["right away", "as soon as possible", "deadline", "critical", "emergency",
+               "blocked", "today", "expires", "is down", "went down"],
+    "grateful": ["thanks so much", "thank you so much", "means a lot", "gratitude", "above and beyond",
+                 "many thanks"],
+    "polite": ["could you", "would it be possible", "at your convenience", "if that works",
+               "not too much trouble", "when you have a moment", "whenever you have"],
+}
+
+# Suffixes dropped from single-word keywords so inflections match
+# ("immediate" also matches "immediately", "apologize" matches "apologies")
+KEYWORD_SUFFIXES = ("ize", "ise", "e", "y")
+
+# Weight of one keyword hit towards its tone. Style weights stay well below
+# it, so punctuation and capitals only break ties between keyword signals.
+KEYWORD_WEIGHT = 1.5
+
+# Style weights per tone: each under half of one keyword hit (1.5 * log 2),
+# and a tone's positive weights together under one hit
+STYLE_WEIGHTS = {
+    "formal": {"contractions": -0.5, "exclamations": -0.5},
+    "friendly": {"exclamations": 0.4, "contractions": 0.2},
+    "casual": {"exclamations": 0.2, "contractions": 0.4},
+    "professional": {"contractions": -0.2, "exclamations": -0.2},
+    "urgent": {"caps": 0.5, "exclamations": 0.3},
+    "polite": {"questions": 0.5},
+}
+
+# Small prior towards the default tone so empty signal is not a coin flip
+PRIOR = {"professional": 0.2}
+
+# Softmax temperature; lower makes the distribution sharper. Calibrated
+# with loadtest/tone_calibration.py, together with
+# TONE_LOCAL_CONFIDENCE_THRESHOLD.
+TEMPERATURE = 0.2
+
+def keyword_pattern(keyword: str) -> str:
+    """
+    Regex for one lexicon entry: phrases match as written, single words
+    by their stem followed by any word characters
+    """
+    if not re.fullmatch(r"[a-z]+", keyword):
+        return re.escape(keyword) + r"\b"
+    stem = keyword
+    for suffix in KEYWORD_SUFFIXES:
+        if keyword.endswith(suffix) and len(keyword) - len(suffix) >= 4:
+            stem = keyword[:-len(suffix)]
+            break
+    return re.escape(stem) + r"\w*"
+
+class ToneAnalyzer:
+    """
+    In-process tone classifier built on ToneController.tone_configs.
+    Texts are turned into feature rows (keyword hits per tone plus style
+    features) and scored against a weight matrix in one NumPy product.
+    Keyword hits decide the tone; bounded style features only separate
+    tones whose keywords score alike.
+    """
+
+    def __init__(self, tone_controller: Optional[ToneController] = None):
+        self.tone_controller = tone_controller or ToneController()
+        configs = self.tone_controller.tone_configs
+        self.tones = list(configs.keys())
+
+        # Precompiled lexicons per tone, grouped by how many tones share a
+        # keyword; a keyword shared by k tones counts 1/k towards each
+        lexicon_words = {
+            tone: {keyword.lower() for keyword in config["keywords"] + EXTRA_KEYWORDS.get(tone, [])}
+            for tone, config in configs.items()
+        }
+        self.lexicons = []
+        for tone, keywords in lexicon_words.items():
+            groups: Dict[int, List[str]] = {}
+            for keyword in keywords:
+                shared = sum(keyword in other for other in lexicon_words.values())
+                groups.setdefault(shared, []).append(keyword)
+            self.lexicons.append([
+                (re.compile(r"\b(?:" + "|".join(keyword_pattern(keyword) for keyword in sorted(group, key=len, reverse=True)) + r")",
+                            re.IGNORECASE), 1.0 / shared)
+                for shared, group in groups.items()
+            ])
+
+        tone_count = len(self.tones)
+        feature_count = tone_count + len(STYLE_FEATURES)
+        weights = np.zeros((feature_count, tone_count))
+        weights[:tone_count, :tone_count] = np.eye(tone_count) * KEYWORD_WEIGHT
+
+        row = {name: tone_count + i for i, name in enumerate(STYLE_FEATURES)}
+        for column, tone in enumerate(self.tones):
+            for feature, weight in STYLE_WEIGHTS.get(tone, {}).items():
+                weights[row[feature], column] = weight
+
+        self.weights = weights
+        self.prior = np.array([PRIOR.get(tone, 0.0) for tone in self.tones])
+
+    def featurize(self, texts: List[str]) -> np.ndarray:
+        """
+        Build the (len(texts), features) feature matrix
+        """
+        features = np.zeros((len(texts), self.weights.shape[0]))
+        tone_count = len(self.tones)
+
+        for i, text in enumerate(texts):
+            words = max(len(WORD.findall(text)), 1)
+            endings = SENTENCE_END.findall(text) or [""]
+
+            for j, lexicon in enumerate(self.lexicons):
+                features[i, j] = sum(len(pattern.findall(text)) * weight for pattern, weight in lexicon)
+
+            # Share of sentences ending in ! or ?, however many marks each has
+            features[i, tone_count:] = (
+                min(len(CONTRACTION.findall(text)) / words * 5, 1.0),
+                sum("!" in ending for ending in endings) / len(endings),
+                min(len(CAPS_WORD.findall(text)) / words * 4, 1.0),
+                sum("?" in ending for ending in endings) / len(endings),
+            )
+
+        features[:, :tone_count] = np.log1p(features[:, :tone_count])
+        return features
+
+    def score_batch(self, texts: List[str]) -> np.ndarray:
+        """
+        Tone probabilities for each text, shape (len(texts), len(tones))
+        """
+        logits = (self.featurize(texts) @ self.weights + self.prior) / TEMPERATURE
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def analyze_batch(self, texts: List[str]) -> List[Dict]:
+        """
+        Analyze texts in the same shape GPTService.analyze_tone returns
+        """
+        if not texts:
+            return []
+
+        probabilities = self.score_batch(texts)
+        top = probabilities.argmax(axis=1)
+        confidence = probabilities.max(axis=1)
+
+        results = []
+        for i, text in enumerate(texts):
+            primary = self.tones[top[i]]
+            match = self.tone_controller.analyze_tone_match(text, primary)
+            results.append({
+                "primary_tone": primary,
+                "confidence": round(float(confidence[i]), 2),
+                "tone_scores": {tone: round(float(p), 3) for tone, p in zip(self.tones, probabilities[i])},
+                "suggestions": match["suggestions"]
+            })
+
+        return results
+
+    def analyze(self, text: str) -> Dict:
+        """
+        Analyze a single text
+        """
+        return self.analyze_batch([text])[0]
+
+# Built once per worker; lexicons and weights are reused by every request
+tone_analyzer = ToneAnalyzer()
@@ -0,0 +1,263 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_TIMEOUT_SECONDS,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    GMAIL_API_ENDPOINT,
+    GMAIL_MAX_IDLE_CONNECTIONS,
+    UPSTREAM_WARM_CONNECTIONS,
+    UPSTREAM_DRAIN_SECONDS,
+)
+from services.resilience import openai_upstream, gmail_upstream
+
+logger = logging.getLogger(__name__)
+
+GMAIL_ROOT_URL = "https://gmail.googleapis.com/"
+
+class HttpPool:
+    """
+    Thread-safe pool of httplib2 connections, used as the transport of
+    every Gmail API client. httplib2.Http is not thread-safe, so each
+    request borrows one for its duration; idle ones keep their keep-alive
+    connection (and TLS session) for the next request, whichever user it
+    is for.
+    """
+
+    def __init__(self, max_idle: int = GMAIL_MAX_IDLE_CONNECTIONS):
+        self.max_idle = max_idle
+        self._idle: List = []
+        self._lock = threading.Lock()
+        self.counters = {"created": 0, "reused": 0, "discarded": 0}
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                self.counters["reused"] += 1
+                return self._idle.pop()
+            self.counters["created"] += 1
+
+        from googleapiclient.http import build_http
+        return build_http()
+
+    def _checkin(self, http) -> None:
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                # Last in, first out: the most recently used connection is the likeliest still open
+                self._idle.append(http)
+                return
+            self.counters["discarded"] += 1
+        http.close()
+
+    def request(self, *args, **kwargs):
+        http = self._checkout()
+        try:
+            response = http.request(*args, **kwargs)
+        except Exception:
+            # The connection may be half-used; do not hand it to anyone else
+            http.close()
+            raise
+        self._checkin(http)
+        return response
+
+    def warm(self, url: str, count: int) -> int:
+        """
+        Open up to count connections to url and park them in the pool.
+        Returns the number opened.
+        """
+        https = [self._checkout() for _ in range(count)]
+        opened = 0
+        for http in https:
+            try:
+                # Any response will do; the point is the TCP and TLS handshake
+                http.request(url, "HEAD")
+                opened += 1
+            except Exception as e:
+                logger.warning(f"⚠️ Could not pre-open Gmail connection: {e}")
+        for http in https:
+            self._checkin(http)
+        return opened
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for http in idle:
+            http.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counters, idle=len(self._idle))
+
+class UpstreamClients:
+    """
+    Upstream clients shared by every request on a worker: one AsyncOpenAI
+    client with its own connection pool, and a pool of Gmail API
+    connections plus the parsed Gmail discovery document. Both are created
+    on first use. The app lifespan warms them (opening keep-alive
+    connections) before /ready reports ready, and drains them on shutdown.
+    """
+
+    def __init__(self):
+        self.gmail_http = HttpPool()
+        self.ready = False
+        self.warm_connections = {"openai": 0, "gmail": 0}
+        self.warm_errors: Dict[str, str] = {}
+        self._openai = None
+        self._openai_http = None
+        self._openai_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._gmail_document: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    def openai_client(self):
+        """
+        The shared AsyncOpenAI client, or None without an API key. A client's
+        connections belong to one event loop, so a caller on a different
+        loop (a script, a test) gets a new one.
+        """
+        if not OPENAI_API_KEY:
+            return None
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        if self._openai is None or (loop is not None and self._openai_loop not in (None, loop)):
+            self._openai, self._openai_http = self._create_openai_client()
+            self._openai_loop = loop
+        elif self._openai_loop is None:
+            self._openai_loop = loop
+        return self._openai
+
+    @staticmethod
+    def _create_openai_client():
+        import httpx
+        import openai
+
+        # Clear any proxy environment variables that might interfere
+        proxy_vars = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']
+        original_proxies = {}
+        for var in proxy_vars:
+            if var in os.environ:
+                original_proxies[var] = os.environ[var]
+                del os.environ[var]
+                logger.info(f"🔧 Temporarily cleared proxy variable: {var}")
+
+        try:
+            http_client = openai.DefaultAsyncHttpxClient(limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS
+            ))
+            # Retries are handled by the shared resilience layer; the
+            # async client lets a cancelled request abort its HTTP call
+            client = openai.AsyncOpenAI(
+                api_key=OPENAI_API_KEY,
+                base_url=OPENAI_BASE_URL,
+                timeout=OPENAI_TIMEOUT_SECONDS,
+                max_retries=0,
+                http_client=http_client
+            )
+            logger.info("✅ OpenAI client initialized successfully")
+            return client, http_client
+        finally:
+            # Restore proxy environment variables
+            for var, value in original_proxies.items():
+                os.environ[var] = value
+
+    def gmail_document(self) -> Dict:
+        """
+        Gmail v1 discovery document, read from the copy bundled with
+        google-api-python-client and parsed once per worker
+        """
+        if self._gmail_document is None:
+            with self._lock:
+                if self._gmail_document is None:
+                    from googleapiclient.discovery_cache import get_static_doc
+                    self._gmail_document = json.loads(get_static_doc("gmail", "v1"))
+        return self._gmail_document
+
+    def gmail_service(self, credentials):
+        """
+        Gmail API client for one user, sending through the shared connection pool
+        """
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.discovery import build_from_document
+
+        client_options = {"api_endpoint": GMAIL_API_ENDPOINT} if GMAIL_API_ENDPOINT else None
+        return build_from_document(self.gmail_document(), http=AuthorizedHttp(credentials, http=self.gmail_http),
+                                   client_options=client_options)
+
+    async def warm_up(self, connections: int = UPSTREAM_WARM_CONNECTIONS) -> None:
+        """
+        Create the shared clients and open keep-alive connections to each
+        upstream, then report ready. An upstream that cannot be reached is
+        recorded and skipped; its pool fills on demand instead.
+        """
+        start = time.perf_counter()
+        await asyncio.gather(self._warm_openai(connections), self._warm_gmail(connections))
+        self.ready = True
+        logger.info(f"🔌 Upstream connections warm in {(time.perf_counter() - start) * 1000:.0f}ms: "
+                    f"{self.warm_connections}")
+
+    async def _warm_openai(self, connections: int) -> None:
+        try:
+            client = self.openai_client()
+            if client is None:
+                self.warm_errors["openai"] = "not configured"
+                return
+            results = await asyncio.gather(*(self._openai_http.head(str(client.base_url)) for _ in range(connections)),
+                                           return_exceptions=True)
+            self.warm_connections["openai"] = sum(1 for result in results if not isinstance(result, Exception))
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                self.warm_errors["openai"] = str(errors[0])
+        except Exception as e:
+            self.warm_errors["openai"] = str(e)
+            logger.warning(f"⚠️ OpenAI connection warm-up failed: {e}")
+
+    async def _warm_gmail(self, connections: int) -> None:
+        try:
+            await asyncio.to_thread(self.gmail_document)
+            self.warm_connections["gmail"] = await asyncio.to_thread(
+                self.gmail_http.warm, GMAIL_API_ENDPOINT or GMAIL_ROOT_URL, connections)
+        except Exception as e:
+            self.warm_errors["gmail"] = str(e)
+            logger.warning(f"⚠️ Gmail connection warm-up failed: {e}")
+
+    async def close(self, drain_seconds: float = UPSTREAM_DRAIN_SECONDS) -> None:
+        """
+        Stop reporting ready, wait up to drain_seconds for in-flight upstream
+        calls to finish, then close every pooled connection
+        """
+        self.ready = False
+        deadline = time.monotonic() + drain_seconds
+        while (openai_upstream.in_flight or gmail_upstream.in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if openai_upstream.in_flight or gmail_upstream.in_flight:
+            logger.warning(f"⚠️ Closing upstream connections with calls still in flight "
+                           f"(openai: {openai_upstream.in_flight}, gmail: {gmail_upstream.in_flight})")
+
+        if self._openai is not None:
+            await self._openai.close()
+            self._openai = self._openai_http = None
+        self.gmail_http.close()
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "warm_connections": dict(self.warm_connections),
+            "warm_errors": dict(self.warm_errors),
+            "openai_client": self._openai is not None,
+            "gmail_pool": self.gmail_http.stats(),
+        }
+
+# Shared by every request on this worker
+upstream_clients = UpstreamClients()
@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+# Tests import modules the way the app does ("from services.x import ..."),
+# and every SQLite store is created at import time, so point them at a
+# scratch directory before anything from the app is imported
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_store_dir = tempfile.mkdtemp(prefix="intellimail-tests-")
+for _name, _file in (
+    ("SESSION_STORE_PATH", "sessions.db"),
+    ("JOB_STORE_PATH", "jobs.db"),
+    ("PRECOMPUTE_STORE_PATH", "email_summaries.db"),
+    ("SUMMARY_STORE_PATH", "thread_summaries.db"),
+):
+    os.environ[_name] = os.path.join(_store_dir, _file)
+
+# Session tokens are only issued and accepted with a real secret
+os.environ["JWT_SECRET_KEY"] = "tests-7Qm2xV9pLk4Rz8Nw3Jd6Hs1Fb5Tc0Yg"
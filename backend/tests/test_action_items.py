@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from services import gpt_handler
+from services.action_items import extract_action_items
+
+@pytest.mark.parametrize("text, item_type, deadline", [
+    ("Please send the signed contract by Friday.", "imperative", "by Friday"),
+    ("Kindly review the attached invoice.", "imperative", None),
+    ("Can you review the draft when you get a chance?", "request", None),
+    ("You need to renew your badge before 03/31.", "request", "before 03/31"),
+    ("What time works for you?", "question", None),
+    ("The report is due by Friday.", "deadline", "due by Friday"),
+])
+def test_clear_requests_are_found(text, item_type, deadline):
+    items = extract_action_items(text)["action_items"]
+
+    assert [(item["task"], item["type"], item["deadline"]) for item in items] == [(text, item_type, deadline)]
+
+def test_deadline_raises_confidence():
+    with_deadline = extract_action_items("Please send the slides by tomorrow.")["action_items"][0]
+    without = extract_action_items("Please send the slides.")["action_items"][0]
+
+    assert with_deadline["confidence"] > without["confidence"]
+
+def test_quoted_history_is_ignored():
+    text = "Please review the doc.\n\nOn Mon, Jan 1, 2024 Bob wrote:\n> Can you send me the file by Friday?"
+
+    assert [item["task"] for item in extract_action_items(text)["action_items"]] == ["Please review the doc."]
+
+@pytest.mark.parametrize("text", [
+    "Please send the signed contract by Friday.",
+    "Can you review the draft when you get a chance?",
+    "Thanks for the update. See you at the offsite.",
+])
+def test_clear_emails_are_not_ambiguous(text):
+    assert not extract_action_items(text)["ambiguous"]
+
+@pytest.mark.parametrize("text", [
+    # Hedged request
+    "Perhaps you could send the slides?",
+    # No request, but hedged language
+    "Maybe we could look at the budget at some point.",
+    # Only a deadline, no verb aimed at the reader
+    "The report is due by Friday.",
+    # A request inside automated mail
+    "Please update your payment details. This is an automated message, do not reply.",
+])
+def test_hedged_or_weak_emails_are_ambiguous(text):
+    assert extract_action_items(text)["ambiguous"]
+
+class CountingGPT(gpt_handler.GPTService):
+    def __init__(self):
+        super().__init__()
+        self.client = object()
+        self.prompts = []
+
+    async def _chat_completion(self, operation, messages, max_tokens, temperature, model=None, json_mode=False):
+        self.prompts.append(messages)
+        return '{"action_items": ["Send the slides"]}'
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(gpt_handler, "MICRO_BATCH_ENABLED", False)
+    return CountingGPT()
+
+def test_clear_email_is_answered_without_the_model(service):
+    items = asyncio.run(service.extract_action_items("Please send the signed contract by Friday."))
+
+    assert items == ["Please send the signed contract by Friday."]
+    assert service.prompts == []
+
+def test_email_without_requests_is_answered_without_the_model(service):
+    assert asyncio.run(service.extract_action_items("Thanks for the update. See you at the offsite.")) == []
+    assert service.prompts == []
+
+def test_ambiguous_email_goes_to_the_model(service):
+    items = asyncio.run(service.extract_action_items("Perhaps you could send the slides?"))
+
+    assert items == ["Send the slides"]
+    assert len(service.prompts) == 1
+
+def test_ambiguous_email_stays_local_without_a_client(service):
+    service.client = None
+
+    items = asyncio.run(service.extract_action_items("Perhaps you could send the slides?"))
+
+    assert items == ["Perhaps you could send the slides?"]
+    assert service.prompts == []
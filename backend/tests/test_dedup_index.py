@@ -0,0 +1,59 @@
+from services.dedup_index import NearDuplicateIndex, patch_summary, template_key
+
+APPROVED = (
+    "Your application for the Senior Analyst position at Northwind has been approved. "
+    "The recruiting team will contact you about next steps shortly. "
+    "Please keep this email for your records."
+)
+REJECTED = APPROVED.replace("has been approved", "has been rejected")
+
+ORDER = "Your order #4412 of $120.50 ships on 03/14/2024 at 10:30 am. Track it in your account."
+ORDER_NEXT = "Your order #4413 of $89.99 ships on 03/15/2024 at 09:15 am. Track it in your account."
+
+def test_texts_differing_by_an_ordinary_word_are_not_reused():
+    assert template_key(APPROVED) != template_key(REJECTED)
+
+    index = NearDuplicateIndex()
+    index.add("user", APPROVED, 150, {"summary": "Application approved.", "key_points": ["Approved"]})
+    assert index.lookup("user", REJECTED, 150) is None
+
+def test_patch_summary_refuses_word_changes():
+    summary = {"summary": "Application approved.", "key_points": []}
+    assert patch_summary(summary, APPROVED, REJECTED) is None
+
+def test_templated_email_reuses_summary_with_new_values():
+    index = NearDuplicateIndex()
+    index.add("user", ORDER, 150, {
+        "summary": "Order #4412 of $120.50 ships 03/14/2024 at 10:30 am.",
+        "key_points": ["Ships 03/14/2024"]
+    })
+
+    reused = index.lookup("user", ORDER_NEXT, 150)
+    assert reused == {
+        "summary": "Order #4413 of $89.99 ships 03/15/2024 at 09:15 am.",
+        "key_points": ["Ships 03/15/2024"]
+    }
+    assert index.stats()["patched_hits"] == 1
+
+def test_templated_variants_share_a_key():
+    assert template_key(ORDER) == template_key(ORDER_NEXT)
+    assert template_key(ORDER) == template_key(ORDER.replace(" ships", "  ships"))
+
+def test_exact_duplicate_is_reused():
+    index = NearDuplicateIndex()
+    index.add("user", APPROVED, 150, {"summary": "Application approved.", "key_points": []})
+    assert index.lookup("user", APPROVED, 150)["summary"] == "Application approved."
+
+def test_entries_are_per_user_and_per_length():
+    index = NearDuplicateIndex()
+    index.add("user", APPROVED, 150, {"summary": "Application approved.", "key_points": []})
+    assert index.lookup("other", APPROVED, 150) is None
+    assert index.lookup("user", APPROVED, 300) is None
+
+def test_oldest_templates_are_evicted():
+    index = NearDuplicateIndex(max_entries=1)
+    index.add("user", APPROVED, 150, {"summary": "Application approved.", "key_points": []})
+    index.add("user", ORDER, 150, {"summary": "Order ships.", "key_points": []})
+
+    assert index.lookup("user", APPROVED, 150) is None
+    assert index.stats()["entries"] == 1
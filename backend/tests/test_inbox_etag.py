@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+from fastapi import Request
+
+from routes import email as email_routes
+
+class FakeMailbox:
+    """
+    Messages with Gmail-style history ids and a users.history log
+    """
+
+    def __init__(self, count: int):
+        self.history_id = 1000
+        self.messages = {}
+        self.history = []
+        self.calls = {"list": 0, "changes": 0, "get_emails": 0}
+        for index in range(count):
+            self.add(f"m{index}")
+
+    def add(self, message_id: str) -> None:
+        self.history_id += 1
+        self.messages[message_id] = {"history_id": self.history_id, "label_ids": ["INBOX", "UNREAD"]}
+        self.history.append((self.history_id, message_id))
+
+    def mark_read(self, message_id: str) -> None:
+        self.history_id += 1
+        self.messages[message_id].update(history_id=self.history_id, label_ids=["INBOX"])
+        self.history.append((self.history_id, message_id))
+
+    def service(self, access_token: str) -> "FakeGmail":
+        return FakeGmail(self)
+
+class FakeGmail:
+    def __init__(self, mailbox: FakeMailbox):
+        self.mailbox = mailbox
+
+    def list_messages(self, max_results: int = 10, query=None):
+        self.mailbox.calls["list"] += 1
+        newest = sorted(self.mailbox.messages, key=lambda message_id: int(message_id[1:]), reverse=True)
+        return [{"id": message_id, "threadId": message_id} for message_id in newest[:max_results]]
+
+    def get_changes_since(self, start_history_id: str):
+        self.mailbox.calls["changes"] += 1
+        if int(start_history_id) > self.mailbox.history_id:
+            raise Exception("Gmail API error: <HttpError 400 \"Invalid startHistoryId\">")
+        changes = {}
+        for history_id, message_id in self.mailbox.history:
+            if history_id > int(start_history_id):
+                changes[message_id] = history_id
+        return changes
+
+    def get_emails(self, messages):
+        self.mailbox.calls["get_emails"] += 1
+        return [{
+            "id": message["id"], "thread_id": message["id"], "sender": "a@example.com", "subject": "Hi",
+            "date": "", "snippet": "", "recipient": "", "list_unsubscribe": False,
+            "is_read": "UNREAD" not in self.mailbox.messages[message["id"]]["label_ids"],
+            "label_ids": self.mailbox.messages[message["id"]]["label_ids"],
+            "history_id": str(self.mailbox.messages[message["id"]]["history_id"]),
+        } for message in messages]
+
+@pytest.fixture
+def mailbox(monkeypatch):
+    mailbox = FakeMailbox(20)
+    monkeypatch.setattr(email_routes, "GmailService", mailbox.service)
+    return mailbox
+
+def list_inbox(etag=None):
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    request = Request({"type": "http", "method": "GET", "path": "/emails/", "query_string": b"max_results=5",
+                       "headers": headers})
+    user = {"email": "ada@example.com", "access_token": "token"}
+    return asyncio.run(email_routes._get_emails(request, 5, None, False, False, False, user))
+
+def test_unconditional_listing_makes_no_history_call(mailbox):
+    response = list_inbox()
+
+    assert response.status_code == 200
+    assert response.headers["ETag"]
+    assert mailbox.calls == {"list": 1, "changes": 0, "get_emails": 1}
+
+def test_unchanged_listing_is_not_modified(mailbox):
+    etag = list_inbox().headers["ETag"]
+    # Activity on messages outside the page does not invalidate it
+    mailbox.mark_read("m0")
+
+    response = list_inbox(etag)
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert mailbox.calls["get_emails"] == 1
+
+def test_relabelled_message_invalidates_the_listing(mailbox):
+    etag = list_inbox().headers["ETag"]
+    mailbox.mark_read("m17")
+
+    response = list_inbox(etag)
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert list_inbox(response.headers["ETag"]).status_code == 304
+
+def test_new_message_invalidates_the_listing(mailbox):
+    etag = list_inbox().headers["ETag"]
+    mailbox.add("m20")
+
+    assert list_inbox(etag).status_code == 200
+
+def test_etags_without_a_history_id_are_treated_as_unconditional(mailbox):
+    response = list_inbox('"0123456789abcdef0123456789abcdef"')
+
+    assert response.status_code == 200
+    assert mailbox.calls["changes"] == 0
+
+def test_rejected_history_id_serves_the_full_listing(mailbox):
+    etag = list_inbox().headers["ETag"]
+    crafted = etag[:-1].rpartition(".")[0] + '.99999999"'
+
+    response = list_inbox(crafted)
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag
+
+def test_not_modified_repeats_the_compressed_etag(mailbox):
+    etag = list_inbox().headers["ETag"]
+    compressed = etag[:-1] + '-br"'
+
+    response = list_inbox(compressed)
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == compressed
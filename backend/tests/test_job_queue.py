@@ -0,0 +1,172 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from services import job_queue as job_queue_module
+from services.job_queue import COMPLETED, QUEUED, RUNNING, JobQueue
+
+@pytest.fixture(autouse=True)
+def signed_in(monkeypatch):
+    async def session_for(user_email):
+        return {"email": user_email, "access_token": "token"}
+    monkeypatch.setattr(job_queue_module, "_session_for", session_for)
+
+def make_queue(tmp_path, lease_seconds=60.0) -> JobQueue:
+    return JobQueue(db_path=str(tmp_path / "jobs.db"), lease_seconds=lease_seconds)
+
+def job_row(queue: JobQueue, job_id: str):
+    with sqlite3.connect(queue.db_path) as conn:
+        return conn.execute(
+            "SELECT status, worker_id, lease_expires_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+
+def lease_to(queue: JobQueue, job_id: str, worker_id: str, expires_at: float) -> None:
+    with sqlite3.connect(queue.db_path) as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker_id = ?, lease_expires_at = ? WHERE id = ?",
+            (RUNNING, worker_id, expires_at, job_id)
+        )
+
+async def echo(user, params, item):
+    return {"item": item}
+
+def test_start_leaves_jobs_leased_by_a_live_worker(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.register("echo", echo)
+    job = queue.submit("user@example.com", "echo", {}, ["a", "b"])
+    lease_to(queue, job["job_id"], "other-worker", time.time() + 60)
+
+    async def scenario():
+        await queue.start(workers=1)
+        await asyncio.sleep(0.1)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert job_row(queue, job["job_id"])[:2] == (RUNNING, "other-worker")
+    assert queue.get(job["job_id"])["progress"]["done"] == 0
+
+def test_job_with_expired_lease_resumes_unfinished_items(tmp_path):
+    queue = make_queue(tmp_path)
+    calls = []
+
+    async def record(user, params, item):
+        calls.append(item)
+        return {"item": item}
+
+    queue.register("echo", record)
+    job = queue.submit("user@example.com", "echo", {}, ["a", "b", "c"])
+    queue._record_result(job["job_id"], 0, 1, {"item": "a"})
+    lease_to(queue, job["job_id"], "crashed-worker", time.time() - 1)
+
+    async def scenario():
+        await queue.start(workers=1)
+        for _ in range(50):
+            if queue.get(job["job_id"])["status"] == COMPLETED:
+                break
+            await asyncio.sleep(0.02)
+        await queue.stop()
+
+    asyncio.run(scenario())
+    assert queue.get(job["job_id"])["status"] == COMPLETED
+    assert sorted(calls) == ["b", "c"]
+    assert job_row(queue, job["job_id"])[1:] == (None, None)
+
+def test_running_worker_takes_over_an_expired_lease(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.register("echo", echo)
+
+    async def scenario():
+        await queue.start(workers=1)
+        job = queue.submit("user@example.com", "echo", {}, [])
+        # Another worker claims it, then dies without renewing
+        lease_to(queue, job["job_id"], "crashed-worker", time.time() - 1)
+        claimed = queue._claim_next()
+        await queue.stop()
+        return job, claimed
+
+    job, claimed = asyncio.run(scenario())
+    assert claimed is not None and claimed["id"] == job["job_id"]
+
+def test_lease_is_renewed_while_the_job_runs(tmp_path):
+    queue = make_queue(tmp_path, lease_seconds=0.15)
+    release = asyncio.Event()
+
+    async def slow(user, params, item):
+        await release.wait()
+        return {"item": item}
+
+    queue.register("slow", slow)
+
+    async def scenario():
+        await queue.start(workers=1)
+        job = queue.submit("user@example.com", "slow", {}, ["a"])
+        await asyncio.sleep(0.05)
+        first = job_row(queue, job["job_id"])
+        await asyncio.sleep(0.3)
+        later = job_row(queue, job["job_id"])
+        # Well past the original lease, and another worker still may not take it
+        other = JobQueue(db_path=queue.db_path, lease_seconds=0.15)
+        stolen = other._claim_next()
+        release.set()
+        await asyncio.sleep(0.1)
+        await queue.stop()
+        return first, later, stolen
+
+    first, later, stolen = asyncio.run(scenario())
+    assert first[0] == RUNNING and first[1] is not None
+    assert later[1] == first[1]
+    assert later[2] > first[2]
+    assert stolen is None
+
+def test_stop_releases_running_jobs(tmp_path):
+    queue = make_queue(tmp_path)
+    started = asyncio.Event()
+
+    async def forever(user, params, item):
+        started.set()
+        await asyncio.sleep(10)
+
+    queue.register("forever", forever)
+
+    async def scenario():
+        await queue.start(workers=1)
+        job = queue.submit("user@example.com", "forever", {}, ["a"])
+        await asyncio.wait_for(started.wait(), 1)
+        await queue.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job_row(queue, job["job_id"]) == (QUEUED, None, None)
+
+def test_locked_store_does_not_block_the_event_loop(tmp_path):
+    queue = make_queue(tmp_path)
+    queue.register("echo", echo)
+    job = queue.submit("user@example.com", "echo", {}, ["a"])
+
+    async def scenario():
+        # Another process holds a write lock, so the queue's writes wait on it
+        locker = sqlite3.connect(queue.db_path, timeout=10)
+        locker.execute("BEGIN EXCLUSIVE")
+        starting = asyncio.create_task(queue.start(workers=1))
+
+        longest = 0.0
+        for _ in range(10):
+            started = time.monotonic()
+            await asyncio.sleep(0.02)
+            longest = max(longest, time.monotonic() - started)
+
+        locker.rollback()
+        locker.close()
+        await starting
+        for _ in range(50):
+            if queue.get(job["job_id"])["status"] == COMPLETED:
+                break
+            await asyncio.sleep(0.02)
+        await queue.stop()
+        return longest
+
+    longest = asyncio.run(scenario())
+    assert longest < 0.2
+    assert queue.get(job["job_id"])["status"] == COMPLETED
@@ -0,0 +1,74 @@
+import pytest
+
+from services.json_output import (
+    IncrementalJSONParser,
+    JSONOutputError,
+    SummaryOutput,
+    ToneOutput,
+    parse_model_json,
+    repair_json,
+)
+
+@pytest.mark.parametrize("text", [
+    '```json\n{"summary": "Lunch moved to Friday.", "key_points": ["Friday"]}\n```',
+    '```\n{"summary": "Lunch moved to Friday.", "key_points": ["Friday"]}\n```',
+    'Here is the summary:\n{"summary": "Lunch moved to Friday.", "key_points": ["Friday"]}\nLet me know!',
+    'Sure! ```JSON\n{"summary": "Lunch moved to Friday.", "key_points": ["Friday"],}\n``` Anything else?',
+])
+def test_fences_and_surrounding_prose_are_stripped(text):
+    assert parse_model_json(text, SummaryOutput) == {"summary": "Lunch moved to Friday.", "key_points": ["Friday"]}
+
+def test_braces_in_trailing_prose_are_ignored():
+    text = '{"summary": "Budget {draft} attached.", "key_points": []} (the {braces} above are literal)'
+    assert parse_model_json(text, SummaryOutput)["summary"] == "Budget {draft} attached."
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"summary": "Lunch moved", "key_points": ["Fri', {"summary": "Lunch moved", "key_points": ["Fri"]}),
+    ('{"summary": "Lunch moved", "key_points": ["Friday",', {"summary": "Lunch moved", "key_points": ["Friday"]}),
+    ('{"summary": "Lunch moved", "key_points":', {"summary": "Lunch moved"}),
+    ('{"summary": "Lunch moved", "key_p', {"summary": "Lunch moved"}),
+    ('{"summary": "Say \\"hi', {"summary": 'Say "hi'}),
+    ('{"summary": "Ends in a backslash \\', {"summary": "Ends in a backslash "}),
+])
+def test_truncated_objects_and_strings_are_closed(text, expected):
+    assert parse_model_json(text) == expected
+
+def test_truncated_output_is_validated_with_schema_defaults():
+    assert parse_model_json('{"primary_tone": "urgent", "confid', ToneOutput) == {
+        "primary_tone": "urgent", "confidence": 0.5, "tone_scores": {}, "suggestions": []
+    }
+
+def test_repair_leaves_complete_json_alone():
+    assert repair_json('{"a": [1, 2]} trailing') == '{"a": [1, 2]}'
+
+@pytest.mark.parametrize("text", [None, "", "I could not summarize this email.", '{"summary": }', "[1, 2, oops"])
+def test_unrepairable_output_raises(text):
+    with pytest.raises(JSONOutputError):
+        parse_model_json(text)
+
+def test_schema_mismatch_raises():
+    with pytest.raises(JSONOutputError):
+        parse_model_json('{"key_points": ["no summary"]}', SummaryOutput)
+
+def test_incremental_parser_reports_fields_as_they_change():
+    parser = IncrementalJSONParser()
+    chunks = ['Sure: ```json\n{"sum', 'mary": "Lunch', ' moved to Friday."', ', "key_points": ["Fri', 'day"]}\n```']
+
+    updates = [parser.feed(chunk) for chunk in chunks]
+
+    assert updates == [
+        {},
+        {"summary": "Lunch"},
+        {"summary": "Lunch moved to Friday."},
+        {"key_points": ["Fri"]},
+        {"key_points": ["Friday"]},
+    ]
+    assert parser.result(SummaryOutput) == {"summary": "Lunch moved to Friday.", "key_points": ["Friday"]}
+
+def test_incremental_parser_waits_for_an_object():
+    parser = IncrementalJSONParser()
+
+    assert parser.feed("Thinking about it") == {}
+    assert parser.feed("[1, 2") == {}
+    with pytest.raises(JSONOutputError):
+        parser.result(SummaryOutput)
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+from services.micro_batcher import MicroBatcher
+from services.request_context import remaining_time, start_scope
+
+def test_lone_request_does_not_wait_for_the_window():
+    async def scenario():
+        async def double(items):
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher("test", double, window_ms=5000)
+        started = time.monotonic()
+        result = await batcher.submit(21)
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(scenario())
+    assert result == 42
+    assert elapsed < 1
+
+def test_requests_arriving_during_a_batch_are_grouped():
+    async def scenario():
+        sizes = []
+
+        async def echo(items):
+            sizes.append(len(items))
+            await asyncio.sleep(0.05)
+            return items
+
+        batcher = MicroBatcher("test", echo, window_ms=20)
+        first = asyncio.ensure_future(batcher.submit(0))
+        await asyncio.sleep(0)
+        rest = await asyncio.gather(*(batcher.submit(i) for i in range(1, 4)))
+        return await first, rest, sizes
+
+    first, rest, sizes = asyncio.run(scenario())
+    assert first == 0
+    assert rest == [1, 2, 3]
+    assert sizes == [1, 3]
+
+def test_cancelled_caller_does_not_fail_the_batch():
+    async def scenario():
+        started = asyncio.Event()
+
+        async def slow(items):
+            started.set()
+            await asyncio.sleep(0.05)
+            return [f"done {item}" for item in items]
+
+        batcher = MicroBatcher("test", slow, window_ms=10)
+        # Keep a batch running so the next callers share one
+        busy = asyncio.ensure_future(batcher.submit("busy"))
+        await started.wait()
+
+        async def short_lived():
+            start_scope(0.01).cancelled.set()
+            return await batcher.submit("impatient")
+
+        impatient = asyncio.ensure_future(short_lived())
+        patient = asyncio.ensure_future(batcher.submit("patient"))
+        await asyncio.sleep(0.02)
+        impatient.cancel()
+        return await busy, await patient, impatient
+
+    busy, patient, impatient = asyncio.run(scenario())
+    assert busy == "done busy"
+    assert patient == "done patient"
+    assert impatient.cancelled()
+
+def test_batch_runs_with_the_latest_caller_deadline():
+    async def scenario():
+        seen = []
+        started = asyncio.Event()
+
+        async def record(items):
+            started.set()
+            seen.append(remaining_time())
+            await asyncio.sleep(0.02)
+            return items
+
+        batcher = MicroBatcher("test", record, window_ms=10)
+        busy = asyncio.ensure_future(batcher.submit("busy"))
+        await started.wait()
+
+        async def with_deadline(item, seconds):
+            start_scope(seconds)
+            return await batcher.submit(item)
+
+        await asyncio.gather(with_deadline("short", 1), with_deadline("long", 30))
+        await busy
+        return seen
+
+    seen = asyncio.run(scenario())
+    assert seen[1] > 20
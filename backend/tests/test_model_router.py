@@ -0,0 +1,48 @@
+from services.model_router import LATENCY_WINDOW, MIN_SAMPLES, PROBE_EVERY, RECOVERY_PROBES, ModelRouter
+
+ROUTES = {"summarize_email": {
+    "tiers": [{"model": "primary"}],
+    "fallback_model": "fallback",
+    "latency_target_ms": 1000
+}}
+
+def call(router, latency_s):
+    model, route_key = router.select("summarize_email", 100)
+    router.record(route_key, model, latency_s)
+    return model
+
+def degrade(router):
+    # Long enough for the whole latency window to be slow probes
+    for _ in range(LATENCY_WINDOW * PROBE_EVERY):
+        call(router, 3.0)
+    assert router.get_stats()["summarize_email:primary"]["degraded"]
+
+def test_slow_primary_switches_to_the_fallback():
+    router = ModelRouter(routes=ROUTES)
+
+    assert [call(router, 3.0) for _ in range(MIN_SAMPLES)] == ["primary"] * MIN_SAMPLES
+
+    models = [call(router, 3.0) for _ in range(PROBE_EVERY * 3)]
+    assert models.count("primary") == 3
+
+def test_route_recovers_after_consecutive_fast_probes():
+    router = ModelRouter(routes=ROUTES)
+    degrade(router)
+
+    for _ in range(PROBE_EVERY * RECOVERY_PROBES):
+        call(router, 0.1)
+
+    assert [call(router, 0.1) for _ in range(PROBE_EVERY)] == ["primary"] * PROBE_EVERY
+    assert not router.get_stats()["summarize_email:primary"]["degraded"]
+
+def test_a_slow_probe_restarts_the_recovery_count():
+    router = ModelRouter(routes=ROUTES)
+    degrade(router)
+
+    probes = 0
+    while probes < RECOVERY_PROBES + 1:
+        # The next to last probe is slow
+        if call(router, 3.0 if probes == RECOVERY_PROBES - 2 else 0.1) == "primary":
+            probes += 1
+
+    assert router.get_stats()["summarize_email:primary"]["degraded"]
@@ -0,0 +1,217 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services.request_context import DeadlineExceeded, RequestCancelled, start_scope
+from services import gpt_handler
+from services.resilience import CircuitBreaker, CircuitOpenError, Upstream
+
+def make_upstream() -> Upstream:
+    upstream = Upstream("test", max_attempts=1)
+    upstream.breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.01)
+    return upstream
+
+def fail():
+    raise ConnectionError("upstream down")
+
+def open_breaker(upstream: Upstream) -> None:
+    for _ in range(upstream.breaker.failure_threshold):
+        with pytest.raises(ConnectionError):
+            upstream.call_sync(fail)
+    assert upstream.breaker.state == "open"
+    time.sleep(upstream.breaker.reset_timeout * 2)
+
+async def ok():
+    return "ok"
+
+def test_breaker_opens_and_fails_fast():
+    upstream = make_upstream()
+    upstream.breaker.reset_timeout = 60
+    for _ in range(upstream.breaker.failure_threshold):
+        with pytest.raises(ConnectionError):
+            upstream.call_sync(fail)
+
+    with pytest.raises(CircuitOpenError):
+        upstream.call_sync(lambda: "never called")
+    assert upstream.counters["short_circuited"] == 1
+
+def test_successful_probe_closes_breaker():
+    upstream = make_upstream()
+    open_breaker(upstream)
+    assert asyncio.run(upstream.call(ok)) == "ok"
+    assert upstream.breaker.state == "closed"
+
+def test_cancelled_probe_lets_the_next_call_probe():
+    upstream = make_upstream()
+    open_breaker(upstream)
+
+    async def scenario():
+        probe = asyncio.ensure_future(upstream.call(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        assert upstream.breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await upstream.call(ok)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert upstream.breaker.state == "closed"
+
+def test_probe_abandoned_at_deadline_lets_the_next_call_probe():
+    upstream = make_upstream()
+    open_breaker(upstream)
+
+    async def slow_timeout():
+        await asyncio.sleep(0.05)
+        raise TimeoutError("read timed out")
+
+    async def abandoned():
+        start_scope(0.02)
+        await upstream.call(slow_timeout)
+
+    async def scenario():
+        with pytest.raises(DeadlineExceeded):
+            await asyncio.ensure_future(abandoned())
+        return await upstream.call(ok)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert upstream.counters["abandoned"] == 1
+
+def test_sync_probe_cancelled_by_the_request_lets_the_next_call_probe():
+    upstream = make_upstream()
+    open_breaker(upstream)
+
+    def cancelled():
+        raise RequestCancelled("Client disconnected")
+
+    with pytest.raises(RequestCancelled):
+        upstream.call_sync(cancelled)
+    assert upstream.call_sync(lambda: "ok") == "ok"
+
+def test_cancelled_hedged_call_cancels_both_attempts():
+    upstream = make_upstream()
+    upstream.hedge_delay = lambda: 0.01
+    attempts = []
+
+    async def attempt():
+        task = asyncio.current_task()
+        attempts.append(task)
+        await asyncio.sleep(10)
+
+    async def scenario():
+        call = asyncio.ensure_future(upstream.call(attempt, hedge=True))
+        await asyncio.sleep(0.05)
+        assert len(attempts) == 2
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0)
+        # Checked before asyncio.run cancels leftover tasks itself
+        return [task.cancelled() for task in attempts]
+
+    assert asyncio.run(scenario()) == [True, True]
+    assert upstream.in_flight == 0
+
+def test_hedged_call_cancels_the_losing_attempt():
+    upstream = make_upstream()
+    upstream.hedge_delay = lambda: 0.01
+    attempts = []
+
+    async def attempt():
+        attempts.append(asyncio.current_task())
+        await asyncio.sleep(10 if len(attempts) == 1 else 0)
+        return len(attempts)
+
+    async def scenario():
+        result = await upstream.call(attempt, hedge=True)
+        await asyncio.sleep(0)
+        return result, attempts[0].cancelled()
+
+    assert asyncio.run(scenario()) == (2, True)
+    assert upstream.counters["hedges_won"] == 1
+
+class FakeStream:
+    def __init__(self, pieces, fail_after=None):
+        self.events = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+                       for piece in pieces]
+        self.fail_after = fail_after
+        self.sent = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.sent == self.fail_after:
+            raise ConnectionError("stream reset")
+        if not self.events:
+            raise StopAsyncIteration
+        self.sent += 1
+        return self.events.pop(0)
+
+    async def close(self):
+        self.closed = True
+
+class FakeCompletions:
+    def __init__(self, streams):
+        self.streams = streams
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        stream = self.streams.pop(0)
+        if isinstance(stream, Exception):
+            raise stream
+        return stream
+
+def streaming_service(monkeypatch, streams, upstream):
+    monkeypatch.setattr(gpt_handler, "openai_upstream", upstream)
+    service = gpt_handler.GPTService()
+    completions = FakeCompletions(streams)
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return service, completions
+
+async def collect(service):
+    return [piece async for piece in service._stream_chat_completion(
+        "stream_summarize_email", [{"role": "user", "content": "hi"}], 50, 0.0, model="gpt-4o-mini")]
+
+def test_stream_open_is_retried_until_the_first_chunk(monkeypatch):
+    stalled = FakeStream(["never"], fail_after=0)
+    service, completions = streaming_service(
+        monkeypatch, [ConnectionError("refused"), stalled, FakeStream(["Hello", " world"])],
+        Upstream("test", max_attempts=3, base_delay=0))
+
+    assert asyncio.run(collect(service)) == ["Hello", " world"]
+    assert completions.calls == 3
+    assert stalled.closed
+
+def test_stream_is_not_retried_after_the_first_chunk(monkeypatch):
+    broken = FakeStream(["Hello", " world"], fail_after=1)
+    service, completions = streaming_service(monkeypatch, [broken, FakeStream(["again"])],
+                                             Upstream("test", max_attempts=3, base_delay=0))
+    received = []
+
+    async def scenario():
+        async for piece in service._stream_chat_completion(
+                "stream_summarize_email", [{"role": "user", "content": "hi"}], 50, 0.0, model="gpt-4o-mini"):
+            received.append(piece)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(scenario())
+    assert received == ["Hello"]
+    assert completions.calls == 1
+    assert broken.closed
+
+def test_stream_fails_fast_while_the_breaker_is_open(monkeypatch):
+    upstream = make_upstream()
+    upstream.breaker.reset_timeout = 60
+    for _ in range(upstream.breaker.failure_threshold):
+        with pytest.raises(ConnectionError):
+            upstream.call_sync(fail)
+    service, completions = streaming_service(monkeypatch, [FakeStream(["Hello"])], upstream)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(collect(service))
+    assert completions.calls == 0
@@ -0,0 +1,132 @@
+import importlib
+import secrets
+import sqlite3
+import time
+
+import pytest
+from jose import jwt
+
+import config
+from services import auth_service
+from services.session_store import MemorySessionStore, SQLiteSessionStore
+
+@pytest.fixture
+def store(monkeypatch):
+    store = MemorySessionStore()
+    monkeypatch.setattr(auth_service, "session_store", store)
+    return store
+
+def login(store, email="ada@example.com", access_token="google-token"):
+    session = store.put(email, access_token=access_token, refresh_token="refresh",
+                        user_info={"email": email, "name": "Ada"})
+    return auth_service.create_session_token(session)
+
+def test_session_token_identifies_its_session(store):
+    token = login(store)
+
+    session = auth_service._session_for_token(token)
+
+    assert session["email"] == "ada@example.com"
+
+def test_token_from_an_earlier_login_stops_working(store):
+    first = login(store)
+    second = login(store, access_token="google-token-2")
+
+    assert auth_service._session_for_token(first) is None
+    assert auth_service._session_for_token(second)["access_token"] == "google-token-2"
+
+def test_token_stops_working_after_logout(store):
+    token = login(store)
+
+    store.remove("ada@example.com")
+
+    assert auth_service._session_for_token(token) is None
+
+def test_forged_token_without_session_id_is_rejected(store):
+    login(store)
+    forged = jwt.encode({"sub": "ada@example.com", "exp": int(time.time() + 60)},
+                        config.JWT_SECRET_KEY, algorithm=config.JWT_ALGORITHM)
+
+    assert auth_service._session_for_token(forged) is None
+
+def test_placeholder_secret_neither_issues_nor_accepts_tokens(store, monkeypatch):
+    session = store.put("ada@example.com", access_token="google-token", refresh_token=None,
+                        user_info={"email": "ada@example.com"})
+    forged = jwt.encode({"sub": "ada@example.com", "jti": session["session_id"], "exp": int(time.time() + 60)},
+                        "your-secret-key-here", algorithm=config.JWT_ALGORITHM)
+    monkeypatch.setattr(auth_service, "JWT_SECRET_KEY", "your-secret-key-here")
+    monkeypatch.setattr(auth_service, "SESSION_TOKENS_ENABLED", False)
+
+    assert auth_service.create_session_token(session) is None
+    assert auth_service._session_for_token(forged) is None
+    # Google access tokens still authenticate
+    assert auth_service._session_for_token("google-token")["email"] == "ada@example.com"
+
+@pytest.mark.parametrize("secret", ["", "your-secret-key-here", "your-jwt-secret-key-here", "x" * 64])
+def test_production_refuses_to_start_without_a_secret(monkeypatch, secret):
+    monkeypatch.setenv("ENVIRONMENT", "production")
+    monkeypatch.setenv("JWT_SECRET_KEY", secret)
+    try:
+        with pytest.raises(RuntimeError):
+            importlib.reload(config)
+    finally:
+        monkeypatch.undo()
+        importlib.reload(config)
+
+def test_generated_secrets_are_accepted():
+    assert config.jwt_secret_is_strong(secrets.token_urlsafe(32))
+    assert config.jwt_secret_is_strong(secrets.token_hex(32))
+    assert not config.jwt_secret_is_strong(secrets.token_hex(8))
+
+def test_sqlite_store_keeps_the_session_id(tmp_path):
+    store = SQLiteSessionStore(db_path=str(tmp_path / "sessions.db"))
+    session = store.put("ada@example.com", access_token="google-token", refresh_token=None,
+                        user_info={"email": "ada@example.com"})
+
+    store.update_access_token("ada@example.com", "google-token-2")
+
+    assert store.get("ada@example.com")["session_id"] == session["session_id"]
+    assert store.find_by_access_token("google-token")["session_id"] == session["session_id"]
+
+def test_sqlite_store_closes_its_connections(tmp_path, monkeypatch):
+    opened = []
+    connect = sqlite3.connect
+
+    def tracking_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(sqlite3, "connect", tracking_connect)
+    store = SQLiteSessionStore(db_path=str(tmp_path / "sessions.db"))
+    store.put("ada@example.com", access_token="google-token", refresh_token=None,
+              user_info={"email": "ada@example.com"})
+    store.find_by_access_token("google-token")
+
+    assert opened
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_superseded_access_tokens_expire_after_the_grace_period(tmp_path, monkeypatch, backend):
+    from services import session_store as session_store_module
+
+    monkeypatch.setattr(session_store_module, "SUPERSEDED_TOKEN_GRACE_SECONDS", 0.2)
+    store = MemorySessionStore() if backend == "memory" else SQLiteSessionStore(db_path=str(tmp_path / "sessions.db"))
+    store.put("ada@example.com", access_token="google-token", refresh_token="refresh",
+              user_info={"email": "ada@example.com"})
+
+    store.update_access_token("ada@example.com", "google-token-2")
+    assert store.find_by_access_token("google-token")["email"] == "ada@example.com"
+
+    time.sleep(0.25)
+    store.update_access_token("ada@example.com", "google-token-3")
+
+    # The session lives on, but the token replaced two refreshes ago no longer identifies it
+    assert store.find_by_access_token("google-token") is None
+    assert store.find_by_access_token("google-token-2")["email"] == "ada@example.com"
+    assert store.find_by_access_token("google-token-3")["email"] == "ada@example.com"
+    time.sleep(0.25)
+    assert store.find_by_access_token("google-token-2") is None
+    assert store.find_by_access_token("google-token-3")["email"] == "ada@example.com"
@@ -0,0 +1,73 @@
+from services.text_reducer import reduce_email_text
+
+def test_strips_quoted_reply_history():
+    text = (
+        "Sounds good, see you then.\n\n"
+        "On Tue, Mar 5, 2024 at 10:02 AM Jane Doe <jane@example.com> wrote:\n"
+        "> Can we meet at 3?\n"
+    )
+    reduced, report = reduce_email_text(text)
+    assert reduced == "Sounds good, see you then."
+    assert report["quoted_history"]
+
+def test_strips_signature_block_after_closing():
+    text = (
+        "The contract is attached for review.\n\n"
+        "Best regards,\n"
+        "Jane Doe\n"
+        "VP of Sales, Acme Inc.\n"
+        "+1 (555) 123-4567\n"
+        "jane@acme.com"
+    )
+    reduced, report = reduce_email_text(text)
+    assert reduced == "The contract is attached for review.\n\nBest regards,"
+    assert report["signature"]
+
+def test_keeps_content_after_early_closing_line():
+    text = "Hi,\nThanks!\nI will be there at 5pm.\nCan you bring the slides?\nJohn"
+    reduced, report = reduce_email_text(text)
+    assert reduced == text
+    assert not report["signature"]
+
+def test_keeps_lowercase_sentence_after_closing_line():
+    text = "Got it.\nThanks\nsee you at the offsite"
+    reduced, _ = reduce_email_text(text)
+    assert reduced == text
+
+def test_keeps_paragraph_mentioning_intended_recipient():
+    text = (
+        "Please make sure this reaches the intended recipient by Friday.\n\n"
+        "The parcel is at the front desk."
+    )
+    reduced, report = reduce_email_text(text)
+    assert reduced == text
+    assert report["disclaimers"] == 0
+
+def test_keeps_paragraph_mentioning_attachments():
+    text = "We will review this message and any attachments before the call."
+    reduced, report = reduce_email_text(text)
+    assert reduced == text
+    assert report["disclaimers"] == 0
+
+def test_strips_legal_disclaimer():
+    text = (
+        "Invoice 1042 is due on March 31.\n\n"
+        "This email is confidential and intended solely for the use of the individual to whom "
+        "it is addressed. If you are not the intended recipient, please delete it."
+    )
+    reduced, report = reduce_email_text(text)
+    assert reduced == "Invoice 1042 is due on March 31."
+    assert report["disclaimers"] == 1
+
+def test_disclaimer_removal_keeps_lines_above_it_in_the_paragraph():
+    text = (
+        "Ship it Monday.\n"
+        "If you have received this email in error, please notify the sender."
+    )
+    reduced, _ = reduce_email_text(text)
+    assert reduced == "Ship it Monday."
+
+def test_fully_quoted_body_is_kept():
+    text = "> only quoted text"
+    reduced, _ = reduce_email_text(text)
+    assert reduced == text
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+
+from services.session_store import CachedSessionStore, SQLiteSessionStore
+from services.token_refresher import TokenRefresher
+
+class FakeGoogle:
+    """
+    Stand-in for the token endpoint: counts refreshes and can fail them
+    """
+
+    def __init__(self, latency: float = 0.3, fail: bool = False):
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def refresh(self, session):
+        with self._lock:
+            self.calls += 1
+            n = self.calls
+        time.sleep(self.latency)
+        if self.fail:
+            raise RuntimeError("invalid_grant")
+        return f"refreshed-{n}", time.time() + 3600
+
+def workers(tmp_path, google, count=2):
+    # One shared store, each worker with its own read-through cache, as with uvicorn --workers
+    backend = SQLiteSessionStore(db_path=str(tmp_path / "sessions.db"))
+    return backend, [TokenRefresher(CachedSessionStore(backend), refresh_fn=google.refresh) for _ in range(count)]
+
+def sign_in(store, expires_in):
+    return store.put("ada@example.com", access_token="old-token", refresh_token="refresh",
+                     user_info={"email": "ada@example.com"}, access_token_expires_at=time.time() + expires_in)
+
+def test_expired_token_is_refreshed_once_across_workers(tmp_path):
+    google = FakeGoogle()
+    backend, refreshers = workers(tmp_path, google, count=3)
+    session = sign_in(backend, expires_in=-1)
+
+    async def scenario():
+        return await asyncio.gather(*(refresher.ensure_fresh(dict(session)) for refresher in refreshers))
+
+    results = asyncio.run(scenario())
+
+    assert google.calls == 1
+    assert [result["access_token"] for result in results] == ["refreshed-1"] * 3
+
+def test_worker_keeps_a_valid_token_while_another_refreshes(tmp_path):
+    google = FakeGoogle()
+    backend, (first, second) = workers(tmp_path, google)
+    session = sign_in(backend, expires_in=60)
+
+    async def scenario():
+        refreshing = asyncio.create_task(first.ensure_fresh(dict(session)))
+        await asyncio.sleep(0.1)
+        started = time.monotonic()
+        kept = await second.ensure_fresh(dict(session))
+        waited = time.monotonic() - started
+        return await refreshing, kept, waited
+
+    refreshed, kept, waited = asyncio.run(scenario())
+
+    assert google.calls == 1
+    assert refreshed["access_token"] == "refreshed-1"
+    assert kept["access_token"] == "old-token"
+    assert waited < 0.1
+
+def test_failed_refresh_backs_off_on_the_request_path(tmp_path):
+    google = FakeGoogle(latency=0, fail=True)
+    backend, (first, second) = workers(tmp_path, google)
+    session = sign_in(backend, expires_in=60)
+
+    async def scenario():
+        results = []
+        for refresher in (first, first, second, first):
+            results.append(await refresher.ensure_fresh(dict(session)))
+        return results
+
+    results = asyncio.run(scenario())
+
+    # One call to Google; later requests on either worker keep the current token until the retry delay
+    assert google.calls == 1
+    assert all(result["access_token"] == "old-token" for result in results)
+    assert first.counters["backed_off"] == 2
+
+def test_refresh_claim_is_released_by_the_new_token(tmp_path):
+    backend = SQLiteSessionStore(db_path=str(tmp_path / "sessions.db"))
+    sign_in(backend, expires_in=60)
+
+    assert backend.claim_refresh("ada@example.com", "old-token", time.time() + 10)
+    assert not backend.claim_refresh("ada@example.com", "old-token", time.time() + 10)
+    assert backend.expiring(time.time() + 300) == []
+
+    backend.update_access_token("ada@example.com", "new-token", time.time() + 30)
+
+    # A stale token no longer claims, the current one does
+    assert not backend.claim_refresh("ada@example.com", "old-token", time.time() + 10)
+    assert backend.claim_refresh("ada@example.com", "new-token", time.time() + 10)
+
+def test_refresh_locks_are_dropped_once_idle(tmp_path):
+    google = FakeGoogle(latency=0.05)
+    backend, (refresher,) = workers(tmp_path, google, count=1)
+    session = sign_in(backend, expires_in=-1)
+
+    async def scenario():
+        return await asyncio.gather(*(refresher.ensure_fresh(dict(session)) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+
+    assert google.calls == 1
+    assert [result["access_token"] for result in results] == ["refreshed-1"] * 3
+    assert refresher._locks == {}
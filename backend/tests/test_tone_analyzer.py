@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from config import TONE_LOCAL_CONFIDENCE_THRESHOLD
+from loadtest.tone_calibration import HELD_OUT_SAMPLES, LABELLED_SAMPLES, WEAK_SIGNAL_SAMPLES
+from routes import reply as reply_routes
+from services.tone_analyzer import tone_analyzer
+
+@pytest.mark.parametrize("text, tone", [
+    ("URGENT: need this ASAP!!!", "urgent"),
+    ("Please respond immediately.", "urgent"),
+    ("Apologies for the late reply.", "apologetic"),
+    ("I'm so grateful for your help.", "grateful"),
+    ("hey, sure, no problem", "casual"),
+    ("Dear Sir or Madam, I am writing to request the documents.", "formal"),
+    ("Would you mind sending the file if possible?", "polite"),
+    ("Hope you had a lovely weekend! Happy to help.", "friendly"),
+    ("Following up on the proposal; the updated timeline is attached.", "professional"),
+])
+def test_pinned_labels_are_answered_locally(text, tone):
+    result = tone_analyzer.analyze(text)
+    assert result["primary_tone"] == tone
+    assert result["confidence"] >= TONE_LOCAL_CONFIDENCE_THRESHOLD
+
+def test_punctuation_and_capitals_do_not_outvote_keywords():
+    shouted = tone_analyzer.analyze("THANK YOU SO MUCH!!! I'M SO GRATEFUL!!!")
+    assert shouted["primary_tone"] == "grateful"
+
+def test_keywords_match_inflections():
+    assert tone_analyzer.analyze("We apologized for the mistakes.")["primary_tone"] == "apologetic"
+    assert tone_analyzer.analyze("This needs to be handled urgently.")["primary_tone"] == "urgent"
+
+@pytest.mark.parametrize("text", WEAK_SIGNAL_SAMPLES)
+def test_texts_without_a_clear_cue_go_to_the_llm(text):
+    assert tone_analyzer.analyze(text)["confidence"] < TONE_LOCAL_CONFIDENCE_THRESHOLD
+
+@pytest.mark.parametrize("samples", [LABELLED_SAMPLES, HELD_OUT_SAMPLES])
+def test_local_answers_on_calibration_samples(samples):
+    results = tone_analyzer.analyze_batch([text for text, _ in samples])
+    local = [(result, tone) for result, (_, tone) in zip(results, samples)
+             if result["confidence"] >= TONE_LOCAL_CONFIDENCE_THRESHOLD]
+    correct = sum(result["primary_tone"] == tone for result, tone in local)
+
+    assert len(local) / len(samples) >= 0.9
+    assert correct / len(local) >= 0.95
+
+def test_failed_escalation_falls_back_to_the_local_result(monkeypatch):
+    class UnavailableGPT:
+        client = object()
+
+        async def analyze_tone(self, text):
+            raise RuntimeError("circuit open")
+
+    monkeypatch.setattr(reply_routes, "GPTService", UnavailableGPT)
+    text = WEAK_SIGNAL_SAMPLES[0]
+
+    result = asyncio.run(reply_routes._analyze_tone(text))
+
+    assert result["analysis_source"] == "local"
+    assert result["detected_tone"] == tone_analyzer.analyze(text)["primary_tone"]
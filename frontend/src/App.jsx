@@ -9,6 +9,7 @@ import EmailView from './pages/EmailView';
 import AuthCallback from './pages/AuthCallback';
 import Layout from './components/Layout';
 import LoadingSpinner from './components/LoadingSpinner';
+import { authService } from './services/authService';
 
 function App() {
   const [user, setUser] = useState(null);
@@ -44,6 +45,10 @@ function App() {
             localStorage.removeItem('access_token');
             localStorage.removeItem('auth_token');
           }
+        } else if (storedToken) {
+          // Signed in without a session token; ask the backend who the Google token belongs to
+          const profile = await authService.getCurrentUser(storedToken);
+          setUser({ email: profile.email, name: profile.name, accessToken: storedToken });
         }
       } catch (error) {
         console.error('Auth initialization failed:', error);
@@ -2,6 +2,7 @@ import React, { useEffect } from 'react';
 import { useSearchParams, useNavigate } from 'react-router-dom';
 import LoadingSpinner from '../components/LoadingSpinner';
 import toast from 'react-hot-toast';
+import { authService } from '../services/authService';
 
 const AuthCallback = ({ onLogin }) => {
   const [searchParams] = useSearchParams();
@@ -50,6 +51,14 @@ const AuthCallback = ({ onLogin }) => {
             toast.error('Authentication failed');
             navigate('/');
           }
+        } else if (accessToken) {
+          // No session token when the backend has no JWT secret; the Google token still authenticates
+          localStorage.setItem('access_token', accessToken);
+          localStorage.removeItem('auth_token');
+          const profile = await authService.getCurrentUser(accessToken);
+          toast.success('Login successful!');
+          onLogin({ email: profile.email, name: profile.name, accessToken: accessToken }, accessToken);
+          navigate('/dashboard');
         } else {
           toast.error('Missing authentication tokens');
           navigate('/');